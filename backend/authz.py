@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+import time
+from initdb import supabase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared "does this row belong to this user" checks for chats, classes and resources.
+# Confirmed ownership is kept in a bounded in-process TTL cache keyed by (user, kind, id),
+# so most mutating requests skip the extra lookup query. Ownership of a row never changes,
+# so the only invalidation needed is on delete (forget_owned / forget_class). Negative
+# results are not cached. A user's rows can be prefetched in bulk at login.
+
+AUTHZ_CACHE_TTL = int(os.getenv("AUTHZ_CACHE_TTL", "300")) # seconds
+AUTHZ_CACHE_MAX_ENTRIES = int(os.getenv("AUTHZ_CACHE_MAX_ENTRIES", "10000"))
+
+# kind -> (table, columns kept with the cached entry)
+OWNED_KINDS = {
+    "chat": ("chats", "id"),
+    "class": ("classes", "id"),
+    "resource": ("resources", "id, class_id, type"),
+}
+
+_lock = threading.Lock()
+_cache = OrderedDict() # (user_id, kind, entity_id) -> (expires_at, row)
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="authz-prefetch")
+
+
+def _cache_get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires_at, row = entry
+        if expires_at <= time.time():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return row
+
+
+def _cache_put(user_id, kind, row):
+    with _lock:
+        key = (user_id, kind, str(row["id"]))
+        _cache[key] = (time.time() + AUTHZ_CACHE_TTL, row)
+        _cache.move_to_end(key)
+        while len(_cache) > AUTHZ_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def get_owned(kind, entity_id, user_id):
+    """Returns the row (OWNED_KINDS columns) if `user_id` owns the entity, else None.
+
+    Database errors propagate to the caller.
+    """
+    key = (user_id, kind, str(entity_id))
+    row = _cache_get(key)
+    if row is not None:
+        return row
+
+    table, columns = OWNED_KINDS[kind]
+    resp = supabase.table(table)\
+        .select(columns)\
+        .eq("id", entity_id)\
+        .eq("user_id", user_id)\
+        .maybe_single()\
+        .execute()
+    if not resp or not resp.data:
+        return None
+    _cache_put(user_id, kind, resp.data)
+    return resp.data
+
+
+def forget_owned(kind, entity_id):
+    """Drops cached ownership of a deleted entity, for every user."""
+    entity_id = str(entity_id)
+    with _lock:
+        for key in [k for k in _cache if k[1] == kind and k[2] == entity_id]:
+            del _cache[key]
+
+
+def forget_class(class_id):
+    """Drops a deleted class and the resources that were deleted with it (ON DELETE CASCADE)."""
+    class_id = str(class_id)
+    forget_owned("class", class_id)
+    with _lock:
+        for key in [k for k, (_, row) in _cache.items() if k[1] == "resource" and str(row.get("class_id")) == class_id]:
+            del _cache[key]
+
+
+def prefetch_ownership(user_id):
+    """Caches ownership of all of a user's chats, classes and resources in one query per table."""
+    try:
+        for kind, (table, columns) in OWNED_KINDS.items():
+            resp = supabase.table(table).select(columns).eq("user_id", user_id).execute()
+            for row in resp.data or []:
+                _cache_put(user_id, kind, row)
+    except Exception as e:
+        logger.warning(f"Failed to prefetch ownership for user {user_id}: {e}")
+
+
+def prefetch_ownership_async(user_id):
+    _prefetch_pool.submit(prefetch_ownership, user_id)
@@ -0,0 +1,665 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Canvas REST helpers shared by routes/canvas.py.
+#
+# GETs can go through a per-user response cache: entries are fresh for a TTL that depends on
+# what is fetched (course lists change a few times a term, assignments more often), after
+# which they are revalidated with If-None-Match so an unchanged page costs Canvas a 304
+# instead of a full response. If Canvas can't be reached, a stale entry is served. Keys
+# include a fingerprint of the access token, and /canvas/connect drops a user's entries.
+# The cache is bounded by entry count and by the total size of the cached bodies
+# (assignment pages carry full HTML descriptions); least recently used entries go first.
+#
+# Requests go through one pooled keep-alive session per Canvas host (at most
+# CANVAS_POOL_SIZE connections each), so pages and courses reuse TCP/TLS connections
+# instead of handshaking every time. CANVAS_HTTP2=true switches the sessions to httpx
+# with HTTP/2, multiplexing requests to a host over a single connection.
+#
+# Each access token has a scheduler that tracks Canvas' rate-limit bucket from the
+# X-Rate-Limit-Remaining and X-Request-Cost headers. Once the remaining quota drops below
+# CANVAS_RATE_LIMIT_COMFORT, fewer of the token's requests may be in flight at once (down to
+# one). A 403 throttle pauses all of the token's requests, and a 5xx or timeout delays the
+# retry of that one request. Both use jittered exponential backoff. The waits happen on the
+# scheduler's condition, so they end early when quota comes back and never outlast the
+# caller's deadline.
+
+CANVAS_REQUEST_TIMEOUT = 10
+CANVAS_COURSES_TTL = int(os.getenv("CANVAS_COURSES_TTL", "3600")) # seconds
+CANVAS_ASSIGNMENTS_TTL = int(os.getenv("CANVAS_ASSIGNMENTS_TTL", "300"))
+CANVAS_CACHE_MAX_ENTRIES = int(os.getenv("CANVAS_CACHE_MAX_ENTRIES", "2000"))
+CANVAS_CACHE_MAX_BYTES = int(os.getenv("CANVAS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))) # response bodies
+CANVAS_POOL_SIZE = int(os.getenv("CANVAS_POOL_SIZE", "10")) # connections per Canvas host
+CANVAS_HTTP2 = os.getenv("CANVAS_HTTP2", "false").lower() in ("1", "true", "yes")
+CANVAS_PER_PAGE = 100 # Canvas' maximum page size
+CANVAS_IDS_PER_REQUEST = 50 # assignment_ids[] per request, keeps query strings short
+CANVAS_RATE_LIMIT_COMFORT = float(os.getenv("CANVAS_RATE_LIMIT_COMFORT", "300")) # quota units (Canvas' bucket holds 700)
+CANVAS_MAX_RETRIES = int(os.getenv("CANVAS_MAX_RETRIES", "4"))
+CANVAS_BACKOFF_BASE = float(os.getenv("CANVAS_BACKOFF_BASE", "0.5")) # seconds, doubled per retry
+CANVAS_BACKOFF_MAX = float(os.getenv("CANVAS_BACKOFF_MAX", "8"))
+
+_lock = threading.Lock()
+_cache = OrderedDict() # key -> _Entry
+_cache_bytes = 0 # sum of _Entry.size over _cache
+_stats = {"fresh_hits": 0, "revalidated": 0, "stale_served": 0, "misses": 0}
+_sessions = {} # "scheme://host" -> requests.Session or httpx.Client
+_http2_requests = {} # "scheme://host" -> {"requests", "http2_responses"} for httpx sessions
+_schedulers = {} # token fingerprint -> _TokenScheduler
+_rate_stats = {"throttled": 0, "server_errors": 0, "timeouts": 0, "retries": 0}
+
+
+class CanvasError(Exception):
+    """A Canvas request failed for good (after retries, or past its deadline)."""
+
+    def __init__(self, message, status_code=502, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class _Entry:
+    def __init__(self, response, fresh_until):
+        self.response = response
+        self.etag = response.headers.get("ETag")
+        self.fresh_until = fresh_until
+        self.size = len(response.content)
+
+
+def _count(field, stats=_stats):
+    with _lock:
+        stats[field] += 1
+
+
+def canvas_cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_cache), "bytes": _cache_bytes}
+
+
+def _host(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _session(host):
+    """The shared keep-alive session for a Canvas host, created on first use."""
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            if CANVAS_HTTP2:
+                import httpx # optional, only needed for HTTP/2
+                session = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=CANVAS_POOL_SIZE, max_keepalive_connections=CANVAS_POOL_SIZE)
+                )
+                _http2_requests[host] = {"requests": 0, "http2_responses": 0}
+            else:
+                session = requests.Session()
+                # pool_block keeps connections to the host at CANVAS_POOL_SIZE; extra requests wait for one
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CANVAS_POOL_SIZE, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _send(url, headers, params, timeout, json_body=None):
+    host = _host(url)
+    session = _session(host)
+    if json_body is not None:
+        send = lambda: session.post(url, headers=headers, json=json_body, timeout=timeout)
+    else:
+        send = lambda: session.get(url, headers=headers, params=params, timeout=timeout)
+    if not CANVAS_HTTP2:
+        return send()
+
+    import httpx
+    try:
+        resp = send()
+    # Callers handle requests' exception types
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e))
+    except httpx.HTTPError as e:
+        raise requests.exceptions.ConnectionError(str(e))
+    with _lock:
+        counters = _http2_requests[host]
+        counters["requests"] += 1
+        counters["http2_responses"] += resp.http_version == "HTTP/2"
+    return resp
+
+
+class _TokenScheduler:
+    """Admission control for one access token's Canvas requests."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.remaining = None # last X-Rate-Limit-Remaining, None until Canvas reports one
+        self.cost = 1.0 # running average of X-Request-Cost
+        self.in_flight = 0
+        self.paused_until = 0.0 # time.monotonic(); set by a throttle
+
+    def limit(self):
+        """How many requests may be in flight given the remaining quota."""
+        if self.remaining is None or self.remaining >= CANVAS_RATE_LIMIT_COMFORT:
+            return CANVAS_POOL_SIZE
+        # Always let one through, so the quota keeps being observed as it refills
+        by_quota = int(CANVAS_POOL_SIZE * self.remaining / CANVAS_RATE_LIMIT_COMFORT)
+        by_cost = int(self.remaining / max(self.cost, 1.0))
+        return max(1, min(CANVAS_POOL_SIZE, by_quota, by_cost))
+
+    def acquire(self, deadline=None, not_before=0.0):
+        """Waits for a request slot (and until not_before). Raises CanvasError past the deadline."""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                resume_at = max(self.paused_until, not_before)
+                if resume_at <= now and self.in_flight < self.limit():
+                    self.in_flight += 1
+                    return
+                timeout = resume_at - now if resume_at > now else None
+                if deadline is not None:
+                    if deadline <= now:
+                        raise CanvasError("Deadline exceeded waiting for Canvas rate limit", 504)
+                    timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+                self.cond.wait(timeout)
+
+    def release(self, resp=None):
+        with self.cond:
+            self.in_flight -= 1
+            if resp is not None:
+                try:
+                    remaining = resp.headers.get("X-Rate-Limit-Remaining")
+                    if remaining is not None:
+                        self.remaining = float(remaining)
+                    cost = resp.headers.get("X-Request-Cost")
+                    if cost is not None:
+                        self.cost = 0.8 * self.cost + 0.2 * float(cost)
+                except ValueError:
+                    pass
+                # Too little quota for another request: give the bucket a moment to refill
+                if self.remaining is not None and self.remaining < self.cost:
+                    self.paused_until = max(self.paused_until, time.monotonic() + _backoff(0))
+            self.cond.notify_all()
+
+    def pause(self, delay):
+        """Holds back every request of the token for `delay` seconds."""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.cond.notify_all()
+
+
+def _scheduler(headers):
+    token = _token(headers)
+    with _lock:
+        scheduler = _schedulers.get(token)
+        if scheduler is None:
+            scheduler = _schedulers[token] = _TokenScheduler()
+        return scheduler
+
+
+def _throttled(resp):
+    # Canvas answers 403 "Rate Limit Exceeded" when a token's bucket is empty
+    return resp.status_code == 403 and (
+        "rate limit" in resp.text.lower() or resp.headers.get("X-Rate-Limit-Remaining") in ("0", "0.0")
+    )
+
+
+def _backoff(attempt):
+    # Full jitter, so throttled workers don't all retry at the same moment
+    return random.uniform(0, min(CANVAS_BACKOFF_MAX, CANVAS_BACKOFF_BASE * 2 ** attempt))
+
+
+def _request(url, headers, params, timeout, deadline=None, json_body=None):
+    """_send under the token's scheduler, retrying throttles, 5xx responses and timeouts with
+    backoff. Returns the last response once retries (or the deadline) run out; raises
+    requests' Timeout if that was the last failure, CanvasError past the deadline.
+    """
+    scheduler = _scheduler(headers)
+    not_before = 0.0
+    attempt = 0
+    while True:
+        scheduler.acquire(deadline, not_before)
+        resp = None
+        try:
+            request_timeout = timeout
+            if deadline is not None:
+                request_timeout = min(timeout, deadline - time.monotonic())
+                if request_timeout <= 0:
+                    raise CanvasError("Deadline exceeded fetching from Canvas", 504)
+            resp = _send(url, headers, params, request_timeout, json_body)
+        except requests.exceptions.Timeout:
+            _count("timeouts", _rate_stats)
+            if attempt >= CANVAS_MAX_RETRIES:
+                raise
+        finally:
+            scheduler.release(resp)
+
+        if resp is not None:
+            if _throttled(resp):
+                _count("throttled", _rate_stats)
+            elif resp.status_code >= 500:
+                _count("server_errors", _rate_stats)
+            else:
+                return resp
+            if attempt >= CANVAS_MAX_RETRIES:
+                return resp
+
+        delay = _backoff(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            if resp is None:
+                raise requests.exceptions.Timeout(f"Canvas request to {url} timed out")
+            return resp
+        attempt += 1
+        _count("retries", _rate_stats)
+        if resp is not None and _throttled(resp):
+            logger.info(f"Canvas throttled a request, pausing the token for {delay:.2f}s (attempt {attempt}/{CANVAS_MAX_RETRIES})")
+            scheduler.pause(delay)
+        else:
+            not_before = time.monotonic() + delay
+
+
+def canvas_rate_limit_stats():
+    """Throttles, 5xx responses, timeouts and retries, plus the quota each token has left."""
+    with _lock:
+        stats = dict(_rate_stats)
+        schedulers = list(_schedulers.values())
+    remaining = [s.remaining for s in schedulers if s.remaining is not None]
+    return {
+        **stats,
+        "tokens": len(schedulers),
+        "min_remaining": min(remaining) if remaining else None,
+        "in_flight": sum(s.in_flight for s in schedulers)
+    }
+
+
+def canvas_connection_stats():
+    """Per Canvas host: requests sent and connections opened (the rest reused a pooled connection)."""
+    with _lock:
+        sessions = dict(_sessions)
+        http2 = {host: dict(counters) for host, counters in _http2_requests.items()}
+    stats = {}
+    for host, session in sessions.items():
+        if host in http2:
+            stats[host] = {"http2": True, **http2[host]}
+            continue
+        requests_sent = connections = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections += pool.num_connections
+        stats[host] = {
+            "http2": False,
+            "requests": requests_sent,
+            "connections": connections,
+            "reuse_ratio": round(1 - connections / requests_sent, 3) if requests_sent else None
+        }
+    return stats
+
+
+def _token(headers):
+    return hashlib.sha256(headers.get("Authorization", "").encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_key(user_key, url, headers, params):
+    return (user_key, _token(headers), url, json.dumps(params, sort_keys=True) if params else "")
+
+
+def _cache_put(key, entry):
+    """Stores an entry and evicts least recently used ones past the count and byte limits. Needs _lock."""
+    global _cache_bytes
+    old = _cache.pop(key, None)
+    if old is not None:
+        _cache_bytes -= old.size
+    if entry.size > CANVAS_CACHE_MAX_BYTES:
+        return
+    _cache[key] = entry
+    _cache_bytes += entry.size
+    while len(_cache) > CANVAS_CACHE_MAX_ENTRIES or _cache_bytes > CANVAS_CACHE_MAX_BYTES:
+        _cache_bytes -= _cache.popitem(last=False)[1].size
+
+
+def invalidate_canvas_cache(user_key):
+    """Drops every cached Canvas response for a user (e.g. after their credentials change)."""
+    global _cache_bytes
+    with _lock:
+        for key in [k for k in _cache if k[0] == user_key]:
+            _cache_bytes -= _cache.pop(key).size
+
+
+def canvas_get(url, headers, params=None, timeout=CANVAS_REQUEST_TIMEOUT, cache_user=None, ttl=None, deadline=None):
+    """GET against Canvas over the host's pooled session, paced and retried by the token's
+    scheduler until `deadline` (time.monotonic() value). With cache_user and ttl set, 200
+    responses are cached for that user.
+
+    Returns a requests.Response (httpx.Response with CANVAS_HTTP2); a cached one is returned
+    as-is, so callers must not mutate it.
+    """
+    if cache_user is None or ttl is None:
+        return _request(url, headers, params, timeout, deadline)
+
+    key = _cache_key(cache_user, url, headers, params)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    now = time.monotonic()
+    if entry is not None and entry.fresh_until > now:
+        _count("fresh_hits")
+        return entry.response
+
+    request_headers = dict(headers)
+    if entry is not None and entry.etag:
+        request_headers["If-None-Match"] = entry.etag
+    try:
+        resp = _request(url, request_headers, params, timeout, deadline)
+    except requests.exceptions.RequestException as e:
+        if entry is None:
+            raise
+        logger.warning(f"Canvas unreachable ({e}), serving cached response for {url}")
+        _count("stale_served")
+        return entry.response
+
+    if resp.status_code == 304 and entry is not None:
+        entry.fresh_until = now + ttl
+        _count("revalidated")
+        return entry.response
+
+    _count("misses")
+    if resp.status_code == 200:
+        with _lock:
+            _cache_put(key, _Entry(resp, now + ttl))
+    return resp
+
+
+def fetch_courses(domain, headers, cache_user=None):
+    """Fetches every page of the user's active courses. Raises CanvasError."""
+    url = f"{domain}/api/v1/courses"
+    params = {"enrollment_state": "active", "per_page": CANVAS_PER_PAGE}   # only current courses
+    courses = []
+    try:
+        while url:
+            resp = canvas_get(url, headers, params=params, cache_user=cache_user, ttl=CANVAS_COURSES_TTL)
+            if resp.status_code != 200:
+                logger.warning(f"Canvas API error fetching courses {resp.status_code}: {resp.text[:200]}")
+                raise CanvasError("Canvas API error fetching courses", resp.status_code, resp.text)
+            courses.extend(resp.json())
+            # Canvas paginates with RFC-5988 Link headers
+            url = resp.links.get('next', {}).get('url')
+            params = None        # only on first iteration
+    except requests.exceptions.RequestException as e:
+        logger.exception("Network error reaching Canvas for courses")
+        raise CanvasError("Could not reach Canvas for courses", 502, str(e))
+    return courses
+
+
+def fetch_course_assignments(domain, headers, course_id, deadline=None, cache_user=None, bucket="upcoming"):
+    """Fetches every page of a course's assignments (upcoming ones by default, bucket=None for all).
+
+    `deadline` (time.monotonic() value) bounds the whole fetch, retries included. Raises CanvasError.
+    """
+    url = f"{domain}/api/v1/courses/{course_id}/assignments"
+    params = {"order_by": "due_at", "per_page": CANVAS_PER_PAGE}
+    if bucket:
+        params["bucket"] = bucket
+    assignments = []
+
+    while url:
+        try:
+            resp = canvas_get(url, headers, params=params, cache_user=cache_user, ttl=CANVAS_ASSIGNMENTS_TTL, deadline=deadline)
+        except requests.exceptions.Timeout:
+            raise CanvasError(f"Canvas API request timed out for course {course_id}", 504)
+        except requests.exceptions.RequestException as e:
+            raise CanvasError(f"Could not reach Canvas for course {course_id}", 502, str(e))
+
+        if resp.status_code != 200:
+            logger.warning(f"Canvas API error for course {course_id}: {resp.status_code}: {resp.text[:200]}")
+            raise CanvasError("Canvas API error", resp.status_code, resp.text)
+        assignments.extend(resp.json())
+        url = resp.links.get('next', {}).get('url')
+        params = None  # Only on first iteration
+
+    return assignments
+
+
+def fetch_assignment(domain, headers, course_id, assignment_id, cache_user=None):
+    """Fetches one assignment of a course, full description included. Raises CanvasError."""
+    url = f"{domain}/api/v1/courses/{course_id}/assignments/{assignment_id}"
+    try:
+        resp = canvas_get(url, headers, cache_user=cache_user, ttl=CANVAS_ASSIGNMENTS_TTL)
+    except requests.exceptions.RequestException as e:
+        logger.exception("Network error reaching Canvas")
+        raise CanvasError("Could not reach Canvas", 502, str(e))
+    if resp.status_code != 200:
+        logger.warning(f"Canvas API error {resp.status_code}: {resp.text[:200]}")
+        raise CanvasError("Canvas API error", resp.status_code, resp.text)
+    return resp.json()
+
+
+def fetch_assignments_by_id(domain, headers, course_id, assignment_ids):
+    """Fetches specific assignments of a course, CANVAS_IDS_PER_REQUEST ids per request and
+    following every page of each. Raises CanvasError.
+    """
+    assignments = []
+    for start in range(0, len(assignment_ids), CANVAS_IDS_PER_REQUEST):
+        url = f"{domain}/api/v1/courses/{course_id}/assignments"
+        params = {"assignment_ids[]": assignment_ids[start:start + CANVAS_IDS_PER_REQUEST], "per_page": CANVAS_PER_PAGE}
+        try:
+            while url:
+                resp = canvas_get(url, headers, params=params)
+                if resp.status_code != 200:
+                    logger.warning(f"Canvas API error {resp.status_code}: {resp.text[:200]}")
+                    raise CanvasError("Canvas API error", resp.status_code, resp.text)
+                assignments.extend(resp.json())
+                url = resp.links.get('next', {}).get('url')
+                params = None  # the next link carries the query
+        except requests.exceptions.RequestException as e:
+            logger.exception("Network error reaching Canvas")
+            raise CanvasError("Could not reach Canvas", 502, str(e))
+    return assignments
+
+
+# GraphQL bulk fetch: one query returns every course with its assignments (only the fields
+# we use), instead of 1 + courses x pages REST calls. Callers fall back to REST on CanvasError;
+# a domain where GraphQL is missing or rejects the query is left on REST for
+# CANVAS_GRAPHQL_RETRY_AFTER seconds. Off unless CANVAS_GRAPHQL=true; compare it against
+# REST on your instance first (scripts/check_canvas_graphql.py does so against a stand-in).
+
+CANVAS_GRAPHQL = os.getenv("CANVAS_GRAPHQL", "false").lower() in ("1", "true", "yes")
+CANVAS_GRAPHQL_RETRY_AFTER = int(os.getenv("CANVAS_GRAPHQL_RETRY_AFTER", "3600")) # seconds
+
+_graphql_down = {} # domain -> time.monotonic() until which REST is used
+
+# REST's bucket=upcoming: due (after the user's overrides, which GraphQL's dueAt applies too) within a week
+UPCOMING_WINDOW = timedelta(days=7)
+
+_ASSIGNMENT_FIELDS = """
+fragment AssignmentFields on Assignment {
+  _id
+  name
+  description
+  dueAt
+  htmlUrl
+  pointsPossible
+  submissionTypes
+  updatedAt
+}
+"""
+
+COURSES_QUERY = """
+query Courses {
+  allCourses {
+    _id
+    name
+    courseCode
+    state
+  }
+}
+"""
+
+COURSE_ASSIGNMENTS_QUERY = """
+query CourseAssignments($first: Int!) {
+  allCourses {
+    _id
+    name
+    courseCode
+    state
+    assignmentsConnection(first: $first) {
+      nodes { ...AssignmentFields }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+""" + _ASSIGNMENT_FIELDS
+
+MORE_ASSIGNMENTS_QUERY = """
+query MoreAssignments($courseId: ID!, $first: Int!, $after: String) {
+  course(id: $courseId) {
+    assignmentsConnection(first: $first, after: $after) {
+      nodes { ...AssignmentFields }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+""" + _ASSIGNMENT_FIELDS
+
+
+def graphql_available(domain):
+    """False while `domain` is on REST after a GraphQL failure (or if CANVAS_GRAPHQL is off)."""
+    if not CANVAS_GRAPHQL:
+        return False
+    with _lock:
+        return _graphql_down.get(domain, 0) <= time.monotonic()
+
+
+def _graphql_failed(domain, reason):
+    logger.warning(f"Canvas GraphQL unusable on {domain} ({reason}), using REST for {CANVAS_GRAPHQL_RETRY_AFTER}s")
+    with _lock:
+        _graphql_down[domain] = time.monotonic() + CANVAS_GRAPHQL_RETRY_AFTER
+
+
+def canvas_graphql(domain, headers, query, variables=None, cache_user=None, ttl=None, deadline=None):
+    """Runs a query against the domain's /api/graphql and returns its `data`. With cache_user
+    and ttl set, results are cached for that user (without revalidation). Raises CanvasError.
+    """
+    url = f"{domain}/api/graphql"
+    body = {"query": query, "variables": variables or {}}
+    key = _cache_key(cache_user, url, headers, body) if cache_user is not None and ttl is not None else None
+    if key is not None:
+        with _lock:
+            entry = _cache.get(key)
+            if entry is not None:
+                _cache.move_to_end(key)
+        if entry is not None and entry.fresh_until > time.monotonic():
+            _count("fresh_hits")
+            return entry.response.json()["data"]
+
+    try:
+        resp = _request(url, headers, None, CANVAS_REQUEST_TIMEOUT, deadline, json_body=body)
+    except requests.exceptions.RequestException as e:
+        raise CanvasError("Could not reach Canvas GraphQL", 502, str(e))
+    if resp.status_code != 200:
+        # Transient failures were already retried by _request; anything else means GraphQL won't work here
+        if resp.status_code < 500 and not _throttled(resp):
+            _graphql_failed(domain, f"HTTP {resp.status_code}")
+        raise CanvasError("Canvas GraphQL error", resp.status_code, resp.text[:500])
+    try:
+        payload = resp.json()
+    except ValueError:
+        _graphql_failed(domain, "non-JSON response")
+        raise CanvasError("Canvas GraphQL returned invalid JSON", 502)
+    if payload.get("errors") or payload.get("data") is None:
+        _graphql_failed(domain, payload.get("errors"))
+        raise CanvasError("Canvas GraphQL query failed", 502, payload.get("errors"))
+
+    if key is not None:
+        _count("misses")
+        with _lock:
+            _cache_put(key, _Entry(resp, time.monotonic() + ttl))
+    return payload["data"]
+
+
+def _utc(timestamp):
+    # GraphQL returns local offsets, REST returns UTC ("...Z"); keep the REST form so dates sort alike
+    if not timestamp:
+        return None
+    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _rest_course(node):
+    return {
+        "id": int(node["_id"]),
+        "name": node.get("name"),
+        "course_code": node.get("courseCode"),
+        "workflow_state": node.get("state"),
+    }
+
+
+def _rest_assignment(node):
+    return {
+        "id": int(node["_id"]),
+        "name": node.get("name"),
+        "description": node.get("description"),
+        "due_at": _utc(node.get("dueAt")),
+        "html_url": node.get("htmlUrl"),
+        "points_possible": node.get("pointsPossible"),
+        "submission_types": [t.lower() for t in node.get("submissionTypes") or []],
+        "updated_at": _utc(node.get("updatedAt")),
+    }
+
+
+def fetch_courses_graphql(domain, headers, cache_user=None):
+    """fetch_courses over GraphQL: the user's available courses as REST-shaped dicts
+    (id, name, course_code, workflow_state). Raises CanvasError.
+    """
+    data = canvas_graphql(domain, headers, COURSES_QUERY, cache_user=cache_user, ttl=CANVAS_COURSES_TTL)
+    return [_rest_course(node) for node in data.get("allCourses") or [] if node.get("state") == "available"]
+
+
+def fetch_upcoming_assignments_graphql(domain, headers, cache_user=None, deadline=None):
+    """Every available course with its upcoming assignments (the same set as REST's
+    bucket=upcoming, REST-shaped like fetch_course_assignments), as a list of (course,
+    assignments). Raises CanvasError.
+    """
+    data = canvas_graphql(domain, headers, COURSE_ASSIGNMENTS_QUERY, {"first": CANVAS_PER_PAGE},
+                          cache_user=cache_user, ttl=CANVAS_ASSIGNMENTS_TTL, deadline=deadline)
+    now = datetime.now(timezone.utc)
+    window_start, window_end = _utc(now.isoformat()), _utc((now + UPCOMING_WINDOW).isoformat())
+    results = []
+    for node in data.get("allCourses") or []:
+        if node.get("state") != "available":
+            continue
+        connection = node.get("assignmentsConnection") or {}
+        nodes = list(connection.get("nodes") or [])
+        page = connection.get("pageInfo") or {}
+        # Courses with more than a page of assignments are continued one course at a time
+        while page.get("hasNextPage"):
+            more = canvas_graphql(domain, headers, MORE_ASSIGNMENTS_QUERY,
+                                  {"courseId": node["_id"], "first": CANVAS_PER_PAGE, "after": page.get("endCursor")},
+                                  cache_user=cache_user, ttl=CANVAS_ASSIGNMENTS_TTL, deadline=deadline)
+            connection = ((more.get("course") or {}).get("assignmentsConnection")) or {}
+            nodes.extend(connection.get("nodes") or [])
+            page = connection.get("pageInfo") or {}
+        assignments = [_rest_assignment(n) for n in nodes]
+        upcoming = sorted(
+            (a for a in assignments if a["due_at"] and window_start <= a["due_at"] <= window_end),
+            key=lambda a: a["due_at"]
+        )
+        results.append((_rest_course(node), upcoming))
+    return results
@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+from initdb import supabase
+from canvas_client import fetch_course_assignments
+from job_queue import register_job_handler
+from user_rows import load_user
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Background sync of Canvas assignments into the tasks table.
+# Every CANVAS_SYNC_INTERVAL seconds each user with Canvas credentials is synced: for every
+# class linked to a Canvas course, the course's assignments are fetched (through the
+# canvas_client cache, so an unchanged course usually costs a 304) and compared with the
+# course's high-water mark in canvas_sync_state, the newest Canvas updated_at seen so far.
+# If nothing is newer and the assignment count is unchanged the course is skipped without
+# touching tasks; otherwise only new, changed (by updated_at) and deleted assignments are
+# written. Task fields the user owns (status, personal_deadline) are never overwritten.
+
+CANVAS_SYNC_ENABLED = os.getenv("CANVAS_SYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+CANVAS_SYNC_INTERVAL = int(os.getenv("CANVAS_SYNC_INTERVAL", str(15 * 60))) # seconds
+CANVAS_SYNC_WORKERS = int(os.getenv("CANVAS_SYNC_WORKERS", "4"))
+
+_pool = ThreadPoolExecutor(max_workers=CANVAS_SYNC_WORKERS, thread_name_prefix="canvas-sync")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _ts(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+def task_from_assignment(class_id, user_id, assignment):
+    """The tasks row for a Canvas assignment (without status, which belongs to the user)."""
+    return {
+        'class_id': class_id,
+        'user_id': user_id,
+        'title': assignment.get('name'),
+        'description': assignment.get('description'),
+        'type': 'assignment',
+        'due_date': assignment.get('due_at'),
+        'from_canvas': True,
+        'canvas_assignment_id': assignment.get('id'),
+        'canvas_html_url': assignment.get('html_url'),
+        'submission_types': json.dumps(assignment.get('submission_types', [])),
+        'points_possible': assignment.get('points_possible'),
+        'canvas_updated_at': assignment.get('updated_at'),
+    }
+
+
+def sync_course(user_id, domain, headers, class_id, canvas_course_id, state=None):
+    """Brings the user's tasks for one Canvas-linked class up to date. Returns counts of changes."""
+    state = state or {}
+    assignments = fetch_course_assignments(domain, headers, canvas_course_id, cache_user=user_id, bucket=None)
+    newest = max((_ts(a.get('updated_at')) for a in assignments if a.get('updated_at')), default=None)
+    high_water_mark = _ts(state.get('high_water_mark'))
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+
+    unchanged = (
+        high_water_mark is not None
+        and (newest is None or newest <= high_water_mark)
+        and state.get('assignment_count') == len(assignments)
+    )
+    if not unchanged:
+        existing = supabase.table('tasks')\
+            .select('id, canvas_assignment_id, canvas_updated_at')\
+            .eq('user_id', user_id)\
+            .eq('class_id', class_id)\
+            .eq('from_canvas', True)\
+            .execute().data or []
+        existing_by_canvas_id = {row['canvas_assignment_id']: row for row in existing}
+        canvas_ids = {a.get('id') for a in assignments}
+
+        new_rows, changed_rows = [], []
+        for assignment in assignments:
+            row = existing_by_canvas_id.get(assignment.get('id'))
+            if row is None:
+                new_rows.append({**task_from_assignment(class_id, user_id, assignment), 'status': 'pending'})
+                continue
+            updated_at = _ts(assignment.get('updated_at'))
+            known_at = _ts(row.get('canvas_updated_at'))
+            if updated_at is None or known_at is None or updated_at > known_at:
+                # Upsert on the primary key only touches the Canvas-derived columns
+                changed_rows.append({'id': row['id'], **task_from_assignment(class_id, user_id, assignment)})
+        removed_ids = [row['id'] for cid, row in existing_by_canvas_id.items() if cid not in canvas_ids]
+
+        if new_rows:
+            # The unique key makes a concurrent import of the same assignment a no-op instead of a duplicate
+            supabase.table('tasks')\
+                .upsert(new_rows, on_conflict='user_id,class_id,canvas_assignment_id', ignore_duplicates=True)\
+                .execute()
+        if changed_rows:
+            supabase.table('tasks').upsert(changed_rows, on_conflict='id').execute()
+        if removed_ids:
+            supabase.table('tasks').delete().in_('id', removed_ids).execute()
+        counts = {"inserted": len(new_rows), "updated": len(changed_rows), "deleted": len(removed_ids)}
+
+    supabase.table('canvas_sync_state').upsert({
+        'user_id': user_id,
+        'class_id': class_id,
+        'canvas_course_id': canvas_course_id,
+        'high_water_mark': (newest or high_water_mark).isoformat() if (newest or high_water_mark) else None,
+        'assignment_count': len(assignments),
+        'last_synced_at': _now(),
+        'last_error': None
+    }, on_conflict='user_id,class_id').execute()
+    return counts
+
+
+def sync_user(user_id, domain=None, token=None):
+    """Syncs every Canvas-linked class of a user. Errors are recorded per course and don't stop the others."""
+    if domain is None or token is None:
+        user = load_user(user_id)
+        if not user:
+            return {}
+        domain, token = user.get('canvas_domain'), user.get('canvas_access_token')
+    if not domain or not token:
+        return {}
+
+    headers = {"Authorization": f"Bearer {token}"}
+    classes = supabase.table('classes')\
+        .select('id, canvas_course_id')\
+        .eq('user_id', user_id)\
+        .not_.is_('canvas_course_id', 'null')\
+        .execute().data or []
+    states = {
+        row['class_id']: row for row in supabase.table('canvas_sync_state')
+        .select('class_id, high_water_mark, assignment_count')
+        .eq('user_id', user_id)
+        .execute().data or []
+    }
+
+    results = {}
+    for cls in classes:
+        try:
+            results[cls['id']] = sync_course(user_id, domain, headers, cls['id'], cls['canvas_course_id'], states.get(cls['id']))
+        except Exception as e:
+            # CanvasError or a database error; the next run retries from the same high-water mark
+            logger.warning(f"Canvas sync failed for user {user_id}, course {cls['canvas_course_id']}: {e}")
+            results[cls['id']] = {"error": str(e)}
+            try:
+                supabase.table('canvas_sync_state').upsert({
+                    'user_id': user_id,
+                    'class_id': cls['id'],
+                    'canvas_course_id': cls['canvas_course_id'],
+                    'last_error': str(e)[:500]
+                }, on_conflict='user_id,class_id').execute()
+            except Exception:
+                pass
+    return results
+
+
+def sync_all_users():
+    """One sync pass over every user with Canvas credentials."""
+    try:
+        users = supabase.table('users')\
+            .select('google_id, canvas_domain, canvas_access_token')\
+            .not_.is_('canvas_access_token', 'null')\
+            .not_.is_('canvas_domain', 'null')\
+            .execute().data or []
+    except Exception as e:
+        logger.error(f"Canvas sync could not list users: {e}")
+        return
+    futures = [
+        _pool.submit(sync_user, u['google_id'], u['canvas_domain'], u['canvas_access_token'])
+        for u in users
+    ]
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Canvas sync failed for a user: {e}")
+    logger.info(f"Canvas sync pass finished for {len(users)} users")
+
+
+def start_canvas_sync():
+    """Runs sync_all_users every CANVAS_SYNC_INTERVAL seconds on a daemon thread (if CANVAS_SYNC_ENABLED)."""
+    if not CANVAS_SYNC_ENABLED:
+        return
+    def loop():
+        stop = threading.Event()
+        sync_all_users()
+        while not stop.wait(CANVAS_SYNC_INTERVAL):
+            sync_all_users()
+    threading.Thread(target=loop, name="canvas-sync", daemon=True).start()
+
+
+# On-demand sync of one user (POST /canvas/sync), tracked like other background jobs
+def _sync_job(payload, report_progress):
+    return sync_user(payload["google_id"])
+
+
+register_job_handler('canvas_sync', _sync_job)
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import os
+from initdb import supabase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Conversation memory for Genie chats.
+# The prompt gets the last MEMORY_KEEP_TURNS turns verbatim (trimmed to MEMORY_TOKEN_BUDGET)
+# plus a rolling summary of everything older, stored on the chats row. Once more than
+# MEMORY_FOLD_BATCH messages beyond that window are unsummarized, they are folded into the
+# summary in one call (until then they are still sent verbatim), so prompt size stays bounded
+# however long the chat runs without a summary call on every turn.
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("GENIE_MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_KEEP_TURNS = int(os.getenv("GENIE_MEMORY_KEEP_TURNS", "6"))
+MEMORY_FOLD_BATCH = int(os.getenv("GENIE_MEMORY_FOLD_BATCH", "8")) # messages
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_MODEL = "gpt-3.5-turbo"
+
+# Separate pools, so the request-path reads never queue behind slow summary completions
+_read_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="genie-memory")
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="genie-summary")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception: # tiktoken is optional; fall back to the ~4 chars/token rule of thumb
+    _encoding = None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message):
+    return count_tokens(message["content"]) + 4 # role/formatting overhead per message
+
+
+def _ts(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _load_chat_summary(chat_id):
+    resp = supabase.table("chats").select("summary, summary_through").eq("id", chat_id).maybe_single().execute()
+    return resp.data if resp and resp.data else {}
+
+
+def _load_recent_messages(chat_id, before):
+    """Newest-first messages of the chat created before `before` (the current turn)."""
+    resp = supabase.table("chat_messages")\
+        .select("sender, message_text, created_at")\
+        .eq("chat_id", chat_id)\
+        .lt("created_at", before)\
+        .order("created_at", desc=True)\
+        .limit(MEMORY_KEEP_TURNS * 2 + MEMORY_FOLD_BATCH)\
+        .execute()
+    return resp.data or []
+
+
+def build_context(chat_id, system_prompt, user_message_text, before):
+    """Builds the OpenAI messages for a turn: system prompt, rolling summary, recent turns, new message.
+
+    `before` is the ISO timestamp the turn started at; messages from the turn itself are excluded.
+    """
+    chat_future = _read_pool.submit(_load_chat_summary, chat_id)
+    recent_future = _read_pool.submit(_load_recent_messages, chat_id, before)
+    chat = chat_future.result()
+    recent = recent_future.result()
+
+    summary = chat.get("summary")
+    summary_through = chat.get("summary_through")
+
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    tail = [{"role": "user", "content": user_message_text}]
+
+    budget = MEMORY_TOKEN_BUDGET - sum(_message_tokens(m) for m in head + tail)
+    history = []
+    for row in recent: # newest first, so the oldest turns are the ones dropped
+        if summary_through and _ts(row["created_at"]) <= _ts(summary_through):
+            break
+        if not row.get("message_text"):
+            continue
+        message = {"role": "assistant" if row["sender"] == "ai" else "user", "content": row["message_text"]}
+        budget -= _message_tokens(message)
+        if budget < 0:
+            break
+        history.append(message)
+
+    return head + list(reversed(history)) + tail
+
+
+def refresh_summary_async(client, chat_id):
+    """Folds messages that left the verbatim window into the chat's summary, off the request thread."""
+    _refresh_pool.submit(_refresh_summary, client, chat_id)
+
+
+def _refresh_summary(client, chat_id):
+    try:
+        chat = _load_chat_summary(chat_id)
+        summary = chat.get("summary")
+        summary_through = chat.get("summary_through")
+
+        query = supabase.table("chat_messages")\
+            .select("sender, message_text, created_at")\
+            .eq("chat_id", chat_id)
+        if summary_through:
+            query = query.gt("created_at", summary_through)
+        unsummarized = query.order("created_at", desc=False).limit(100).execute().data or []
+
+        keep = MEMORY_KEEP_TURNS * 2
+        if len(unsummarized) <= keep + MEMORY_FOLD_BATCH:
+            return
+        to_fold = unsummarized[:-keep]
+
+        transcript = "\n".join(
+            f"{'Assistant' if row['sender'] == 'ai' else 'Student'}: {row.get('message_text') or ''}"
+            for row in to_fold
+        )
+        completion = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain a running summary of a tutoring conversation between a student and an assistant. "
+                    "Update the summary with the new messages. Keep the topics covered, the student's goals and "
+                    "anything the assistant should remember. Reply with the updated summary only, in under 200 words."
+                )},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS
+        )
+        new_summary = completion.choices[0].message.content
+
+        update = supabase.table("chats")\
+            .update({"summary": new_summary, "summary_through": to_fold[-1]["created_at"]})\
+            .eq("id", chat_id)
+        # Only apply if no concurrent refresh moved the summary on in the meantime
+        update = update.eq("summary_through", summary_through) if summary_through else update.is_("summary_through", "null")
+        update.execute()
+        logger.info(f"Folded {len(to_fold)} messages into the summary of chat {chat_id}")
+    except Exception as e:
+        logger.error(f"Error refreshing summary for chat {chat_id}: {e}")
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from html.parser import HTMLParser
+import hashlib
+import os
+import re
+import threading
+
+# Plain text from Canvas HTML (assignment descriptions), for list excerpts and the
+# assignment detail endpoint. Conversions are cached by a hash of the HTML, so a
+# description is only parsed again when it changes.
+
+HTML_TEXT_CACHE_MAX_ENTRIES = int(os.getenv("HTML_TEXT_CACHE_MAX_ENTRIES", "5000"))
+EXCERPT_LENGTH = 200 # characters
+
+_BLOCK_TAGS = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "hr"}
+_CELL_TAGS = {"td", "th"}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+_lock = threading.Lock()
+_cache = OrderedDict() # sha256 of html -> text
+
+
+class _TextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag in _CELL_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def _convert(html):
+    parser = _TextParser()
+    parser.feed(html)
+    parser.close()
+    lines = (re.sub(r"[ \t\r\f\v\xa0]+", " ", line).strip() for line in "".join(parser.parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def html_to_text(html):
+    """Plain text of an HTML fragment, one line per block element."""
+    if not html:
+        return ""
+    key = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    with _lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+            return text
+    text = _convert(html)
+    with _lock:
+        _cache[key] = text
+        while len(_cache) > HTML_TEXT_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return text
+
+
+def excerpt(html, length=EXCERPT_LENGTH):
+    """The first `length` characters of html_to_text on a single line, with an ellipsis if cut."""
+    text = " ".join(html_to_text(html).split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0] + "…"
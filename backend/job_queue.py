@@ -0,0 +1,225 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from uuid import uuid4
+import logging
+import os
+import threading
+from initdb import supabase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Background job queue for slow generation work (videos, mindmaps).
+# Jobs are persisted in the `jobs` table so any worker/request can poll them by id;
+# the actual work runs on a small thread pool outside the request/response cycle.
+# Jobs lost to a restart or crash stay queued/running in the table; reap_stale_jobs (run at
+# startup) fails those not updated for JOB_STALE_AFTER seconds and fills their chat messages.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Longer than any job goes without a progress report, so jobs alive in another worker process survive
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", str(2 * 60 * 60))) # seconds
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job-worker")
+_handlers = {}
+
+# In-process bookkeeping, guarded by _lock:
+#   _futures:   job_id -> Future, for cancelling jobs that haven't finished
+#   _cancelled: job ids whose running handler should stop at its next progress report
+#   _messages:  job_id -> chat_message_id the job fills when it finishes
+#   _awaiting:  jobs queued with await_message=True that have no message yet
+#   _outcomes:  job_id -> content of awaiting jobs that finished before their message was attached
+_lock = threading.Lock()
+_futures = {}
+_cancelled = set()
+_messages = {}
+_awaiting = set()
+_outcomes = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler (via report_progress) when its job has been cancelled."""
+
+
+def register_job_handler(job_type, handler):
+    """Registers `handler(payload, report_progress)` for a job type. Its return value becomes the job result."""
+    _handlers[job_type] = handler
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _update_job(job_id, fields, if_status=None):
+    fields["updated_at"] = _now()
+    try:
+        query = supabase.table("jobs").update(fields).eq("id", job_id)
+        if if_status:
+            query = query.eq("status", if_status)
+        query.execute()
+    except Exception as e:
+        logger.error(f"Failed to update job {job_id}: {e}")
+
+
+def enqueue_job(job_type, payload, chat_message_id=None, job_id=None, await_message=False):
+    """Records a queued job and hands it to the worker pool. Returns the job row.
+
+    Pass await_message=True to start the job before its chat message exists; link the
+    message later with attach_chat_message (or give up on it with detach_chat_message).
+    """
+    if job_type not in _handlers:
+        raise ValueError(f"No handler registered for job type '{job_type}'")
+
+    job = {
+        "id": job_id or str(uuid4()),
+        "type": job_type,
+        "status": "queued",
+        "progress": 0,
+        "payload": payload,
+        "chat_message_id": chat_message_id,
+        "created_at": _now(),
+        "updated_at": _now()
+    }
+    resp = supabase.table("jobs").insert(job).execute()
+    if not resp.data:
+        raise Exception(f"Could not create {job_type} job")
+
+    with _lock:
+        if chat_message_id:
+            _messages[job["id"]] = chat_message_id
+        elif await_message:
+            _awaiting.add(job["id"])
+        _futures[job["id"]] = _executor.submit(_run_job, job["id"], job_type, payload)
+    logger.info(f"Queued {job_type} job {job['id']}")
+    return resp.data[0]
+
+
+def attach_chat_message(job_id, chat_message_id):
+    """Links a job queued without a message to the chat message it should fill.
+
+    Lets callers start a job before the message it belongs to has been saved. If the job
+    already finished, the message is filled right away.
+    """
+    with _lock:
+        _awaiting.discard(job_id)
+        outcome = _outcomes.pop(job_id, None)
+        if outcome is None and job_id in _futures:
+            _messages[job_id] = chat_message_id
+    _update_job(job_id, {"chat_message_id": chat_message_id})
+    if outcome is not None:
+        _fill_chat_message(chat_message_id, outcome)
+
+
+def detach_chat_message(job_id):
+    """Stops waiting for a message for the job; its result is then only available on the job row."""
+    with _lock:
+        _awaiting.discard(job_id)
+        _outcomes.pop(job_id, None)
+
+
+def cancel_job(job_id):
+    """Cancels a queued or running job. A running handler stops at its next progress report."""
+    with _lock:
+        future = _futures.get(job_id)
+        _awaiting.discard(job_id)
+        _outcomes.pop(job_id, None)
+        if future is None:
+            return False
+        _cancelled.add(job_id)
+        _messages.pop(job_id, None)
+        if future.cancel():
+            # Never started, so _run_job won't clean up after it
+            _futures.pop(job_id, None)
+            _cancelled.discard(job_id)
+    _update_job(job_id, {"status": "cancelled", "finished_at": _now()})
+    logger.info(f"Cancelled job {job_id}")
+    return True
+
+
+def get_job(job_id):
+    """Fetches a job by primary key, or None if it doesn't exist."""
+    resp = supabase.table("jobs")\
+        .select("id, type, status, progress, result, error, chat_message_id, created_at, updated_at, started_at, finished_at")\
+        .eq("id", job_id)\
+        .maybe_single()\
+        .execute()
+    return resp.data if resp else None
+
+
+def _run_job(job_id, job_type, payload):
+    handler = _handlers[job_type]
+    if job_id in _cancelled:
+        # Cancelled after the pool picked it up; keep the job row's "cancelled" status
+        _finish(job_id, None)
+        return
+    # Conditional, so a cancellation written between the check above and here isn't overwritten
+    _update_job(job_id, {"status": "running", "started_at": _now()}, if_status="queued")
+
+    def report_progress(percent):
+        if job_id in _cancelled:
+            raise JobCancelled(job_id)
+        _update_job(job_id, {"progress": max(0, min(100, int(percent)))})
+
+    try:
+        result = handler(payload, report_progress)
+    except JobCancelled:
+        logger.info(f"{job_type} job {job_id} stopped after cancellation")
+        _finish(job_id, None)
+        return
+    except Exception as e:
+        logger.error(f"{job_type} job {job_id} failed: {e}")
+        if _finish(job_id, {"status": "failed", "job_id": job_id, "error": str(e)}):
+            _update_job(job_id, {"status": "failed", "error": str(e), "finished_at": _now()})
+        return
+
+    if _finish(job_id, result):
+        _update_job(job_id, {"status": "completed", "progress": 100, "result": result, "finished_at": _now()})
+        logger.info(f"{job_type} job {job_id} completed")
+
+
+def _finish(job_id, content):
+    """Hands a finished job's content to its chat message. Returns False if the job was cancelled."""
+    with _lock:
+        _futures.pop(job_id, None)
+        if job_id in _cancelled:
+            _cancelled.discard(job_id)
+            return False
+        chat_message_id = _messages.pop(job_id, None)
+        if chat_message_id is None and job_id in _awaiting:
+            _awaiting.discard(job_id)
+            _outcomes[job_id] = content
+    if chat_message_id:
+        _fill_chat_message(chat_message_id, content)
+    return True
+
+
+def reap_stale_jobs():
+    """Marks queued/running jobs not updated for JOB_STALE_AFTER seconds as failed and fills their chat messages."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_AFTER)).isoformat()
+    error = "The server restarted before this job finished"
+    try:
+        # The update re-checks the condition, so a job that reported progress meanwhile is left alone
+        reaped = supabase.table("jobs")\
+            .update({"status": "failed", "error": error, "finished_at": _now(), "updated_at": _now()})\
+            .in_("status", ["queued", "running"])\
+            .lt("updated_at", cutoff)\
+            .execute()
+    except Exception as e:
+        logger.error(f"Error reaping stale jobs: {e}")
+        return []
+    jobs = reaped.data or []
+    for job in jobs:
+        if job.get("chat_message_id"):
+            _fill_chat_message(job["chat_message_id"], {"status": "failed", "job_id": job["id"], "error": error})
+    if jobs:
+        logger.info(f"Marked {len(jobs)} stale jobs as failed")
+    return jobs
+
+
+def _fill_chat_message(chat_message_id, content):
+    """Replaces a placeholder chat message's content with the job outcome."""
+    try:
+        # The chat_messages trigger bumps chats.updated_at, invalidating cached message lists (ETags)
+        supabase.table("chat_messages").update({"content": content}).eq("id", chat_message_id).execute()
+    except Exception as e:
+        logger.error(f"Failed to fill chat message {chat_message_id}: {e}")
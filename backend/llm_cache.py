@@ -0,0 +1,282 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Exact-match cache for OpenAI chat completions.
+# Requests are keyed by a hash of the normalized request (model, messages, temperature,
+# response_format, ...). Lookups go through an in-process LRU first, then a local SQLite
+# file that survives restarts and is shared by all workers on the host. On a miss, identical
+# requests that arrive while the first one is still waiting on OpenAI are coalesced onto that
+# call (single-flight) instead of each making their own. Callers pass validate= to keep
+# answers they can't use (wrong JSON shape) out of the cache, so the next request retries.
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "20000"))
+# Seconds a coalesced request waits for the in-flight call before making its own
+LLM_SINGLE_FLIGHT_WAIT = float(os.getenv("LLM_SINGLE_FLIGHT_WAIT", "180"))
+
+DAY = 24 * 60 * 60
+
+# TTL (seconds) per calling endpoint
+ENDPOINT_TTLS = {
+    "genie_mindmap": 30 * DAY,
+    "resource_mindmap": 30 * DAY,
+    "resource_mindmap_enhance": 7 * DAY,
+    "resource_mindmap_patch": 7 * DAY,
+    "video_script": 30 * DAY,
+}
+DEFAULT_TTL = 7 * DAY
+
+_PRUNE_EVERY = 200 # persistent-tier writes between expiry/size sweeps
+
+_lock = threading.Lock()
+_memory = OrderedDict() # key -> (expires_at, content)
+_stats = {} # endpoint -> {"memory_hits", "disk_hits", "misses", "coalesced"}
+_inflight = {} # key -> _Call currently waiting on OpenAI
+_writes = 0
+
+
+class _Call:
+    """An in-flight completion that identical concurrent requests wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.content = None
+        self.error = None
+        self.waiters = 0
+
+
+def _normalize_text(text):
+    return " ".join(text.split()) if isinstance(text, str) else text
+
+
+def make_cache_key(request):
+    """Hashes a chat.completions request. Whitespace in message content and key order don't matter."""
+    normalized = dict(request)
+    normalized["messages"] = [
+        {**message, "content": _normalize_text(message.get("content"))}
+        for message in request.get("messages", [])
+    ]
+    normalized.setdefault("temperature", 1.0) # OpenAI's default
+    normalized.pop("stream", None)
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _count(endpoint, field):
+    with _lock:
+        counters = _stats.setdefault(endpoint, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0})
+        counters[field] += 1
+
+
+def cache_stats():
+    """Returns hit/miss/coalesced counters per endpoint since the process started."""
+    with _lock:
+        stats = {endpoint: dict(counters) for endpoint, counters in _stats.items()}
+        stats["_inflight"] = len(_inflight)
+        return stats
+
+
+def _connect():
+    os.makedirs(os.path.dirname(LLM_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        " key TEXT PRIMARY KEY,"
+        " endpoint TEXT NOT NULL,"
+        " content TEXT NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " expires_at REAL NOT NULL,"
+        " last_used_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def _memory_get(key):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        expires_at, content = entry
+        if expires_at <= time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return content
+
+
+def _memory_put(key, content, expires_at):
+    with _lock:
+        _memory[key] = (expires_at, content)
+        _memory.move_to_end(key)
+        while len(_memory) > LLM_CACHE_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _disk_get(key):
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT content, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            return row
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+
+def _disk_put(key, endpoint, content, expires_at):
+    global _writes
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, endpoint, content, created_at, expires_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, content, now, expires_at, now)
+            )
+            with _lock:
+                _writes += 1
+                prune = _writes % _PRUNE_EVERY == 0
+            if prune:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (LLM_CACHE_MAX_ROWS,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+def _is_valid(validate, content):
+    if validate is None:
+        return True
+    try:
+        return bool(validate(content))
+    except Exception:
+        return False
+
+
+def _is_cacheable(request, completion, content, validate=None):
+    """Only complete answers are cached; truncated, malformed or rejected answers are retried next time."""
+    if content is None or completion.choices[0].finish_reason != "stop":
+        return False
+    if (request.get("response_format") or {}).get("type") == "json_object":
+        try:
+            json.loads(content)
+        except json.JSONDecodeError:
+            return False
+    return _is_valid(validate, content)
+
+
+def evict(key):
+    """Removes a cached answer from both tiers."""
+    with _lock:
+        _memory.pop(key, None)
+    try:
+        conn = _connect()
+        try:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache delete failed: {e}")
+
+
+def _single_flight(key, endpoint, call_openai):
+    """Runs call_openai() once for all concurrent callers with the same key and shares its result."""
+    with _lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+        else:
+            call.waiters += 1
+
+    if not leader:
+        _count(endpoint, "coalesced")
+        if not call.done.wait(LLM_SINGLE_FLIGHT_WAIT):
+            logger.warning(f"In-flight {endpoint} completion timed out for a coalesced request, calling OpenAI directly")
+            return call_openai()
+        if call.error is not None:
+            raise call.error
+        return call.content
+
+    try:
+        call.content = call_openai()
+        return call.content
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        call.done.set()
+        if call.waiters:
+            logger.info(f"Shared one {endpoint} completion with {call.waiters} concurrent identical requests")
+
+
+def cached_chat_completion(client, endpoint, validate=None, **request):
+    """Returns the message content for `client.chat.completions.create(**request)`, from cache when possible.
+
+    validate(content) returning false or raising keeps the answer out of the cache (it is still
+    returned, for the caller to reject); a cached answer it rejects is evicted and fetched again.
+    """
+    key = make_cache_key(request)
+
+    if not LLM_CACHE_ENABLED:
+        return _single_flight(
+            key, endpoint, lambda: client.chat.completions.create(**request).choices[0].message.content
+        )
+
+    content = _memory_get(key)
+    if content is not None and _is_valid(validate, content):
+        _count(endpoint, "memory_hits")
+        return content
+
+    row = _disk_get(key)
+    if row and _is_valid(validate, row[0]):
+        content, expires_at = row
+        _memory_put(key, content, expires_at)
+        _count(endpoint, "disk_hits")
+        return content
+    if content is not None or row:
+        # Cached before the caller's checks existed or tightened
+        evict(key)
+
+    def call_openai():
+        _count(endpoint, "misses")
+        completion = client.chat.completions.create(**request)
+        content = completion.choices[0].message.content
+        if _is_cacheable(request, completion, content, validate):
+            # Stored before the in-flight entry is released, so later requests hit the cache
+            expires_at = time.time() + ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+            _memory_put(key, content, expires_at)
+            _disk_put(key, endpoint, content, expires_at)
+        return content
+
+    return _single_flight(key, endpoint, call_openai)
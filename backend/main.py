@@ -7,9 +7,6 @@ from datetime import datetime
 import logging
 from uuid import UUID
 from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request as GoogleAuthRequest
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import json
 import jwt
@@ -25,6 +22,12 @@ from routes.video import bp as video_bp
 from routes.canvas import bp as canvas_bp
 from routes.credits import bp as credits_bp
 from routes.genie import bp as genie_bp
+from routes.jobs import bp as jobs_bp
+from media_store import start_media_cleanup
+from canvas_sync import start_canvas_sync
+from job_queue import reap_stale_jobs
+from llm_cache import cache_stats
+from canvas_client import canvas_cache_stats, canvas_connection_stats, canvas_rate_limit_stats
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -53,8 +56,8 @@ CORS(
     app,
     resources={r"/*": {"origins": "*"}},  # Allow all origins for now (adjust for production)
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"], # Ensure OPTIONS is allowed for preflight
-    expose_headers=["Content-Type", "X-Google-ID"], # Allow frontend to read this if needed (might not be strictly necessary but good practice)
-    allow_headers=["Content-Type", "Authorization", "X-Google-ID"] # Crucially allow this header to be sent
+    expose_headers=["Content-Type", "X-Google-ID", "ETag", "X-Has-More", "X-Before-Cursor", "X-After-Cursor", "X-Canvas-Failed-Courses"], # Allow frontend to read this if needed (might not be strictly necessary but good practice)
+    allow_headers=["Content-Type", "Authorization", "X-Google-ID", "If-None-Match"] # Crucially allow this header to be sent
 )
 
 # Register blueprints
@@ -68,6 +71,21 @@ app.register_blueprint(video_bp)
 app.register_blueprint(canvas_bp)
 app.register_blueprint(credits_bp)
 app.register_blueprint(genie_bp)
+app.register_blueprint(jobs_bp)
+
+def start_background_tasks():
+    # Periodically delete generated media that no chat message references any more
+    start_media_cleanup()
+    start_canvas_sync()
+    # Fail jobs a previous run left queued/running, so their placeholder messages don't stay pending
+    reap_stale_jobs()
+
+# Not in the video renderer's spawned workers: under `python main.py` they import this module
+# again as __mp_main__ and must not reap the jobs their parent is running. Gunicorn imports it
+# as `main` (main:app), so its workers still start the tasks.
+if __name__ != "__mp_main__":
+    start_background_tasks()
+
 # --- Pydantic Models ---
 class UserAuth(BaseModel):
     google_id: str
@@ -123,49 +141,8 @@ try:
 except Exception as e:
     logger.error(f"Failed to load Google client config: {e}")
 
-# --- Helper: Google Calendar Client ---
-def get_google_calendar_client(google_id: str):
-    if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
-        abort(500, description="Server config error: Google client secrets not loaded.")
-    # fetch tokens
-    user_resp = supabase.table("users").select(
-        "google_refresh_token,google_access_token,google_token_expiry"
-    ).eq("google_id", google_id).maybe_single().execute()
-    if not user_resp.data:
-        abort(404, description="User not found.")
-    token_info = user_resp.data
-    refresh_token = token_info.get('google_refresh_token')
-    access_token = token_info.get('google_access_token')
-    if not refresh_token:
-        abort(400, description="Google Calendar not connected for this user.")
-
-    creds = Credentials(
-        token=access_token,
-        refresh_token=refresh_token,
-        token_uri=GOOGLE_TOKEN_URI,
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        scopes=SCOPES
-    )
-    try:
-        if not creds.valid:
-            if creds.refresh_token:
-                creds.refresh(GoogleAuthRequest())
-                supabase.table("users").update({
-                    'google_access_token': creds.token,
-                    'google_token_expiry': creds.expiry.isoformat() if creds.expiry else None
-                }).eq("google_id", google_id).execute()
-            else:
-                abort(401, description="Google Calendar re-authentication required.")
-    except Exception as e:
-        logger.error(f"Error refreshing token: {e}")
-        abort(500, description="Failed to refresh Google token.")
-    try:
-        service = build('calendar', 'v3', credentials=creds, static_discovery=False)
-        return service
-    except Exception as e:
-        logger.error(f"Error building calendar service: {e}")
-        abort(500, description="Failed to build Google Calendar client.")
+# Google Calendar clients come from routes/calendar.py:get_google_calendar_client, which
+# reads and refreshes tokens through the shared user-row cache (user_rows.py)
 
 # Remove existing routes since they are now handled by blueprints
 
@@ -173,5 +150,19 @@ def get_google_calendar_client(google_id: str):
 def root():
     return jsonify({"message": "Hello World", "hello": "your mom"})
 
+@app.route('/metrics/llm', methods=['GET'])
+def llm_metrics():
+    """Per-endpoint LLM cache hits/misses and how many requests were coalesced onto an in-flight call."""
+    return jsonify(cache_stats())
+
+@app.route('/metrics/canvas', methods=['GET'])
+def canvas_metrics():
+    """Canvas response cache counters, per-host connection reuse and rate-limit scheduling."""
+    return jsonify({
+        "cache": canvas_cache_stats(),
+        "connections": canvas_connection_stats(),
+        "rate_limits": canvas_rate_limit_stats()
+    })
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone, timedelta
+import hashlib
+import json
+import logging
+import os
+import threading
+from initdb import supabase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Content-addressed storage for generated media (TTS audio, rendered videos).
+# Objects live in the generated-videos bucket under a path derived from a hash of their
+# inputs, so identical narration/voice/speed or an identical render is only produced and
+# stored once. Each object has a media_objects row whose ref_count is maintained by a
+# trigger on chat_messages (content.audio_path / content.video_path); objects nobody has
+# referenced or reused for MEDIA_GRACE_HOURS are deleted by cleanup_unreferenced_media.
+# Results of media jobs finished within MEDIA_JOB_RETENTION_DAYS count as references too,
+# since /jobs/<id> and /chat/video-status keep handing out their URLs (the render-video
+# route and turns whose message was never saved have no chat message).
+
+MEDIA_BUCKET = "generated-videos"
+MEDIA_GRACE_HOURS = int(os.getenv("MEDIA_GRACE_HOURS", "24"))
+MEDIA_CLEANUP_INTERVAL = int(os.getenv("MEDIA_CLEANUP_INTERVAL", str(6 * 60 * 60))) # seconds
+MEDIA_JOB_RETENTION_DAYS = int(os.getenv("MEDIA_JOB_RETENTION_DAYS", "30"))
+MEDIA_JOB_TYPES = ("genie_video", "render_video")
+
+
+def content_key(*parts):
+    """Stable SHA-256 of the JSON-encoded inputs of a media object."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def public_url(path):
+    url = supabase.storage.from_(MEDIA_BUCKET).get_public_url(path)
+    return url if isinstance(url, str) else getattr(url, 'publicUrl', str(url))
+
+
+def find_media(path):
+    """Returns the media_objects row for an already stored object (and marks it used), or None."""
+    resp = supabase.table("media_objects")\
+        .update({"last_used_at": _now()})\
+        .eq("path", path)\
+        .execute()
+    return resp.data[0] if resp.data else None
+
+
+def store_media(path, data, content_type, kind, metadata=None):
+    """Uploads an object under its content-addressed path and registers it."""
+    upload_response = supabase.storage.from_(MEDIA_BUCKET).upload(
+        path,
+        data,
+        {"contentType": content_type, "upsert": "true"}
+    )
+    if hasattr(upload_response, 'error') and upload_response.error:
+        raise Exception(f"Failed to upload {path}: {upload_response.error}")
+
+    # ref_count is left out so an existing row keeps its count
+    supabase.table("media_objects").upsert({
+        "path": path,
+        "kind": kind,
+        "size_bytes": len(data),
+        "metadata": metadata or {},
+        "last_used_at": _now()
+    }, on_conflict="path").execute()
+    return public_url(path)
+
+
+def download_media(path):
+    return supabase.storage.from_(MEDIA_BUCKET).download(path)
+
+
+def _job_referenced_paths():
+    """Media paths in the results of media jobs finished within MEDIA_JOB_RETENTION_DAYS."""
+    since = (datetime.now(timezone.utc) - timedelta(days=MEDIA_JOB_RETENTION_DAYS)).isoformat()
+    jobs = supabase.table("jobs")\
+        .select("result")\
+        .in_("type", list(MEDIA_JOB_TYPES))\
+        .eq("status", "completed")\
+        .gte("finished_at", since)\
+        .execute().data or []
+    return {
+        path for job in jobs
+        for path in ((job.get("result") or {}).get("audio_path"), (job.get("result") or {}).get("video_path"))
+        if path
+    }
+
+
+def cleanup_unreferenced_media():
+    """Deletes objects with no references that haven't been reused within the grace period."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=MEDIA_GRACE_HOURS)).isoformat()
+    try:
+        # The row delete re-checks the condition, so an object reused or referenced meanwhile survives
+        query = supabase.table("media_objects")\
+            .delete()\
+            .lte("ref_count", 0)\
+            .lt("last_used_at", cutoff)
+        job_paths = _job_referenced_paths()
+        if job_paths:
+            query = query.not_.in_("path", sorted(job_paths))
+        deleted = query.execute()
+        paths = [row["path"] for row in deleted.data or []]
+        if paths:
+            supabase.storage.from_(MEDIA_BUCKET).remove(paths)
+            logger.info(f"Removed {len(paths)} unreferenced media objects")
+        return paths
+    except Exception as e:
+        logger.error(f"Error cleaning up media objects: {e}")
+        return []
+
+
+def start_media_cleanup():
+    """Runs cleanup_unreferenced_media every MEDIA_CLEANUP_INTERVAL seconds on a daemon thread."""
+    def loop():
+        stop = threading.Event()
+        while not stop.wait(MEDIA_CLEANUP_INTERVAL):
+            cleanup_unreferenced_media()
+    threading.Thread(target=loop, name="media-cleanup", daemon=True).start()
@@ -0,0 +1,444 @@
+from collections import deque
+import logging
+import math
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Helpers for mindmap content ({"nodes": [...], "edges": [...]} in React Flow format).
+#
+# Enhancements are requested from the model as a patch instead of a full map:
+#   {"add_nodes":    [{"id": "n1", "label": "..."}],
+#    "update_nodes": [{"id": "3", "label": "..."}],
+#    "remove_nodes": ["4"],
+#    "add_edges":    [{"source": "3", "target": "n1"}],
+#    "remove_edges": [{"source": "1", "target": "4"}]}
+# apply_patch validates it against the stored map and returns the updated map.
+#
+# layout_mindmap computes node positions once on the server, when a map is generated or
+# edited, so the client can render stored positions as-is: a top-down tidy tree over a
+# spanning forest of the graph, then a NumPy pass that pushes overlapping nodes apart and
+# pulls nodes joined by non-tree edges together while staying close to the tree layout.
+#
+# build_index stores the map's tree structure (roots, parent/children, depth, subtree size)
+# next to the content in resources.mindmap_index, so subtree() can answer "this node and
+# its descendants to depth N" without walking the whole graph on every request.
+
+PATCH_KEYS = ("add_nodes", "update_nodes", "remove_nodes", "add_edges", "remove_edges")
+
+# Layout geometry, in React Flow pixels. Node width matches the frontend's node size.
+LAYOUT_NODE_WIDTH = 172
+LAYOUT_LINE_HEIGHT = 18
+LAYOUT_CHARS_PER_LINE = 22
+LAYOUT_H_GAP = 24 # between siblings
+LAYOUT_V_GAP = 80 # between levels
+LAYOUT_ITERATIONS = 60
+LAYOUT_REFINE_MAX_NODES = 1500 # the refinement is O(n^2) per iteration
+ANCHOR_PULL = 0.05
+EDGE_PULL = 0.02
+
+MINDMAP_INDEX_VERSION = 1
+
+
+class MindmapPatchError(ValueError):
+    """The model returned something that isn't a usable patch."""
+
+
+def mindmap_shape_error(mindmap):
+    """Why a map's nodes/edges can't be laid out or indexed, or None if they can."""
+    for node in mindmap.get("nodes") or []:
+        if not isinstance(node, dict) or node.get("id") in (None, ""):
+            return "Every mindmap node must be an object with an 'id'"
+    edges = mindmap.get("edges") or []
+    if not isinstance(edges, list) or not all(isinstance(edge, dict) for edge in edges):
+        return "Mindmap 'edges' must be a list of objects with 'source' and 'target'"
+    return None
+
+
+def is_mindmap(data):
+    """Whether data is a full {"nodes": [...], "edges": [...]} map that can be laid out."""
+    return (
+        isinstance(data, dict) and isinstance(data.get("nodes"), list) and isinstance(data.get("edges"), list)
+        and mindmap_shape_error(data) is None
+    )
+
+
+def edge_id(source, target):
+    return f"e{source}-{target}"
+
+
+def compact_outline(mindmap):
+    """Token-cheap text form of a map for prompts: one 'id: label' line per node, then 'source -> target' edges."""
+    nodes = "\n".join(f"{n['id']}: {(n.get('data') or {}).get('label', '')}" for n in mindmap.get("nodes", []))
+    edges = "\n".join(f"{e['source']} -> {e['target']}" for e in mindmap.get("edges", []))
+    return f"Nodes:\n{nodes}\n\nEdges:\n{edges}"
+
+
+def _list(patch, key):
+    value = patch.get(key) or []
+    if not isinstance(value, list):
+        raise MindmapPatchError(f"'{key}' must be a list")
+    return value
+
+
+def apply_patch(mindmap, patch):
+    """Applies a patch to a mindmap. Returns (updated map, counts of applied operations).
+
+    Structural problems, including new node ids that clash with existing ones (an edge to such
+    an id would be ambiguous), raise MindmapPatchError. Operations that reference unknown nodes
+    are skipped, and edges left dangling by a removed node are dropped.
+    """
+    if not isinstance(patch, dict) or not any(key in patch for key in PATCH_KEYS):
+        raise MindmapPatchError("Patch must be an object with at least one of " + ", ".join(PATCH_KEYS))
+
+    nodes = {str(n["id"]): dict(n) for n in mindmap.get("nodes", [])}
+    edges = {(str(e["source"]), str(e["target"])): dict(e) for e in mindmap.get("edges", [])}
+    applied = dict.fromkeys(PATCH_KEYS, 0)
+    skipped = 0
+
+    for node_id in _list(patch, "remove_nodes"):
+        if nodes.pop(str(node_id), None) is not None:
+            applied["remove_nodes"] += 1
+        else:
+            skipped += 1
+    edges = {key: e for key, e in edges.items() if key[0] in nodes and key[1] in nodes}
+
+    for item in _list(patch, "update_nodes"):
+        if not isinstance(item, dict) or not str(item.get("label", "")).strip():
+            raise MindmapPatchError("update_nodes entries need an 'id' and a non-empty 'label'")
+        node = nodes.get(str(item.get("id")))
+        if node is None:
+            skipped += 1
+            continue
+        node["data"] = {**(node.get("data") or {}), "label": str(item["label"]).strip()}
+        applied["update_nodes"] += 1
+
+    for item in _list(patch, "add_nodes"):
+        if not isinstance(item, dict) or not item.get("id") or not str(item.get("label", "")).strip():
+            raise MindmapPatchError("add_nodes entries need an 'id' and a non-empty 'label'")
+        new_id = str(item["id"])
+        if new_id in nodes:
+            raise MindmapPatchError(f"add_nodes id '{new_id}' is already used by another node")
+        nodes[new_id] = {"id": new_id, "position": {"x": 0, "y": 0}, "data": {"label": str(item["label"]).strip()}}
+        applied["add_nodes"] += 1
+
+    for item in _list(patch, "remove_edges"):
+        if not isinstance(item, dict):
+            raise MindmapPatchError("remove_edges entries need a 'source' and 'target'")
+        if edges.pop((str(item.get("source")), str(item.get("target"))), None) is not None:
+            applied["remove_edges"] += 1
+        else:
+            skipped += 1
+
+    for item in _list(patch, "add_edges"):
+        if not isinstance(item, dict):
+            raise MindmapPatchError("add_edges entries need a 'source' and 'target'")
+        source, target = str(item.get("source")), str(item.get("target"))
+        if source not in nodes or target not in nodes or source == target or (source, target) in edges:
+            skipped += 1
+            continue
+        edges[(source, target)] = {"id": edge_id(source, target), "source": source, "target": target}
+        applied["add_edges"] += 1
+
+    if skipped:
+        logger.warning(f"Skipped {skipped} mindmap patch operations referencing unknown nodes or edges")
+    return {**mindmap, "nodes": list(nodes.values()), "edges": list(edges.values())}, applied
+
+
+# --- Layout ---
+def _node_size(node):
+    label = str((node.get("data") or {}).get("label", ""))
+    lines = max(1, math.ceil(len(label) / LAYOUT_CHARS_PER_LINE))
+    return LAYOUT_NODE_WIDTH, LAYOUT_LINE_HEIGHT * (lines + 1)
+
+
+def needs_layout(mindmap):
+    """True if the map has no real positions yet (every node at the same point, e.g. the model's 0,0)."""
+    positions = {
+        ((n.get("position") or {}).get("x", 0), (n.get("position") or {}).get("y", 0))
+        for n in mindmap.get("nodes", [])
+    }
+    return len(mindmap.get("nodes", [])) > 1 and len(positions) == 1
+
+
+def _spanning_forest(ids, edges):
+    """BFS spanning forest following edge direction first. Returns (roots, children, tree edge set)."""
+    outgoing = {i: [] for i in ids}
+    incoming = {i: [] for i in ids}
+    for source, target in edges:
+        outgoing[source].append(target)
+        incoming[target].append(source)
+
+    children = {i: [] for i in ids}
+    tree_edges = set()
+    visited = set()
+    roots = []
+    # Nodes without parents start trees; anything left over (cycles) starts its own
+    for start in [i for i in ids if not incoming[i]] + ids:
+        if start in visited:
+            continue
+        roots.append(start)
+        visited.add(start)
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbor in outgoing[node] + incoming[node]:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    children[node].append(neighbor)
+                    tree_edges.add((node, neighbor))
+                    queue.append(neighbor)
+    return roots, children, tree_edges
+
+
+def _tidy_tree(roots, children, sizes):
+    """Top-down tree layout: leaves get consecutive slots, parents are centered over their children."""
+    depth = {}
+    for root in roots:
+        depth[root] = 0
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for child in children[node]:
+                depth[child] = depth[node] + 1
+                queue.append(child)
+
+    level_heights = {}
+    for node, d in depth.items():
+        level_heights[d] = max(level_heights.get(d, 0), sizes[node][1])
+    level_y = {}
+    y = 0
+    for d in sorted(level_heights):
+        level_y[d] = y + level_heights[d] / 2
+        y += level_heights[d] + LAYOUT_V_GAP
+
+    x = {}
+    cursor = 0.0
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not children[node]:
+                x[node] = cursor + sizes[node][0] / 2
+                cursor += sizes[node][0] + LAYOUT_H_GAP
+            elif expanded:
+                x[node] = (x[children[node][0]] + x[children[node][-1]]) / 2
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children[node]))
+        cursor += LAYOUT_H_GAP * 2 # extra space between separate trees
+
+    return {node: (x[node], level_y[depth[node]]) for node in depth}
+
+
+def _refine(centers, sizes, pinned, extra_edges):
+    """Pushes overlapping nodes apart and pulls non-tree edges together, anchored to the tree layout."""
+    pos = centers.copy()
+    n = len(pos)
+    idx = np.arange(n)
+    tie = np.sign(idx[:, None] - idx[None, :]) # separates nodes that sit exactly on top of each other
+    half_w, half_h = sizes[:, 0] / 2, sizes[:, 1] / 2
+    min_dx = half_w[:, None] + half_w[None, :] + LAYOUT_H_GAP
+    min_dy = half_h[:, None] + half_h[None, :] + LAYOUT_V_GAP / 2
+    free = ~pinned
+
+    for _ in range(LAYOUT_ITERATIONS):
+        dx = pos[:, None, 0] - pos[None, :, 0]
+        dy = pos[:, None, 1] - pos[None, :, 1]
+        overlap_x = min_dx - np.abs(dx)
+        overlap_y = min_dy - np.abs(dy)
+        hit = (overlap_x > 0) & (overlap_y > 0)
+        np.fill_diagonal(hit, False)
+        if not hit.any() and not len(extra_edges):
+            break
+
+        # Separate each overlapping pair along the axis that needs the smaller move
+        horizontal = hit & (overlap_x <= overlap_y)
+        vertical = hit & ~horizontal
+        force = np.zeros_like(pos)
+        force[:, 0] = np.where(horizontal, np.where(dx == 0, tie, np.sign(dx)) * overlap_x / 2, 0).sum(axis=1)
+        force[:, 1] = np.where(vertical, np.where(dy == 0, tie, np.sign(dy)) * overlap_y / 2, 0).sum(axis=1)
+
+        if len(extra_edges):
+            source, target = extra_edges[:, 0], extra_edges[:, 1]
+            pull = (pos[target, 0] - pos[source, 0]) * EDGE_PULL
+            np.add.at(force[:, 0], source, pull)
+            np.add.at(force[:, 0], target, -pull)
+
+        force += (centers - pos) * ANCHOR_PULL
+        pos[free] += force[free]
+    return pos
+
+
+def layout_mindmap(mindmap, new_ids=None):
+    """Returns a copy of the map with computed node positions.
+
+    Without new_ids every node is laid out. With new_ids only those nodes are placed (below
+    their parent in the tree) and all other nodes keep their current positions.
+    """
+    if not isinstance(mindmap, dict) or not isinstance(mindmap.get("nodes"), list) or not mindmap["nodes"]:
+        return mindmap
+
+    nodes = [dict(n) for n in mindmap["nodes"]]
+    ids = [str(n["id"]) for n in nodes]
+    known = set(ids)
+    edges = [
+        (str(e["source"]), str(e["target"])) for e in mindmap.get("edges", [])
+        if str(e.get("source")) in known and str(e.get("target")) in known and e.get("source") != e.get("target")
+    ]
+    sizes = {node_id: _node_size(n) for node_id, n in zip(ids, nodes)}
+    roots, children, tree_edges = _spanning_forest(ids, edges)
+
+    new_ids = {str(i) for i in new_ids} & known if new_ids is not None else None
+    if new_ids is None:
+        centers = _tidy_tree(roots, children, sizes)
+        pinned = set()
+    elif not new_ids:
+        return mindmap
+    else:
+        # Keep placed nodes where they are and put each new node under its parent, next to its new siblings
+        centers = {}
+        for node_id, n in zip(ids, nodes):
+            if node_id not in new_ids:
+                position = n.get("position") or {}
+                centers[node_id] = (position.get("x", 0) + sizes[node_id][0] / 2, position.get("y", 0) + sizes[node_id][1] / 2)
+        pinned = set(centers)
+        bottom = max((y + sizes[i][1] / 2 for i, (_, y) in centers.items()), default=0)
+        parent_of = {child: parent for parent, kids in children.items() for child in kids}
+        order = [node for root in roots for node in _bfs(root, children)]
+        placed_under = {}
+        for node_id in order:
+            if node_id not in new_ids:
+                continue
+            parent = parent_of.get(node_id)
+            if parent in centers:
+                px, py = centers[parent]
+                slot = placed_under.get(parent, 0)
+                placed_under[parent] = slot + 1
+                offset = (slot + 1) // 2 * (1 if slot % 2 else -1) # 0, +1, -1, +2, ...
+                centers[node_id] = (px + offset * (LAYOUT_NODE_WIDTH + LAYOUT_H_GAP), py + sizes[parent][1] / 2 + LAYOUT_V_GAP + sizes[node_id][1] / 2)
+            else:
+                slot = placed_under.get(None, 0)
+                placed_under[None] = slot + 1
+                centers[node_id] = (slot * (LAYOUT_NODE_WIDTH + LAYOUT_H_GAP), bottom + LAYOUT_V_GAP + sizes[node_id][1] / 2)
+
+    if len(ids) <= LAYOUT_REFINE_MAX_NODES:
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        extra = np.array([(index[s], index[t]) for s, t in edges if (s, t) not in tree_edges and (t, s) not in tree_edges], dtype=int).reshape(-1, 2)
+        refined = _refine(
+            np.array([centers[i] for i in ids], dtype=float),
+            np.array([sizes[i] for i in ids], dtype=float),
+            np.array([i in pinned for i in ids]),
+            extra
+        )
+        centers = {node_id: tuple(refined[i]) for i, node_id in enumerate(ids)}
+
+    # React Flow positions are the node's top-left corner
+    for node_id, n in zip(ids, nodes):
+        if node_id in pinned:
+            continue
+        cx, cy = centers[node_id]
+        n["position"] = {"x": round(cx - sizes[node_id][0] / 2), "y": round(cy - sizes[node_id][1] / 2)}
+    return {**mindmap, "nodes": nodes}
+
+
+def _bfs(root, children):
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        yield node
+        queue.extend(children[node])
+
+
+# --- Graph index / subtree paging ---
+def build_index(mindmap):
+    """Tree index over a map's nodes: roots, parent, children, depth and subtree size per node."""
+    nodes = mindmap.get("nodes", []) if isinstance(mindmap, dict) else []
+    # Maps stored before node shapes were checked may have nodes without an id; they aren't indexed
+    ids = [str(n["id"]) for n in nodes if isinstance(n, dict) and n.get("id") not in (None, "")]
+    known = set(ids)
+    edges = [
+        (str(e["source"]), str(e["target"])) for e in (mindmap.get("edges") or [])
+        if str(e.get("source")) in known and str(e.get("target")) in known and str(e.get("source")) != str(e.get("target"))
+    ]
+    roots, children, _ = _spanning_forest(ids, edges)
+
+    parent = {child: node for node, kids in children.items() for child in kids}
+    order = [node for root in roots for node in _bfs(root, children)]
+    depth = {}
+    for node in order:
+        depth[node] = depth[parent[node]] + 1 if node in parent else 0
+    size = {}
+    for node in reversed(order):
+        size[node] = 1 + sum(size[child] for child in children[node])
+
+    return {
+        "version": MINDMAP_INDEX_VERSION,
+        "roots": roots,
+        "parent": parent,
+        "children": {node: kids for node, kids in children.items() if kids},
+        "depth": depth,
+        "size": size
+    }
+
+
+def subtree(mindmap, index, node_id=None, depth=1, expanded=(), limit=200):
+    """Nodes and edges visible when `node_id` (or every root) is shown `depth` levels deep.
+
+    Children of nodes in `expanded` are included too, however deep, mirroring what the client
+    has open. At most `limit` nodes are returned, breadth-first. `meta` tells the client the
+    depth and child count of each returned node and whether it has children not included.
+    """
+    children = index.get("children", {})
+    starts = [str(node_id)] if node_id is not None else list(index.get("roots", []))
+    expanded = {str(i) for i in expanded}
+
+    included = []
+    seen = set()
+    truncated = False
+    queue = deque((start, 0) for start in starts if start in index.get("depth", {}))
+    while queue:
+        node, level = queue.popleft()
+        if node in seen:
+            continue
+        if len(included) >= limit:
+            truncated = True
+            break
+        seen.add(node)
+        included.append(node)
+        if level < depth or node in expanded:
+            queue.extend((child, level + 1) for child in children.get(node, []))
+
+    by_id = {str(n["id"]): n for n in mindmap.get("nodes", [])}
+    meta = {
+        node: {
+            "depth": index["depth"][node],
+            "child_count": len(children.get(node, [])),
+            "descendant_count": index["size"][node] - 1,
+            "has_hidden_children": any(child not in seen for child in children.get(node, []))
+        }
+        for node in included
+    }
+    return {
+        "nodes": [by_id[node] for node in included if node in by_id],
+        "edges": [
+            e for e in mindmap.get("edges", [])
+            if str(e.get("source")) in seen and str(e.get("target")) in seen
+        ],
+        "meta": meta,
+        "path": _path_to(index, starts[0]) if node_id is not None else [],
+        "total_nodes": len(by_id),
+        "truncated": truncated
+    }
+
+
+def _path_to(index, node_id):
+    """Ancestor ids of a node, root first (for breadcrumbs when a client opens a deep node directly)."""
+    path = []
+    parent = index.get("parent", {}).get(node_id)
+    while parent is not None and parent not in path:
+        path.append(parent)
+        parent = index["parent"].get(parent)
+    return list(reversed(path))
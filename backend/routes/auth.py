@@ -4,6 +4,7 @@ from typing import Optional
 from datetime import datetime
 import logging
 from initdb import supabase
+from authz import prefetch_ownership_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +29,8 @@ def google_auth():
             updated = supabase.table("users").update({
                 'last_logged_in': datetime.utcnow().isoformat()
             }).eq("google_id", user.google_id).execute()
+            # Warm the ownership cache so the user's first edits skip the lookup
+            prefetch_ownership_async(user.google_id)
             return jsonify({"message": "User login updated", "user": updated.data[0] if updated.data else None})
         else:
             new_user = {
@@ -11,6 +11,7 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import json
 from initdb import supabase
+from user_rows import load_user, forget_user
 import os
 
 # Configure logging
@@ -102,6 +103,7 @@ def oauth2callback():
             'google_token_expiry': creds.expiry.isoformat() if creds.expiry else None
         }
         resp = supabase.table("users").update(update).eq("google_id", google_id).execute()
+        forget_user(google_id)
         return redirect("http://localhost:3000/profile?google_auth_status=" +
                         ("success" if resp.data else "error_saving"))
     except Exception as e:
@@ -219,12 +221,9 @@ def get_google_calendar_client(google_id: str):
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         abort(500, description="Server config error: Google client secrets not loaded.")
     # fetch tokens
-    user_resp = supabase.table("users").select(
-        "google_refresh_token,google_access_token,google_token_expiry"
-    ).eq("google_id", google_id).maybe_single().execute()
-    if not user_resp.data:
+    token_info = load_user(google_id)
+    if not token_info:
         abort(404, description="User not found.")
-    token_info = user_resp.data
     refresh_token = token_info.get('google_refresh_token')
     access_token = token_info.get('google_access_token')
     if not refresh_token:
@@ -246,6 +245,7 @@ def get_google_calendar_client(google_id: str):
                     'google_access_token': creds.token,
                     'google_token_expiry': creds.expiry.isoformat() if creds.expiry else None
                 }).eq("google_id", google_id).execute()
+                forget_user(google_id)
             else:
                 abort(401, description="Google Calendar re-authentication required.")
     except Exception as e:
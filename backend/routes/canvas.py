@@ -1,10 +1,21 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, Response, stream_with_context
 # from pydantic import BaseModel
 # from typing import Optional
 # from datetime import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed, wait
+import os
 from initdb import supabase
-import requests
+from canvas_client import (
+    CanvasError, fetch_courses, fetch_course_assignments, fetch_assignments_by_id,
+    invalidate_canvas_cache, graphql_available, fetch_courses_graphql, fetch_upcoming_assignments_graphql,
+    fetch_assignment
+)
+from html_text import html_to_text, excerpt
+from canvas_sync import task_from_assignment
+from user_rows import load_user, forget_user
+from job_queue import enqueue_job
+from datetime import datetime, timezone
 import json
 import time
 
@@ -14,6 +25,17 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint('canvas_infra', __name__)
 
+# Courses are fetched concurrently on one pool shared by all requests, so size
+# CANVAS_FETCH_WORKERS for concurrent users x courses each (the per-token scheduler in
+# canvas_client still paces each user's requests). A course gets CANVAS_COURSE_DEADLINE
+# seconds from when its fetch starts for all its pages and retries; a request waits at most
+# CANVAS_ASSIGNMENTS_WAIT seconds in total, and courses still queued then are skipped unsent.
+CANVAS_FETCH_WORKERS = int(os.getenv("CANVAS_FETCH_WORKERS", "32"))
+CANVAS_COURSE_DEADLINE = float(os.getenv("CANVAS_COURSE_DEADLINE", "15"))
+CANVAS_ASSIGNMENTS_WAIT = float(os.getenv("CANVAS_ASSIGNMENTS_WAIT", "30"))
+
+_course_pool = ThreadPoolExecutor(max_workers=CANVAS_FETCH_WORKERS, thread_name_prefix="canvas-course")
+
 @bp.route('/canvas/connect', methods=['POST'])
 def connect_canvas(): 
     data = request.json
@@ -56,6 +78,9 @@ def connect_canvas():
             'canvas_domain': domain_to_store, 
             'canvas_access_token': access_token # Will be None if disconnecting
         }).eq('google_id', google_id).execute()
+        # Cached Canvas responses and user rows belong to the old credentials
+        invalidate_canvas_cache(google_id)
+        forget_user(google_id)
         
         message = "Canvas credentials stored successfully" if not is_disconnect_request else "Canvas connection removed successfully"
         return jsonify({"message": message}), 200
@@ -76,17 +101,12 @@ def get_current_courses():
         return jsonify({"error": "User identifier (google_id) is required as query parameter"}), 400
     
     # step 1 is getting canvas domain and token from supabase
-    res = (supabase.table('users')
-                     .select('canvas_domain, canvas_access_token')
-                     .eq('google_id', google_id)
-                     .single()
-                     .execute())
-    
-    if res.data is None: 
-        logger.error(f"Error fetching Canvas credentials for {google_id}: {res.error}")
+    row = load_user(google_id) # this is a row in the users table, supabase python is so cool
+    
+    if row is None: 
+        logger.error(f"Error fetching Canvas credentials for {google_id}")
         return jsonify({"error": "user not found or not connected to canvas"}), 500
     
-    row = res.data # this is a row in the users table, supabase python is so cool
     token  = row.get('canvas_access_token')
     domain = row.get('canvas_domain')
     
@@ -94,26 +114,18 @@ def get_current_courses():
         return jsonify({"error": "canvas credentials not found"}), 400
     
     headers = {"Authorization": f"Bearer {token}"}
-    params  = {"enrollment_state": "active"}   # only current courses
-    url     = f"{domain}/api/v1/courses"
     
+    # One GraphQL query when the Canvas instance supports it, the paginated REST list otherwise
+    if graphql_available(domain):
+        try:
+            return jsonify(fetch_courses_graphql(domain, headers, cache_user=google_id)), 200
+        except CanvasError as e:
+            logger.warning(f"Canvas GraphQL courses failed, falling back to REST: {e}")
+
     try:
-        courses = []
-        while url:
-            resp = requests.get(url, headers=headers, params=params, timeout=10)
-            if resp.status_code != 200:
-                logger.warning(f"Canvas API error {resp.status_code}: {resp.text[:200]}")
-                return jsonify({"error": "Canvas API error",
-                                "details": resp.text}), resp.status_code
-
-            courses.extend(resp.json())
-            # Canvas paginates with RFC‑5988 Link headers
-            url = resp.links.get('next', {}).get('url')
-            params = None        # only on first iteration
-
-    except requests.exceptions.RequestException as e:
-        logger.exception("Network error reaching Canvas")
-        return jsonify({"error": "Could not reach Canvas"}), 502
+        courses = fetch_courses(domain, headers, cache_user=google_id)
+    except CanvasError as e:
+        return jsonify({"error": str(e), "details": e.details}), e.status_code
 
     return jsonify(courses), 200
         
@@ -143,17 +155,12 @@ def get_canvas_assignments(course_id):
     
     # Get Canvas credentials
     try:
-        res = (supabase.table('users')
-                        .select('canvas_domain, canvas_access_token')
-                        .eq('google_id', google_id)
-                        .single()
-                        .execute())
+        row = load_user(google_id)
         
-        if res.data is None:
+        if row is None:
             logger.error(f"Error fetching Canvas credentials for {google_id}")
             return jsonify({"error": "User not found or not connected to Canvas"}), 404
         
-        row = res.data
         token = row.get('canvas_access_token')
         domain = row.get('canvas_domain')
         
@@ -166,67 +173,51 @@ def get_canvas_assignments(course_id):
     
     # Fetch assignments from Canvas
     headers = {"Authorization": f"Bearer {token}"}
-    params = {"bucket": "upcoming", "order_by": "due_at"}
-    url = f"{domain}/api/v1/courses/{course_id}/assignments"
-    
     try:
-        assignments = []
-        retry_count = 0
-        max_retries = 2
-        
-        while url and retry_count <= max_retries:
-            try:
-                resp = requests.get(url, headers=headers, params=params, timeout=10)
-                
-                if resp.status_code == 200:
-                    # Success - process the data and continue
-                    assignments.extend(resp.json())
-                    # Handle pagination
-                    url = resp.links.get('next', {}).get('url')
-                    params = None  # Only on first iteration
-                    retry_count = 0  # Reset retry count on success
-                else:
-                    logger.warning(f"Canvas API error {resp.status_code}: {resp.text[:200]}")
-                    if retry_count < max_retries:
-                        retry_count += 1
-                        logger.info(f"Retrying Canvas API request (attempt {retry_count}/{max_retries})")
-                        time.sleep(1)  # Add a small delay before retry
-                    else:
-                        # Return error if max retries reached
-                        return jsonify({
-                            "error": "Canvas API error", 
-                            "details": resp.text,
-                            "status_code": resp.status_code
-                        }), resp.status_code
-            
-            except requests.exceptions.Timeout:
-                # Handle timeout specifically
-                if retry_count < max_retries:
-                    retry_count += 1
-                    logger.info(f"Canvas API request timed out, retrying (attempt {retry_count}/{max_retries})")
-                    time.sleep(1)
-                else:
-                    raise
-        
-    except requests.exceptions.RequestException as e:
-        logger.exception("Network error reaching Canvas")
-        return jsonify({"error": "Could not reach Canvas", "details": str(e)}), 502
-    
-    # Process assignments to match our format
-    processed_assignments = []
-    for assignment in assignments:
-        processed_assignments.append({
-            "id": assignment.get("id"),
-            "title": assignment.get("name"),
-            "description": assignment.get("description"),
-            "due_date": assignment.get("due_at"),
-            "html_url": assignment.get("html_url"),
-            "submission_types": assignment.get("submission_types"),
-            "points_possible": assignment.get("points_possible")
-        })
+        assignments = fetch_course_assignments(domain, headers, course_id, cache_user=google_id)
+    except CanvasError as e:
+        logger.warning(f"Failed to fetch assignments for course {course_id}: {e}")
+        return jsonify({
+            "error": str(e),
+            "details": e.details,
+            "status_code": e.status_code
+        }), e.status_code
+    
+    # Process assignments to match our format (compact; the full description is on the detail route)
+    processed_assignments = [_assignment_summary(assignment) for assignment in assignments]
     
     return jsonify(processed_assignments), 200
 
+@bp.route('/canvas/courses/<string:course_id>/assignments/<string:assignment_id>', methods=['GET'])
+def get_canvas_assignment(course_id, assignment_id):
+    """Fetch one Canvas assignment with its full description, as HTML and as plain text."""
+    google_id = request.args.get('google_id')
+    
+    if not google_id:
+        return jsonify({"error": "User identifier (google_id) is required as query parameter"}), 400
+    
+    try:
+        row = load_user(google_id)
+    except Exception as e:
+        logger.error(f"Database error fetching Canvas credentials: {e}")
+        return jsonify({"error": "Database error"}), 500
+    if not row or not row.get('canvas_access_token') or not row.get('canvas_domain'):
+        return jsonify({"error": "User not found or not connected to Canvas"}), 404
+    
+    headers = {"Authorization": f"Bearer {row['canvas_access_token']}"}
+    try:
+        assignment = fetch_assignment(row['canvas_domain'], headers, course_id, assignment_id, cache_user=google_id)
+    except CanvasError as e:
+        return jsonify({"error": str(e), "details": e.details}), e.status_code
+    
+    description = assignment.get("description")
+    return jsonify({
+        **_assignment_summary(assignment),
+        "course_id": assignment.get("course_id"),
+        "description": description,
+        "description_text": html_to_text(description)
+    }), 200
+
 @bp.route('/classes/<string:class_id>/canvas/import-assignments', methods=['POST'])
 def import_canvas_assignments(class_id):
     """Import assignments from Canvas into the tasks table."""
@@ -262,17 +253,13 @@ def import_canvas_assignments(class_id):
     
     # Get Canvas credentials
     try:
-        user_resp = (supabase.table('users')
-                            .select('canvas_domain, canvas_access_token')
-                            .eq('google_id', google_id)
-                            .single()
-                            .execute())
+        user = load_user(google_id)
         
-        if not user_resp.data:
+        if not user:
             return jsonify({"error": "User not found or not connected to Canvas"}), 404
         
-        token = user_resp.data.get('canvas_access_token')
-        domain = user_resp.data.get('canvas_domain')
+        token = user.get('canvas_access_token')
+        domain = user.get('canvas_domain')
         
         if not token or not domain:
             return jsonify({"error": "Canvas credentials not found"}), 400
@@ -283,76 +270,31 @@ def import_canvas_assignments(class_id):
     
     # Fetch assignments from Canvas to get details
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"{domain}/api/v1/courses/{canvas_course_id}/assignments"
-    params = {"assignment_ids[]": assignment_ids}
-    
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=10)
-        if resp.status_code != 200:
-            logger.warning(f"Canvas API error {resp.status_code}: {resp.text[:200]}")
-            return jsonify({"error": "Canvas API error", "details": resp.text}), resp.status_code
-        
-        canvas_assignments = resp.json()
-        
-    except requests.exceptions.RequestException as e:
-        logger.exception("Network error reaching Canvas")
-        return jsonify({"error": "Could not reach Canvas"}), 502
+        canvas_assignments = fetch_assignments_by_id(domain, headers, canvas_course_id, assignment_ids)
+    except CanvasError as e:
+        return jsonify({"error": str(e), "details": e.details}), e.status_code
     
-    # Insert assignments into tasks table
-    imported_tasks = []
+    # Build one task per selected assignment (Canvas may return the same one twice across pages)
+    requested = set(assignment_ids)
+    task_rows = {}
     for assignment in canvas_assignments:
-        if assignment.get('id') not in assignment_ids:
-            continue
-            
-        # Check if this assignment is already imported - use more careful error handling
-        try:
-            # Convert Canvas assignment ID to string for safety
-            canvas_assignment_id_str = str(assignment.get('id'))
-            
-            # First check if assignment already exists
-            existing_query = (supabase.table('tasks')
-                             .select('id')
-                             .eq('class_id', class_id)
-                             .eq('user_id', google_id)
-                             .eq('canvas_assignment_id', assignment.get('id')))
-            
-            existing_check = existing_query.execute()
-            
-            # Skip if assignment already exists
-            if existing_check and existing_check.data and len(existing_check.data) > 0:
-                logger.info(f"Skipping already imported assignment: {assignment.get('id')}")
-                continue
-                
-        except Exception as e:
-            logger.error(f"Error checking for existing task: {e}")
-            # Don't abort, just log and continue to next assignment
-            continue
-        
-        # Prepare the task data
-        task_data = {
-            'class_id': class_id,
-            'user_id': google_id,
-            'title': assignment.get('name'),
-            'description': assignment.get('description'),
-            'type': 'assignment',
-            'due_date': assignment.get('due_at'),
-            'status': 'pending',
-            'from_canvas': True,
-            'canvas_assignment_id': assignment.get('id'),
-            'canvas_html_url': assignment.get('html_url'),
-            'submission_types': json.dumps(assignment.get('submission_types', [])),
-        }
-        
-        # Insert the task
+        if assignment.get('id') in requested:
+            task_rows[assignment.get('id')] = {**task_from_assignment(class_id, google_id, assignment), 'status': 'pending'}
+    
+    # Insert them in a single upsert; assignments that are already imported are left untouched
+    imported_tasks = []
+    if task_rows:
         try:
-            task_insert = supabase.table('tasks').insert(task_data).execute()
-            if task_insert and task_insert.data:
-                imported_tasks.append(task_insert.data[0])
-            else:
-                logger.warning(f"Task insert returned no data for assignment {assignment.get('id')}")
+            task_insert = (supabase.table('tasks')
+                                   .upsert(list(task_rows.values()),
+                                           on_conflict='user_id,class_id,canvas_assignment_id',
+                                           ignore_duplicates=True)
+                                   .execute())
+            imported_tasks = task_insert.data or []
         except Exception as e:
-            logger.error(f"Error inserting task from Canvas: {e}")
-            # Continue to next assignment instead of aborting
+            logger.error(f"Error inserting tasks from Canvas: {e}")
+            return jsonify({"error": "Database error"}), 500
     
     return jsonify({
         "message": f"Successfully imported {len(imported_tasks)} assignments",
@@ -477,20 +419,18 @@ def get_all_upcoming_assignments():
     
     if not google_id:
         return jsonify({"error": "User identifier (google_id) is required as query parameter"}), 400
+
+    if request.args.get('source') == 'tasks':
+        return _upcoming_assignments_from_tasks(google_id)
     
     # Get Canvas credentials
     try:
-        res = (supabase.table('users')
-                        .select('canvas_domain, canvas_access_token')
-                        .eq('google_id', google_id)
-                        .single()
-                        .execute())
+        row = load_user(google_id)
         
-        if res.data is None:
+        if row is None:
             logger.error(f"Error fetching Canvas credentials for {google_id}")
             return jsonify({"error": "User not found or not connected to Canvas"}), 404
         
-        row = res.data
         token = row.get('canvas_access_token')
         domain = row.get('canvas_domain')
         
@@ -502,94 +442,216 @@ def get_all_upcoming_assignments():
         return jsonify({"error": "Database error"}), 500
     
     headers = {"Authorization": f"Bearer {token}"}
+
+    # Courses and their assignments in a single GraphQL query when the Canvas instance supports it
+    if graphql_available(domain):
+        try:
+            per_course = fetch_upcoming_assignments_graphql(
+                domain, headers, cache_user=google_id, deadline=time.monotonic() + CANVAS_COURSE_DEADLINE
+            )
+            return _course_assignments_response(per_course)
+        except CanvasError as e:
+            logger.warning(f"Canvas GraphQL assignments failed, falling back to REST: {e}")
     
     # First, get all active courses
     try:
-        courses_url = f"{domain}/api/v1/courses"
-        courses_params = {"enrollment_state": "active"}
-        
-        courses = []
-        while courses_url:
-            resp = requests.get(courses_url, headers=headers, params=courses_params, timeout=10)
-            if resp.status_code != 200:
-                logger.warning(f"Canvas API error fetching courses {resp.status_code}: {resp.text[:200]}")
-                return jsonify({"error": "Canvas API error fetching courses",
-                                "details": resp.text}), resp.status_code
-
-            courses.extend(resp.json())
-            courses_url = resp.links.get('next', {}).get('url')
-            courses_params = None
-        
-    except requests.exceptions.RequestException as e:
-        logger.exception("Network error reaching Canvas for courses")
-        return jsonify({"error": "Could not reach Canvas for courses"}), 502
-    
-    # Now fetch assignments from all courses
+        courses = fetch_courses(domain, headers, cache_user=google_id)
+    except CanvasError as e:
+        return jsonify({"error": str(e), "details": e.details}), e.status_code
+    
+    # Now fetch assignments from all courses, concurrently; a failing course is skipped
+    futures = {
+        _course_pool.submit(_fetch_course, domain, headers, course.get('id'), google_id): course
+        for course in courses
+    }
+    if _wants_ndjson():
+        return _stream_course_assignments(futures)
+
+    done, not_done = wait(futures, timeout=CANVAS_ASSIGNMENTS_WAIT)
+
     all_assignments = []
-    
-    for course in courses:
+    failed_courses = []
+    for future, course in futures.items():
         course_id = course.get('id')
         course_name = course.get('name', 'Unknown Course')
-        
+        if future in not_done:
+            logger.error(f"{_timeout_reason(future)} for course {course_id}")
+            failed_courses.append(course_id)
+            continue
         try:
-            assignments_url = f"{domain}/api/v1/courses/{course_id}/assignments"
-            assignments_params = {"bucket": "upcoming", "order_by": "due_at"}
-            
-            assignments = []
-            retry_count = 0
-            max_retries = 2
-            
-            while assignments_url and retry_count <= max_retries:
-                try:
-                    resp = requests.get(assignments_url, headers=headers, params=assignments_params, timeout=10)
-                    
-                    if resp.status_code == 200:
-                        page_assignments = resp.json()
-                        assignments.extend(page_assignments)
-                        assignments_url = resp.links.get('next', {}).get('url')
-                        assignments_params = None
-                        retry_count = 0
-                    else:
-                        logger.warning(f"Canvas API error for course {course_id}: {resp.status_code}: {resp.text[:200]}")
-                        if retry_count < max_retries:
-                            retry_count += 1
-                            logger.info(f"Retrying Canvas API request for course {course_id} (attempt {retry_count}/{max_retries})")
-                            time.sleep(1)
-                        else:
-                            # Log error but continue with other courses
-                            logger.error(f"Failed to fetch assignments for course {course_id} after {max_retries} retries")
-                            break
-                
-                except requests.exceptions.Timeout:
-                    if retry_count < max_retries:
-                        retry_count += 1
-                        logger.info(f"Canvas API request timed out for course {course_id}, retrying (attempt {retry_count}/{max_retries})")
-                        time.sleep(1)
-                    else:
-                        logger.error(f"Canvas API request timed out for course {course_id} after {max_retries} retries")
-                        break
-            
-            # Process and add course assignments
-            for assignment in assignments:
-                processed_assignment = {
-                    "id": assignment.get("id"),
-                    "title": assignment.get("name"),
-                    "description": assignment.get("description"),
-                    "due_date": assignment.get("due_at"),
-                    "html_url": assignment.get("html_url"),
-                    "submission_types": assignment.get("submission_types"),
-                    "points_possible": assignment.get("points_possible"),
-                    "course_id": course_id,
-                    "course_name": course_name
-                }
-                all_assignments.append(processed_assignment)
-        
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Network error fetching assignments for course {course_id}: {e}")
-            # Continue with other courses
+            assignments = future.result()
+        except Exception as e:
+            logger.error(f"Failed to fetch assignments for course {course_id}: {e}")
+            failed_courses.append(course_id)
             continue
-    
+
+        # Process and add course assignments
+        all_assignments.extend(_process_assignment(a, course_id, course_name) for a in assignments)
+
     # Sort assignments by due date (upcoming first)
-    all_assignments.sort(key=lambda x: x['due_date'] if x['due_date'] else '9999-12-31T23:59:59Z')
+    all_assignments.sort(key=_due_date_key)
     
-    return jsonify(all_assignments), 200
\ No newline at end of file
+    response = jsonify(all_assignments)
+    if failed_courses:
+        # The list stays complete for every other course; tell the client which ones are missing
+        response.headers['X-Canvas-Failed-Courses'] = ",".join(str(c) for c in failed_courses)
+    return response, 200
+
+def _assignment_summary(assignment):
+    """The compact list projection of a Canvas assignment: a plain-text excerpt instead of the description HTML."""
+    return {
+        "id": assignment.get("id"),
+        "title": assignment.get("name"),
+        "excerpt": excerpt(assignment.get("description")),
+        "due_date": assignment.get("due_at"),
+        "html_url": assignment.get("html_url"),
+        "submission_types": assignment.get("submission_types"),
+        "points_possible": assignment.get("points_possible")
+    }
+
+def _fetch_course(domain, headers, course_id, google_id):
+    # The deadline starts once a worker picks the course up, not while it waits in the queue
+    return fetch_course_assignments(domain, headers, course_id, time.monotonic() + CANVAS_COURSE_DEADLINE, google_id)
+
+def _timeout_reason(future):
+    """Cancels a course fetch the request stopped waiting for and says why it is missing."""
+    if future.cancel():
+        return "Fetch not started before the request's time limit (all workers busy)"
+    return "Timed out fetching assignments"
+
+def _process_assignment(assignment, course_id, course_name):
+    return {**_assignment_summary(assignment), "course_id": course_id, "course_name": course_name}
+
+def _due_date_key(assignment):
+    return assignment['due_date'] if assignment['due_date'] else '9999-12-31T23:59:59Z'
+
+def _wants_ndjson():
+    """True if the client asked for the streamed feed (?stream=1 or Accept: application/x-ndjson)."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+def _ndjson(record):
+    return json.dumps(record) + "\n"
+
+def _course_assignments_response(per_course):
+    """/canvas/assignments (JSON or NDJSON) from (course, assignments) pairs that are all in already."""
+    all_assignments = []
+    lines = []
+    for course, assignments in per_course:
+        course_id = course.get('id')
+        course_name = course.get('name', 'Unknown Course')
+        processed = [_process_assignment(a, course_id, course_name) for a in assignments]
+        all_assignments.extend(processed)
+        lines.append(_ndjson({"type": "course", "course_id": course_id, "course_name": course_name, "assignments": processed}))
+    all_assignments.sort(key=_due_date_key)
+
+    if not _wants_ndjson():
+        return jsonify(all_assignments), 200
+    lines.append(_ndjson(_summary_record(all_assignments, [])))
+    return _ndjson_response(lambda: iter(lines))
+
+def _summary_record(all_assignments, failed_courses):
+    return {
+        "type": "summary",
+        "order": [a["id"] for a in all_assignments],
+        "count": len(all_assignments),
+        "failed_courses": failed_courses
+    }
+
+def _ndjson_response(generate):
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _stream_course_assignments(futures):
+    """Streams one NDJSON line per course as soon as its fetch finishes, then a summary line
+    with every assignment id in due-date order and the courses that failed."""
+    def generate():
+        all_assignments = []
+        failed_courses = []
+        pending = set(futures)
+        try:
+            try:
+                for future in as_completed(futures, timeout=CANVAS_ASSIGNMENTS_WAIT):
+                    pending.discard(future)
+                    course = futures[future]
+                    course_id = course.get('id')
+                    course_name = course.get('name', 'Unknown Course')
+                    try:
+                        assignments = [_process_assignment(a, course_id, course_name) for a in future.result()]
+                    except Exception as e:
+                        logger.error(f"Failed to fetch assignments for course {course_id}: {e}")
+                        failed_courses.append(course_id)
+                        yield _ndjson({"type": "course_error", "course_id": course_id, "course_name": course_name, "error": str(e)})
+                        continue
+                    all_assignments.extend(assignments)
+                    yield _ndjson({"type": "course", "course_id": course_id, "course_name": course_name, "assignments": assignments})
+            except FuturesTimeoutError:
+                for future in pending:
+                    course = futures[future]
+                    reason = _timeout_reason(future)
+                    logger.error(f"{reason} for course {course.get('id')}")
+                    failed_courses.append(course.get('id'))
+                    yield _ndjson({"type": "course_error", "course_id": course.get('id'),
+                                   "course_name": course.get('name', 'Unknown Course'), "error": reason})
+
+            all_assignments.sort(key=_due_date_key)
+            yield _ndjson(_summary_record(all_assignments, failed_courses))
+        finally:
+            # Timed out courses, or the client went away
+            for future in pending:
+                future.cancel()
+
+    return _ndjson_response(generate)
+
+def _upcoming_assignments_from_tasks(google_id):
+    """The /canvas/assignments response built from tasks kept up to date by canvas_sync, without calling Canvas."""
+    try:
+        res = (supabase.table('tasks')
+                       .select('canvas_assignment_id, title, description, due_date, canvas_html_url, '
+                               'submission_types, points_possible, classes(name, canvas_course_id)')
+                       .eq('user_id', google_id)
+                       .eq('from_canvas', True)
+                       .gte('due_date', datetime.now(timezone.utc).isoformat())
+                       .order('due_date')
+                       .execute())
+    except Exception as e:
+        logger.error(f"Database error fetching synced Canvas tasks: {e}")
+        return jsonify({"error": "Database error"}), 500
+
+    all_assignments = []
+    for task in res.data or []:
+        course = task.get('classes') or {}
+        submission_types = task.get('submission_types')
+        if isinstance(submission_types, str):
+            submission_types = json.loads(submission_types)
+        all_assignments.append({
+            "id": task.get("canvas_assignment_id"),
+            "title": task.get("title"),
+            "excerpt": excerpt(task.get("description")),
+            "due_date": task.get("due_date"),
+            "html_url": task.get("canvas_html_url"),
+            "submission_types": submission_types,
+            "points_possible": task.get("points_possible"),
+            "course_id": course.get("canvas_course_id"),
+            "course_name": course.get("name", "Unknown Course")
+        })
+    return jsonify(all_assignments), 200
+
+@bp.route('/canvas/sync', methods=['POST'])
+def sync_canvas_tasks():
+    """Queues a sync of the user's Canvas assignments into tasks. Returns a job id; poll /jobs/<job_id>."""
+    data = request.json or {}
+    google_id = data.get('google_id')
+    if not google_id:
+        return jsonify({"error": "User identifier (google_id) is required"}), 400
+
+    try:
+        job = enqueue_job('canvas_sync', {"google_id": google_id})
+    except Exception as e:
+        logger.error(f"Error queueing Canvas sync: {e}")
+        return jsonify({"error": "Failed to queue Canvas sync"}), 500
+    return jsonify({"job_id": job["id"], "status": "queued"}), 202
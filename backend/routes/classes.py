@@ -4,6 +4,8 @@ from typing import Optional
 from datetime import datetime
 import logging
 from initdb import supabase
+from authz import get_owned, forget_class
+from user_rows import load_user
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,13 +36,12 @@ def delete_class(google_id):
             return jsonify({"error": "You do not have access to delete this class"}), 403
         
         # First check if the class exists
-        check_resp = supabase.table("classes").select("id").eq('id', class_id).eq('user_id', user_id).execute()
-        
-        if not check_resp.data:
+        if not get_owned("class", class_id, user_id):
             return jsonify({"error": "Class not found"}), 404
             
         # If class exists, proceed with deletion
         resp = supabase.table("classes").delete().eq('user_id', user_id).eq('id', class_id).execute()
+        forget_class(class_id)
         
         # Supabase returns an empty list on successful deletion
         if resp.data is not None:  # Changed from checking resp.error
@@ -105,8 +106,7 @@ def add_classes_batch():
     # Note: If inserts fail due to foreign key constraint, this check isn't strictly necessary
     #       but can provide a clearer error message upfront.
     try:
-        user_check = supabase.table("users").select("google_id").eq("google_id", google_id).limit(1).execute()
-        if not user_check.data:
+        if not load_user(google_id):
              logger.warning(f"Attempt to add classes for non-existent google_id: {google_id}")
              return jsonify({"error": "User not found for the provided google_id"}), 404
     except Exception as e:
@@ -163,9 +163,7 @@ def add_classes_batch():
 def check_class_access(class_id, google_id):
     try:
         # Check if the class exists and belongs to the user
-        resp = supabase.table("classes").select("id").eq("id", class_id).eq("user_id", google_id).maybe_single().execute()
-        
-        if not resp.data:
+        if not get_owned("class", class_id, google_id):
             return jsonify({"has_access": False}), 403
         
         return jsonify({"has_access": True}), 200
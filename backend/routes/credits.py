@@ -4,6 +4,7 @@ from typing import Optional
 from datetime import datetime
 import logging
 from initdb import supabase
+from user_rows import load_user, forget_user
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,8 +19,10 @@ class Credit(BaseModel):
     
 @bp.route('/<string:google_id>/get_credits', methods=['GET'])
 def create_credit(google_id):
-    response = supabase.table("users").select("credits").eq("google_id", google_id).execute()
-    return jsonify({"message": "Credit created", "credits": response.data[0]["credits"]})
+    user = load_user(google_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"message": "Credit created", "credits": user["credits"]})
 
 
 
@@ -37,13 +40,13 @@ def add_credits(google_id):
         return jsonify({"error": "'amount' must be an integer"}), 400
         
     try:
-        # Fetch current credits
-        user_response = supabase.table("users").select("credits").eq("google_id", google_id).single().execute()
+        # Fetch current credits (not from the cache, the new balance is computed from it)
+        user = load_user(google_id, fresh=True)
         
-        if not user_response.data:
+        if not user:
             return jsonify({"error": "User not found"}), 404
 
-        current_credits = user_response.data.get("credits", 0) # Default to 0 if credits column is null
+        current_credits = user.get("credits") or 0 # Default to 0 if credits column is null
 
         if amount == 0:
             return jsonify({"message": "Amount is 0, credits unchanged", "credits": current_credits})
@@ -52,6 +55,7 @@ def add_credits(google_id):
         
         # Update credits
         update_response = supabase.table("users").update({"credits": new_credits}).eq("google_id", google_id).execute()
+        forget_user(google_id)
 
         if not update_response.data: # Check if update was successful and returned data
              logger.error(f"Failed to update credits for user {google_id}: {update_response.error.message if update_response.error else 'No data returned'}")
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, Response, stream_with_context
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone
@@ -8,7 +8,19 @@ import os
 from openai import OpenAI, APIError
 from uuid import UUID, uuid4
 import json
+import base64
+import hashlib
 import requests
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from mutagen.mp3 import MP3
+from llm_cache import cached_chat_completion
+from authz import get_owned, forget_owned
+from mindmap import layout_mindmap, is_mindmap
+from genie_memory import build_context, refresh_summary_async
+from video_renderer import render_video
+from media_store import content_key, find_media, store_media, download_media, public_url
+from job_queue import enqueue_job, attach_chat_message, detach_chat_message, cancel_job, register_job_handler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,6 +37,28 @@ else:
 
 bp = Blueprint('genie', __name__, url_prefix='/genie')
 
+GENIE_CHAT_MODEL = "gpt-3.5-turbo"
+GENIE_SYSTEM_PROMPT = "You are a helpful assistant which helps students learn about some topic."
+
+# resource_type -> background job type that generates the message's content
+RESOURCE_JOB_TYPES = {
+    'mindmap': 'genie_mindmap',
+    'video': 'genie_video',
+}
+
+# Runs the independent pieces of a chat turn (job start) alongside the OpenAI call
+_turn_pool = ThreadPoolExecutor(max_workers=int(os.getenv("GENIE_TURN_WORKERS", "16")), thread_name_prefix="genie-turn")
+
+# Shared by all video generations, so concurrent videos can't flood the TTS endpoint
+_tts_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_WORKERS", "6")), thread_name_prefix="genie-tts")
+
+# Render generated videos to MP4 on the server instead of in the browser (ffmpeg.wasm)
+SERVER_VIDEO_RENDER = os.getenv("SERVER_VIDEO_RENDER", "true").lower() not in ("0", "false", "no")
+
+TTS_MODEL = "tts-1-hd"
+TTS_VOICE = "nova"
+TTS_SPEED = 0.95
+
 # --- Pydantic Models ---
 class ChatMessageBase(BaseModel):
     id: UUID
@@ -38,6 +72,11 @@ class ChatMessageBase(BaseModel):
     class Config:
         orm_mode = True # Allows creating model from ORM objects
 
+# Columns a client may ask for via ?fields=; the required ones are always returned
+MESSAGE_COLUMNS = ["id", "chat_id", "sender", "message_text", "resource_type", "content", "created_at"]
+REQUIRED_MESSAGE_COLUMNS = ["id", "chat_id", "sender", "created_at"]
+MAX_MESSAGES_PAGE = 200
+
 class ChatCreate(BaseModel):
     name: Optional[str] = "New Genie" # Default name
 
@@ -49,15 +88,15 @@ class ChatUpdate(BaseModel):
 
 # --- Helper Function: Check Chat Ownership ---
 def check_chat_ownership(chat_id: str, google_id: str):
-    """Verifies if the user owns the chat."""
+    """Verifies if the user owns the chat (cached, see authz.py)."""
     try:
-        resp = supabase.table("chats").select("id").eq("id", chat_id).eq("user_id", google_id).maybe_single().execute()
-        if not resp.data:
-            abort(403, description="Access denied: You do not own this chat.")
-        return True
+        owned = get_owned("chat", chat_id, google_id)
     except Exception as e:
         logger.error(f"Error checking chat ownership for chat {chat_id} and user {google_id}: {e}")
         abort(500, description="Failed to verify chat ownership.")
+    if not owned:
+        abort(403, description="Access denied: You do not own this chat.")
+    return True
 
 
 @bp.route('/test')
@@ -158,6 +197,7 @@ def delete_chat_session(chat_id):
             .eq("id", chat_id)\
             .eq("user_id", google_id_current_user)\
             .execute()
+        forget_owned("chat", chat_id)
 
         if not response.data:
             # This implies the chat didn't exist or didn't belong to the user.
@@ -171,9 +211,32 @@ def delete_chat_session(chat_id):
         abort(500, description=str(e))
 
 # --- Chat Message Routes ---
+def _encode_cursor(message):
+    """Opaque keyset cursor for a message row: base64 of 'created_at|id'."""
+    return base64.urlsafe_b64encode(f"{message['created_at']}|{message['id']}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        datetime.fromisoformat(created_at)
+        return created_at, str(UUID(message_id))
+    except Exception:
+        abort(400, description="Invalid cursor.")
+
+
 @bp.route('/<string:chat_id>/messages', methods=['GET'])
 def get_chat_messages(chat_id):
-    """Gets all messages for a specific chat session, ordered by creation time."""
+    """Gets messages for a specific chat session, ordered by creation time.
+
+    Without query parameters every message is returned. Optional parameters:
+      - limit: page size (1-200). Without a cursor, returns the latest `limit` messages.
+      - before / after: cursor from X-Before-Cursor / X-After-Cursor of an earlier response;
+        returns messages older / newer than it (keyset on (created_at, id)).
+      - fields: comma separated columns to return, e.g. fields=message_text,resource_type to
+        leave out the (large) content JSON. id, chat_id, sender and created_at are always included.
+    Responses carry an ETag; send it back as If-None-Match to get a 304 if the chat hasn't changed.
+    """
     # Note: google_id for ownership check should ideally come from an auth token
     # For now, we might need to pass it or fetch it if available in session/request context
     # This is a placeholder for where you'd get the current user's google_id
@@ -183,23 +246,191 @@ def get_chat_messages(chat_id):
     # check_chat_ownership(chat_id, google_id_current_user)
     # For now, assuming ownership is handled by frontend or a previous step
 
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if before and after:
+        abort(400, description="Use either 'before' or 'after', not both.")
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= MAX_MESSAGES_PAGE:
+        abort(400, description=f"'limit' must be between 1 and {MAX_MESSAGES_PAGE}.")
+    cursor = _decode_cursor(before or after) if (before or after) else None
+
+    columns = MESSAGE_COLUMNS
+    if request.args.get('fields'):
+        requested = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in MESSAGE_COLUMNS]
+        if unknown:
+            abort(400, description=f"Unknown field(s): {', '.join(unknown)}")
+        columns = [c for c in MESSAGE_COLUMNS if c in requested or c in REQUIRED_MESSAGE_COLUMNS]
+
     try:
-        messages_resp = supabase.table("chat_messages")\
-            .select("id, chat_id, sender, message_text, resource_type, content, created_at")\
-            .eq("chat_id", chat_id)\
-            .order("created_at", desc=False)\
-            .execute()
-        
+        # Every message write bumps chats.updated_at, so it versions the whole chat cheaply
+        chat_resp = supabase.table("chats").select("updated_at").eq("id", chat_id).maybe_single().execute()
+    except Exception as e:
+        logger.error(f"Error fetching chat {chat_id}: {e}")
+        abort(500, description=str(e))
+    if not chat_resp or not chat_resp.data:
+        abort(404, description="Chat session not found.")
+
+    etag = hashlib.sha1(f"{chat_id}|{chat_resp.data['updated_at']}|{request.query_string.decode()}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag)
+        return not_modified
+
+    try:
+        query = supabase.table("chat_messages")\
+            .select(", ".join(columns))\
+            .eq("chat_id", chat_id)
+        if before:
+            created_at, message_id = cursor
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id})')
+        elif after:
+            created_at, message_id = cursor
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{message_id})')
+
+        # Paging backwards (or fetching the latest page) reads newest-first, then flips the page
+        newest_first = bool(before) or (limit is not None and not after)
+        query = query.order("created_at", desc=newest_first).order("id", desc=newest_first)
+        if limit is not None:
+            query = query.limit(limit + 1) # one extra row tells us whether there is more
+        rows = query.execute().data
+
+        has_more = limit is not None and len(rows) > limit
+        if limit is not None:
+            rows = rows[:limit]
+        if newest_first:
+            rows.reverse()
+
         # Validate with Pydantic
-        validated_messages = [ChatMessageBase(**msg) for msg in messages_resp.data]
-        return jsonify([msg.dict() for msg in validated_messages])
+        validated_messages = [ChatMessageBase(**msg).dict(include=set(columns)) for msg in rows]
     except Exception as e:
         logger.error(f"Error fetching messages for chat {chat_id}: {e}")
         abort(500, description=str(e))
 
+    resp = jsonify(validated_messages)
+    resp.set_etag(etag)
+    resp.headers["X-Has-More"] = "true" if has_more else "false"
+    if rows:
+        resp.headers["X-Before-Cursor"] = _encode_cursor(rows[0])
+        resp.headers["X-After-Cursor"] = _encode_cursor(rows[-1])
+    return resp
+
+def _wants_stream(data):
+    """True if the client asked for a streamed reply (?stream=1 or "stream": true in the body)."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return data.get('stream') is True
+
+
+def _sse(event, data):
+    """Formats one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _new_message(chat_id, sender, message_text, resource_type=None, content=None):
+    """Builds a chat_messages row with a client-side id, so a turn can be written in one call."""
+    return {
+        "id": str(uuid4()),
+        "chat_id": chat_id,
+        "sender": sender, # From chat_sender_type ENUM
+        "message_text": message_text,
+        "resource_type": resource_type,
+        "content": content,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def _record_messages(chat_id, messages):
+    """Inserts a turn's messages atomically in a single round trip (record_chat_messages RPC).
+
+    chats.updated_at is maintained by a trigger on chat_messages, so no separate update is needed.
+    """
+    resp = supabase.rpc("record_chat_messages", {"p_chat_id": chat_id, "p_messages": messages}).execute()
+    return resp.data or []
+
+
+def _start_resource_job(user_message_text, resource_type):
+    """Starts the mindmap/video job for a turn, if one was requested. Returns (resource_type_val, job_id)."""
+    job_type = RESOURCE_JOB_TYPES.get(resource_type.lower()) if resource_type else None
+    if not job_type:
+        return None, None
+    job = enqueue_job(job_type, {"prompt": user_message_text}, await_message=True)
+    return resource_type.lower(), job["id"]
+
+
+def _start_turn(chat_id, user_message_text, resource_type):
+    """Starts the resource job and builds the prompt (summary + recent history) concurrently.
+
+    Returns (user message row, OpenAI messages, job future). The user message is only
+    written together with the AI reply, in _finish_turn.
+    """
+    user_message = _new_message(chat_id, "user", user_message_text)
+    job_future = _turn_pool.submit(_start_resource_job, user_message_text, resource_type)
+    try:
+        messages = build_context(chat_id, GENIE_SYSTEM_PROMPT, user_message_text, before=user_message["created_at"])
+    except Exception as e:
+        logger.warning(f"Could not load history for chat {chat_id}, answering without it: {e}")
+        messages = [
+            {"role": "system", "content": GENIE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_message_text}
+        ]
+    return user_message, messages, job_future
+
+
+def _abandon_turn(job_future):
+    """Cancels the turn's resource job (once it has been started)."""
+    def cancel(future):
+        try:
+            _, job_id = future.result()
+        except Exception:
+            return
+        if job_id:
+            cancel_job(job_id)
+    job_future.add_done_callback(cancel)
+
+
+def _finish_turn(chat_id, user_message, ai_message_text, resource_type_val, job_id):
+    """Saves the user's and the AI's message in one call. Returns (AI message dict, saved)
+    where saved is False if the write returned nothing.
+
+    Mindmap and video content is too slow to generate inside the request, so the AI message is
+    saved with placeholder content ({"status": "pending", "job_id": ...}) and the background job
+    fills it in.
+    """
+    content = {"status": "pending", "job_id": job_id} if job_id else None
+    ai_message = _new_message(chat_id, "ai", ai_message_text, resource_type_val, content)
+
+    saved_rows = _record_messages(chat_id, [user_message, ai_message])
+    saved_ai = next((row for row in saved_rows if row["id"] == ai_message["id"]), None)
+    if not saved_ai:
+        logger.error(f"Failed to save chat turn for chat {chat_id}: no rows returned")
+        if job_id:
+            # The job keeps running; the client can still poll /jobs/<job_id> for the result
+            detach_chat_message(job_id)
+        return ChatMessageBase(**ai_message).dict(), False
+
+    if job_id:
+        attach_chat_message(job_id, saved_ai["id"])
+    return ChatMessageBase(**saved_ai).dict(), True
+
+
 @bp.route('/<string:chat_id>/messages', methods=['POST'])
 def post_chat_message(chat_id):
-    """Posts a message to a chat, gets an AI response, and saves both."""
+    """Posts a message to a chat, gets an AI response, and saves both.
+
+    The mindmap/video job and the history lookup start alongside the OpenAI call; both
+    messages are then written in a single atomic call, so a chat is never left half-written.
+    The prompt carries the chat's rolling summary and recent turns (see genie_memory.py).
+
+    With ?stream=1 (or "stream": true in the body) the reply is sent as Server-Sent Events:
+    a `user_message` event, one `token` event per chunk from OpenAI, then a `done` event with
+    the saved AI message (or an `error` event). If the client disconnects mid-stream, the
+    OpenAI stream is closed, the resource job is cancelled and nothing is saved.
+
+    For mindmap/video requests the AI message comes back with pending content right away;
+    poll GET /jobs/<content.job_id> (or re-fetch the messages) until the job completes.
+    """
     if not client:
         abort(503, description="OpenAI client not initialized. Cannot process message.")
 
@@ -209,73 +440,89 @@ def post_chat_message(chat_id):
     
     user_message_text = data["message_text"].strip()
     resource_type = data.get("resource_type", None)
-    content = None
 
-    try:
-        # 1. Save User's Message
-        user_message_db = {
-            "chat_id": chat_id,
-            "sender": "user", # From chat_sender_type ENUM
-            "message_text": user_message_text,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        user_msg_resp = supabase.table("chat_messages").insert(user_message_db).execute()
-        if not user_msg_resp.data:
-            logger.error(f"Failed to save user message for chat {chat_id}: {user_msg_resp.error}")
-            abort(500, description="Could not save user message.")
-
-        # 2. Update chat's updated_at timestamp
-        supabase.table("chats").update({"updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", chat_id).execute()
+    if _wants_stream(data):
+        return _stream_chat_message(chat_id, user_message_text, resource_type)
 
-        # 3. Get AI Response (simple, no history for now)
+    user_message, messages, job_future = _start_turn(chat_id, user_message_text, resource_type)
+    try:
+        # Get AI Response (summary + recent history) while the job starts
         logger.info(f"Sending to OpenAI for chat {chat_id}: '{user_message_text[:50]}...'")
         ai_response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Or your preferred model
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant which helps students learn about some topic."},
-                {"role": "user", "content": user_message_text}
-            ]
+            model=GENIE_CHAT_MODEL,
+            messages=messages
         )
         ai_message_text = ai_response.choices[0].message.content
         logger.info(f"Received from OpenAI for chat {chat_id}: '{ai_message_text[:50]}...'")
 
-        # Only generate mindmap if resource_type is 'mindmap'
-        if resource_type and resource_type.lower() == 'mindmap':
-            content = json.loads(generate_mindmap_for_genie(user_message_text))
-            resource_type_val = 'mindmap'
-        elif resource_type and resource_type.lower() == 'video':
-            # Generate video content
-            content = generate_video_for_genie(user_message_text)
-            resource_type_val = 'video'
-        else:
-            content = None
-            resource_type_val = None
-
-        # 4. Save AI's Message
-        ai_message_db = {
-            "chat_id": chat_id,
-            "sender": "ai", # From chat_sender_type ENUM
-            "message_text": ai_message_text,
-            "content": content,
-            "resource_type": resource_type_val,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        ai_msg_resp = supabase.table("chat_messages").insert(ai_message_db).execute()
-        if not ai_msg_resp.data:
-            logger.error(f"Failed to save AI message for chat {chat_id}: {ai_msg_resp.error}")
-            return jsonify(ChatMessageBase(**ai_message_db, id=None, chat_id=UUID(chat_id)).dict()), 200
+        resource_type_val, job_id = job_future.result()
 
-        validated_ai_message = ChatMessageBase(**ai_msg_resp.data[0])
-        return jsonify(validated_ai_message.dict()), 201
+        # Save both messages (the job fills in mindmap / video content when done)
+        ai_message, saved = _finish_turn(chat_id, user_message, ai_message_text, resource_type_val, job_id)
+        refresh_summary_async(client, chat_id)
+        return jsonify(ai_message), (201 if saved else 200)
 
     except APIError as e:
         logger.error(f"OpenAI API error for chat {chat_id}: {e}")
+        _abandon_turn(job_future)
         abort(502, description=f"AI service error: {str(e)}")
     except Exception as e:
         logger.error(f"Error posting message to chat {chat_id}: {e}")
+        _abandon_turn(job_future)
         abort(500, description=str(e))
 
 
+def _stream_chat_message(chat_id, user_message_text, resource_type):
+    """Streams the AI reply token by token and persists the finished turn at the end."""
+    user_message, messages, job_future = _start_turn(chat_id, user_message_text, resource_type)
+
+    def generate():
+        stream = None
+        finished = False
+        chunks = []
+        try:
+            yield _sse("user_message", ChatMessageBase(**user_message).dict())
+            logger.info(f"Streaming from OpenAI for chat {chat_id}: '{user_message_text[:50]}...'")
+            stream = client.chat.completions.create(
+                model=GENIE_CHAT_MODEL,
+                messages=messages,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield _sse("token", {"text": delta})
+            ai_message_text = "".join(chunks)
+            logger.info(f"Finished streaming from OpenAI for chat {chat_id}: '{ai_message_text[:50]}...'")
+
+            resource_type_val, job_id = job_future.result()
+            ai_message, _ = _finish_turn(chat_id, user_message, ai_message_text, resource_type_val, job_id)
+            refresh_summary_async(client, chat_id)
+            finished = True
+            yield _sse("done", ai_message)
+        except APIError as e:
+            logger.error(f"OpenAI API error while streaming chat {chat_id}: {e}")
+            yield _sse("error", {"status": 502, "description": f"AI service error: {str(e)}"})
+        except Exception as e:
+            logger.error(f"Error streaming message to chat {chat_id}: {e}")
+            yield _sse("error", {"status": 500, "description": str(e)})
+        finally:
+            # Reached without `finished` on errors and when the client disconnects (GeneratorExit)
+            if not finished:
+                if stream is not None:
+                    stream.close()
+                _abandon_turn(job_future)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 
 
 def generate_mindmap_for_genie(user_prompt):
@@ -299,7 +546,10 @@ def generate_mindmap_for_genie(user_prompt):
                 "Do not include any explanations or introductory text outside the final JSON object."
             )
     
-    completion = client.chat.completions.create(
+    mindmap_json_string = cached_chat_completion(
+            client,
+            "genie_mindmap",
+            validate=lambda answer: is_mindmap(json.loads(answer)),
             model="gpt-4o", # Using a potentially stronger model for editing tasks
             response_format={ "type": "json_object" },
             messages=[
@@ -309,17 +559,24 @@ def generate_mindmap_for_genie(user_prompt):
             temperature=0.6, # Slightly higher temp might be good for creative enhancement
             max_tokens=3072 # Allow more tokens for potentially larger combined structures
         )
-
-    mindmap_json_string = completion.choices[0].message.content
-    logger.info("OpenAI response received.")
+    logger.info("Mindmap response received.")
     
     return mindmap_json_string
         
     
 
+def _is_video_script(answer):
+    slides = json.loads(answer).get('slides')
+    return isinstance(slides, list) and bool(slides) and all(
+        isinstance(slide, dict) and slide.get('text') and slide.get('narration') for slide in slides
+    )
+
+
 # Video generation function (moved from video.py for integration)
-def generate_video_for_genie(user_prompt):
+def generate_video_for_genie(user_prompt, report_progress=None):
     """Generate actual video content with slides and synchronized audio"""
+    if report_progress is None:
+        report_progress = lambda percent: None
     if not client:
         abort(500, description="OpenAI client not initialized due to missing API key.")
     
@@ -328,7 +585,10 @@ def generate_video_for_genie(user_prompt):
         
         # Step 1: Generate structured script for slides
         logger.info("Generating video script with slide breakdown...")
-        script_response = client.chat.completions.create(
+        script_json_string = cached_chat_completion(
+            client,
+            "video_script",
+            validate=_is_video_script,
             model="gpt-4o",
             response_format={"type": "json_object"},
             messages=[
@@ -360,51 +620,49 @@ Guidelines:
             ]
         )
         
-        script_data = json.loads(script_response.choices[0].message.content)
+        if not _is_video_script(script_json_string):
+            raise ValueError("Invalid video script from OpenAI.")
+        script_data = json.loads(script_json_string)
         logger.info(f"Generated script with {len(script_data['slides'])} slides")
+        report_progress(40)
         
-        # Step 2: Generate TTS audio for the complete narration
-        logger.info("Generating TTS audio...")
-        full_narration = " ".join([slide['narration'] for slide in script_data['slides']])
-        
-        audio_response = client.audio.speech.create(
-            model="tts-1-hd",
-            voice="nova",
-            input=full_narration,
-            speed=0.95
-        )
-        
-        # Step 3: Upload audio to Supabase
-        job_id = str(uuid4())
-        ensure_video_bucket_exists()
-        
-        audio_filename = f"video_{job_id}_audio.mp3"
-        logger.info(f"Uploading audio: {audio_filename}")
-        
-        upload_response = supabase.storage.from_("generated-videos").upload(
-            audio_filename,
-            audio_response.content,
-            {"contentType": "audio/mpeg"}
-        )
-        
-        if hasattr(upload_response, 'error') and upload_response.error:
-            raise Exception(f"Failed to upload audio: {upload_response.error}")
-        
-        # Get audio URL
-        audio_url = supabase.storage.from_("generated-videos").get_public_url(audio_filename)
-        if isinstance(audio_url, str):
-            audio_public_url = audio_url
+        # Step 2: Narration audio. It is content-addressed by model/voice/speed/narration, so an
+        # identical script reuses the stored audio instead of calling TTS and uploading again.
+        slides = script_data['slides']
+        audio_key = content_key("tts", TTS_MODEL, TTS_VOICE, TTS_SPEED, [slide['narration'] for slide in slides])
+        audio_path = f"audio/{audio_key}.mp3"
+        audio_bytes = None
+
+        stored_audio = find_media(audio_path)
+        stored_durations = (stored_audio or {}).get("metadata", {}).get("durations") or []
+        if len(stored_durations) == len(slides):
+            logger.info(f"Reusing stored narration audio {audio_path}")
+            _set_slide_timings(slides, stored_durations)
+            audio_public_url = public_url(audio_path)
         else:
-            audio_public_url = getattr(audio_url, 'publicUrl', str(audio_url))
+            # Generate TTS audio per slide, in parallel, and time each slide to its real audio
+            logger.info(f"Generating TTS audio for {len(slides)} slides...")
+            audio_bytes, durations = _synthesize_slides(slides)
+            _set_slide_timings(slides, durations)
+
+            # Step 3: Upload audio to Supabase
+            ensure_video_bucket_exists()
+            logger.info(f"Uploading audio: {audio_path}")
+            audio_public_url = store_media(audio_path, audio_bytes, "audio/mpeg", "audio", {"durations": durations})
+
+        report_progress(80)
+        job_id = str(uuid4())
         
-        # Step 4: Return video generation data for frontend processing
-        # The frontend will handle Canvas rendering and ffmpeg.wasm compilation
+        # Step 4: Return video generation data. With SERVER_VIDEO_RENDER the MP4 is rendered
+        # here (see video_renderer.py); otherwise the frontend handles Canvas rendering and
+        # ffmpeg.wasm compilation
         video_content = {
             "video_id": job_id,
             "title": script_data.get("title", "Generated Educational Video"),
             "type": "slide_video",
             "status": "ready_for_compilation",
             "audio_url": audio_public_url,
+            "audio_path": audio_path, # storage path; chat_messages trigger counts references to it
             "slides": script_data['slides'],
             "total_duration": sum(slide.get('duration', 4.0) for slide in script_data['slides']),
             "format": "slide_compilation",
@@ -421,6 +679,21 @@ Guidelines:
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
+        if SERVER_VIDEO_RENDER:
+            report_progress(90)
+            try:
+                video_content["video_url"], video_content["video_path"] = render_video(
+                    video_content["slides"],
+                    video_content["video_settings"],
+                    audio_key,
+                    load_audio=lambda: audio_bytes if audio_bytes is not None else download_media(audio_path)
+                )
+                video_content["status"] = "rendered"
+                video_content["format"] = "mp4"
+            except Exception as render_error:
+                # The slide spec is still usable; the frontend falls back to compiling it
+                logger.error(f"Server-side render failed for video {job_id}: {render_error}")
+
         logger.info(f"Video generation data prepared for job {job_id}")
         return video_content
         
@@ -429,6 +702,46 @@ Guidelines:
         raise
 
 
+def _synthesize_narration(narration):
+    audio_response = client.audio.speech.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=narration,
+        speed=TTS_SPEED
+    )
+    return audio_response.content
+
+
+def _synthesize_slides(slides):
+    """Synthesizes every slide's narration concurrently.
+
+    Returns the concatenated MP3 and each slide's clip length in seconds (None if a clip
+    can't be parsed).
+    """
+    clips = list(_tts_pool.map(_synthesize_narration, [slide['narration'] for slide in slides]))
+
+    durations = []
+    for clip in clips:
+        try:
+            durations.append(round(MP3(BytesIO(clip)).info.length, 3))
+        except Exception as e:
+            logger.warning(f"Could not read TTS clip duration, keeping script estimate: {e}")
+            durations.append(None)
+
+    # MP3 frames are self-contained, so the clips can be joined back to back
+    return b"".join(clips), durations
+
+
+def _set_slide_timings(slides, durations):
+    """Sets each slide's `duration` to its audio length (keeping the script's estimate where
+    unknown) and `start` to its offset in the combined track, so slides stay in sync."""
+    start = 0.0
+    for slide, duration in zip(slides, durations):
+        slide['duration'] = duration if duration is not None else slide.get('duration', 4.0)
+        slide['start'] = round(start, 3)
+        start += slide['duration']
+
+
 def ensure_video_bucket_exists():
     """Helper function to ensure the video bucket exists and is public"""
     try:
@@ -452,6 +765,20 @@ def ensure_video_bucket_exists():
         except Exception as create_error:
             logger.error(f"Failed to create public bucket: {create_error}")
             # Continue anyway - maybe it exists but get_bucket failed
+
+
+# --- Background job handlers ---
+def _mindmap_job(payload, report_progress):
+    # Positions are computed here so the stored message content renders without client-side layout
+    return layout_mindmap(json.loads(generate_mindmap_for_genie(payload["prompt"])))
+
+
+def _video_job(payload, report_progress):
+    return generate_video_for_genie(payload["prompt"], report_progress=report_progress)
+
+
+register_job_handler('genie_mindmap', _mindmap_job)
+register_job_handler('genie_video', _video_job)
         
     
 
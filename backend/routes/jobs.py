@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify, abort
+import logging
+from job_queue import get_job
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+@bp.route('/<string:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Returns the status, progress (0-100) and, once finished, the result or error of a background job."""
+    try:
+        job = get_job(job_id)
+    except Exception as e:
+        logger.error(f"Error fetching job {job_id}: {e}")
+        abort(500, description=str(e))
+    if not job:
+        abort(404, description="Job not found")
+    return jsonify(job)
@@ -9,6 +9,9 @@ import openai
 import os
 import json
 from openai import OpenAI, APIError
+from llm_cache import cached_chat_completion
+from authz import get_owned, forget_owned
+from mindmap import apply_patch, compact_outline, is_mindmap, mindmap_shape_error, layout_mindmap, needs_layout, build_index, subtree, MindmapPatchError, MINDMAP_INDEX_VERSION
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +36,23 @@ if OPENAI_API_KEY:
 else:
     logger.warning("OPENAI_API_KEY not found. OpenAI client not initialized.")
 
+MAX_SUBTREE_NODES = 1000
+
+def _is_mindmap_content(content):
+    return isinstance(content, dict) and isinstance(content.get('nodes'), list)
+
+def _check_mindmap_shape(content):
+    """400 for mindmap content that layout_mindmap/build_index can't handle (e.g. nodes without ids)."""
+    if _is_mindmap_content(content):
+        error = mindmap_shape_error(content)
+        if error:
+            abort(400, description=error)
+
+def _public(row):
+    """Drops server-side columns (the mindmap graph index) from a resource row before returning it."""
+    row.pop('mindmap_index', None)
+    return row
+
 @bp.route('/users/<string:google_id>/resources', methods=['GET'])
 def get_user_resources(google_id):
     class_id = request.args.get('class_id')
@@ -41,7 +61,7 @@ def get_user_resources(google_id):
         if class_id:
             q = q.eq("class_id", class_id)
         resp = q.order("created_at", desc=True).execute()
-        return jsonify(resp.data)
+        return jsonify([_public(row) for row in resp.data])
     except Exception as e:
         logger.error(f"Error fetching resources: {e}")
         abort(500, description=str(e))
@@ -49,14 +69,17 @@ def get_user_resources(google_id):
 @bp.route('/users/<string:google_id>/resources', methods=['POST'])
 def create_resource_route(google_id):
     data = request.get_json()
+    _check_mindmap_shape((data or {}).get('content'))
     try:
         rc = ResourceCreate(**data)
         if rc.user_id != google_id:
             abort(400, description="Path user ID does not match user ID in body")
         d = rc.dict()
         d['class_id'] = str(d['class_id'])
+        if d['type'] == 'Mindmap' and _is_mindmap_content(d['content']):
+            d['mindmap_index'] = build_index(d['content'])
         resp = supabase.table("resources").insert(d).execute()
-        return jsonify(resp.data[0]), 201
+        return jsonify(_public(resp.data[0])), 201
     except Exception as e:
         logger.error(f"Error creating resource: {e}")
         abort(500, description=str(e)) # learned abort instead of return for error handling
@@ -65,13 +88,15 @@ def create_resource_route(google_id):
 def get_all_resources(google_id):
     try:
         resp = supabase.table("resources").select("*").eq("user_id", google_id).order("created_at", desc=True).execute()
-        return jsonify(resp.data)
+        return jsonify([_public(row) for row in resp.data])
     except Exception as e:
         logger.error(f"Error fetching resources: {e}")
         abort(500, description=str(e))
 
 @bp.route('/users/<string:google_id>/resources/<string:resource_id>', methods=['GET'])
 def get_resource_route(google_id, resource_id):
+    # ?mindmap_depth=N returns only the top N levels of a mindmap (see get_mindmap_subtree)
+    mindmap_depth = request.args.get('mindmap_depth', type=int)
     try:
         resp = supabase.table("resources").select("*,classes(name)").eq("id", resource_id).eq("user_id", google_id).maybe_single().execute()
         if not resp.data:
@@ -79,7 +104,9 @@ def get_resource_route(google_id, resource_id):
         data = resp.data
         cls = data.pop('classes', None)
         data['class_name'] = cls.get('name') if cls else None
-        return jsonify(data)
+        if mindmap_depth is not None and data.get('type') == 'Mindmap' and _is_mindmap_content(data.get('content')):
+            data['content'] = subtree(data['content'], _mindmap_index(resource_id, data), depth=max(0, mindmap_depth))
+        return jsonify(_public(data))
     except Exception as e:
         logger.error(f"Error fetching resource: {e}")
         abort(500, description=str(e))
@@ -89,16 +116,21 @@ def update_resource_content(google_id, resource_id):
     data = request.get_json()
     if not data or ('content' not in data and 'name' not in data):
         abort(400, description="Request body must contain 'content' or 'name' field(s).")
+    _check_mindmap_shape(data.get('content'))
 
     try:
-        # Fetch the resource to ensure it exists and belongs to the user
-        resource_resp = supabase.table("resources").select("id, user_id").eq("id", resource_id).eq("user_id", google_id).maybe_single().execute()
-        if not resource_resp.data:
+        # Ensure the resource exists and belongs to the user
+        if not get_owned("resource", resource_id, google_id):
             abort(404, description="Resource not found or access denied.")
 
         update_payload = {}
         if 'content' in data:
             update_payload["content"] = data['content']
+            # Mindmaps saved without positions get a server-side layout (see mindmap.py)
+            if _is_mindmap_content(data['content']):
+                if needs_layout(data['content']):
+                    update_payload["content"] = layout_mindmap(data['content'])
+                update_payload["mindmap_index"] = build_index(update_payload["content"])
         if 'name' in data:
             # Basic validation for name - ensure it's not empty
             if not data['name'] or not isinstance(data['name'], str) or not data['name'].strip():
@@ -122,7 +154,7 @@ def update_resource_content(google_id, resource_id):
                  data = fetch_updated.data
                  cls = data.pop('classes', None)
                  data['class_name'] = cls.get('name') if cls else None
-                 return jsonify(data)
+                 return jsonify(_public(data))
             else:
                  # Should not happen if update was successful, but handle defensively
                  abort(500, description="Failed to retrieve updated resource.")
@@ -145,26 +177,49 @@ def generate_mindmap_route(google_id, resource_id):
     prompt = data.get('prompt')
     existing_nodes = data.get('existing_nodes') # Get existing data
     existing_edges = data.get('existing_edges') # Get existing data
+    enhance_mode = data.get('enhance_mode', 'patch') # 'patch' (model returns only changes) or 'full'
 
     if not prompt:
         abort(400, description="'prompt' field is required.")
+    _check_mindmap_shape({"nodes": existing_nodes, "edges": existing_edges})
 
     try:
         # 1. Verify resource exists and belongs to user
-        resource_resp = supabase.table("resources")\
-            .select("id, user_id, type")\
-            .eq("id", resource_id)\
-            .eq("user_id", google_id)\
-            .maybe_single()\
-            .execute()
+        resource = get_owned("resource", resource_id, google_id)
 
-        if not resource_resp.data:
+        if not resource:
             abort(404, description="Resource not found or access denied.")
-        if resource_resp.data.get('type') != 'Mindmap':
+        if resource.get('type') != 'Mindmap':
              abort(400, description="Resource is not of type Mindmap.")
 
         # 2. Construct OpenAI Prompt based on whether enhancing or generating new
-        if existing_nodes and existing_edges:
+        base_map = None
+        max_tokens = 3072 # Allow more tokens for potentially larger combined structures
+        if existing_nodes and existing_edges and enhance_mode == 'patch':
+            # --- Enhance Existing Mind Map (patch) ---
+            # The model only sees a compact outline and returns the changes, which are applied to the stored map
+            logger.info(f"Enhancing mind map for resource {resource_id} with a patch...")
+            stored = supabase.table("resources").select("content").eq("id", resource_id).maybe_single().execute()
+            base_map = stored.data.get('content') if stored and stored.data else None
+            if not isinstance(base_map, dict) or not base_map.get('nodes'):
+                base_map = {"nodes": existing_nodes, "edges": existing_edges}
+
+            system_prompt = (
+                "You are an expert mind map editor. You will be given an existing mind map as a list of nodes ('id: label') and edges ('source -> target'), and a prompt. "
+                "Decide how to enhance the mind map based on the prompt, and output ONLY the changes as a JSON object with these keys (omit keys you don't need): "
+                "'add_nodes' (array of { id, label } with new unique string ids), "
+                "'update_nodes' (array of { id, label } for existing nodes whose label changes), "
+                "'remove_nodes' (array of existing node ids), "
+                "'add_edges' and 'remove_edges' (arrays of { source, target } node ids). "
+                "Connect every new node to the map with an edge. Do not repeat unchanged nodes or edges. "
+                "Example: { \"add_nodes\": [{ \"id\": \"n1\", \"label\": \"New Concept\" }], \"add_edges\": [{ \"source\": \"2\", \"target\": \"n1\" }] } "
+                "Do not include any explanations or introductory text outside the JSON object."
+            )
+            cache_endpoint = "resource_mindmap_patch"
+            user_content = f"Enhance the following mind map based on this prompt: '{prompt}'\n\n{compact_outline(base_map)}"
+            max_tokens = 1024
+
+        elif existing_nodes and existing_edges:
             # --- Enhance Existing Mind Map --- 
             logger.info(f"Enhancing mind map for resource {resource_id}...")
             system_prompt = (
@@ -181,6 +236,7 @@ def generate_mindmap_route(google_id, resource_id):
             )
             
             existing_structure = json.dumps({"nodes": existing_nodes, "edges": existing_edges}, indent=2)
+            cache_endpoint = "resource_mindmap_enhance"
             user_content = f"Enhance the following mind map based on this prompt: '{prompt}'\n\nExisting Mind Map Structure:\n```json\n{existing_structure}\n```"
 
         else:
@@ -196,10 +252,22 @@ def generate_mindmap_route(google_id, resource_id):
                 "Example edge: { id: 'e1-2', source: '1', target: '2' }"
                 "Do not include any explanations or introductory text outside the JSON object."
             )
+            cache_endpoint = "resource_mindmap"
             user_content = prompt
 
-        # 3. Call OpenAI API
-        completion = client.chat.completions.create(
+        def parse_answer(answer):
+            mindmap_data, applied = json.loads(answer), None
+            if base_map is not None:
+                mindmap_data, applied = apply_patch(base_map, mindmap_data)
+            if not is_mindmap(mindmap_data):
+                raise ValueError("Invalid JSON structure from OpenAI.")
+            return mindmap_data, applied
+
+        # 3. Call OpenAI API (identical requests are answered from the LLM cache; unusable answers aren't cached)
+        mindmap_json_string = cached_chat_completion(
+            client,
+            cache_endpoint,
+            validate=parse_answer,
             model="gpt-4o", # Using a potentially stronger model for editing tasks
             response_format={ "type": "json_object" },
             messages=[
@@ -207,25 +275,31 @@ def generate_mindmap_route(google_id, resource_id):
                 {"role": "user", "content": user_content}
             ],
             temperature=0.6, # Slightly higher temp might be good for creative enhancement
-            max_tokens=3072 # Allow more tokens for potentially larger combined structures
+            max_tokens=max_tokens
         )
 
-        mindmap_json_string = completion.choices[0].message.content
-        logger.info("OpenAI response received.")
+        logger.info("Mindmap response received.")
 
         # 4. Parse and Validate OpenAI response
         try:
-            mindmap_data = json.loads(mindmap_json_string)
-            if not isinstance(mindmap_data, dict) or 'nodes' not in mindmap_data or 'edges' not in mindmap_data:
-                raise ValueError("Invalid JSON structure from OpenAI.")
-            # Add more validation if needed
-        except (json.JSONDecodeError, ValueError) as json_error:
+            mindmap_data, applied = parse_answer(mindmap_json_string)
+            if applied is not None:
+                logger.info(f"Applied mindmap patch to resource {resource_id}: {applied}")
+        except (json.JSONDecodeError, MindmapPatchError, ValueError) as json_error:
             logger.error(f"Failed to parse OpenAI response as valid JSON: {json_error}")
             logger.error(f"Raw OpenAI response: {mindmap_json_string}")
             abort(500, description="Failed to process the generated mind map structure.")
 
-        # 5. Update the resource content in Supabase
-        update_payload = {"content": mindmap_data}
+        # 5. Lay the map out once here so clients can render the stored positions as-is
+        if base_map is not None and not needs_layout(base_map):
+            # Keep the existing arrangement and only place the nodes the patch added
+            base_ids = {str(n['id']) for n in base_map.get('nodes', [])}
+            mindmap_data = layout_mindmap(mindmap_data, new_ids={str(n['id']) for n in mindmap_data['nodes']} - base_ids)
+        else:
+            mindmap_data = layout_mindmap(mindmap_data)
+
+        # 6. Update the resource content in Supabase
+        update_payload = {"content": mindmap_data, "mindmap_index": build_index(mindmap_data)}
         updated = supabase.table("resources")\
             .update(update_payload)\
             .eq("id", resource_id)\
@@ -234,7 +308,7 @@ def generate_mindmap_route(google_id, resource_id):
         if not updated.data:
              abort(500, description="Failed to update resource content after generation.")
 
-        # 6. Return the new content (important for frontend update)
+        # 7. Return the new content (important for frontend update)
         return jsonify(mindmap_data), 200 # Return the newly generated/updated content
 
     except APIError as api_error:
@@ -245,19 +319,55 @@ def generate_mindmap_route(google_id, resource_id):
         # Avoid exposing raw internal errors unless necessary
         abort(500, description="An unexpected error occurred during mind map generation.")
 
-@bp.route('/users/<string:google_id>/resources/<string:resource_id>', methods=['DELETE'])
-def delete_resource_route(google_id, resource_id):
-    logger.info(f"Attempting to delete resource {resource_id} for user {google_id}")
+def _mindmap_index(resource_id, row):
+    """The stored graph index of a mindmap row, building (and saving) it for rows written before indexing."""
+    index = row.get('mindmap_index')
+    if isinstance(index, dict) and index.get('version') == MINDMAP_INDEX_VERSION:
+        return index
+    index = build_index(row['content'])
     try:
-        #  Verify resource exists and belongs to the user before deleting
-        resource_resp = supabase.table("resources")\
-            .select("id, user_id")\
+        supabase.table("resources").update({"mindmap_index": index}).eq("id", resource_id).execute()
+    except Exception as e:
+        logger.warning(f"Failed to store mindmap index for resource {resource_id}: {e}")
+    return index
+
+@bp.route('/users/<string:google_id>/resources/<string:resource_id>/mindmap/subtree', methods=['GET'])
+def get_mindmap_subtree(google_id, resource_id):
+    """Returns part of a mindmap: a node (or the roots) down to `depth` levels, plus the children of `expanded` nodes."""
+    node_id = request.args.get('node_id')
+    depth = request.args.get('depth', default=1, type=int)
+    limit = min(request.args.get('limit', default=200, type=int), MAX_SUBTREE_NODES)
+    expanded = [i for i in request.args.get('expanded', '').split(',') if i]
+    if depth < 0 or limit < 1:
+        abort(400, description="'depth' must be >= 0 and 'limit' >= 1.")
+
+    try:
+        resp = supabase.table("resources")\
+            .select("type, content, mindmap_index")\
             .eq("id", resource_id)\
             .eq("user_id", google_id)\
             .maybe_single()\
             .execute()
+    except Exception as e:
+        logger.error(f"Error fetching mindmap {resource_id}: {e}")
+        abort(500, description=str(e))
+
+    if not resp or not resp.data:
+        abort(404, description="Resource not found or access denied.")
+    if resp.data.get('type') != 'Mindmap' or not _is_mindmap_content(resp.data.get('content')):
+        abort(400, description="Resource is not a Mindmap.")
 
-        if not resource_resp.data:
+    index = _mindmap_index(resource_id, resp.data)
+    if node_id is not None and node_id not in index['depth']:
+        abort(404, description="Node not found in this mindmap.")
+    return jsonify(subtree(resp.data['content'], index, node_id=node_id, depth=depth, expanded=expanded, limit=limit))
+
+@bp.route('/users/<string:google_id>/resources/<string:resource_id>', methods=['DELETE'])
+def delete_resource_route(google_id, resource_id):
+    logger.info(f"Attempting to delete resource {resource_id} for user {google_id}")
+    try:
+        #  Verify resource exists and belongs to the user before deleting
+        if not get_owned("resource", resource_id, google_id):
             logger.warning(f"Resource {resource_id} not found or access denied for user {google_id}.")
             abort(404, description="Resource not found or access denied.")
 
@@ -266,6 +376,7 @@ def delete_resource_route(google_id, resource_id):
             .delete()\
             .eq("id", resource_id)\
             .execute()
+        forget_owned("resource", resource_id)
 
         # Check if deletion was successful (data might be empty even on success depending on client version/config)
         # A more robust check might involve checking affected rows if the client provides it.
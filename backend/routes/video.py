@@ -1,11 +1,16 @@
 from flask import Blueprint, request, jsonify, abort
 import os
+import re
 import uuid
 import json
 import tempfile
 import logging
 from openai import OpenAI, APIError
 from initdb import supabase
+from job_queue import get_job, enqueue_job, register_job_handler
+from video_renderer import render_video
+from media_store import download_media
+from llm_cache import cached_chat_completion
 import requests
 from io import BytesIO
 
@@ -164,15 +169,16 @@ def generate_video_route():
         TEXT:
         {input_text}"""
         
-        completion = client.chat.completions.create(
+        script_text = cached_chat_completion(
+            client,
+            "video_script",
+            validate=lambda answer: bool(answer.strip()),
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful scriptwriter for educational videos."},
                 {"role": "user", "content": script_prompt}
             ]
-        )
-        
-        script_text = completion.choices[0].message.content or ""
+        ) or ""
         logger.info(f"[{job_id}] Script generated successfully.")
 
         if not script_text.strip():
@@ -197,38 +203,83 @@ def generate_video_route():
         logger.error(f"[{job_id}] General error in video generation: {e}")
         abort(500, description=f"Failed to generate video: {str(e)}")
 
-# New route for getting video status (useful for async processing)
+# Narration must be audio this server stored itself (see genie.py), never an arbitrary URL
+AUDIO_PATH_PATTERN = re.compile(r"^audio/[0-9a-f]{64}\.mp3$")
+
+def _render_video_job(payload, report_progress):
+    """Renders the slide spec to an MP4, downloading the narration only if no render exists yet."""
+    audio_path = payload.get("audio_path")
+    if not audio_path or not AUDIO_PATH_PATTERN.match(audio_path):
+        raise ValueError("A stored 'audio_path' is required to render a video.")
+    # Content-addressed audio (audio/<key>.mp3): reuse its key so identical renders are shared
+    audio_key = os.path.splitext(os.path.basename(audio_path))[0]
+
+    def load_audio():
+        audio_bytes = download_media(audio_path)
+        report_progress(20)
+        return audio_bytes
+
+    video_url, video_path = render_video(payload["slides"], payload["video_settings"], audio_key, load_audio)
+    return {"video_url": video_url, "video_path": video_path}
+
+
+register_job_handler('render_video', _render_video_job)
+
+
+@bp.route('/render-video', methods=['POST'])
+def render_video_route():
+    """
+    Render a Genie slide spec (slides, audio_path, video_settings - the content of a
+    video chat message) to an MP4 on the server. Returns a job id; poll /chat/video-status/<job_id>.
+    Settings, slide count and slide durations are clamped to the renderer's limits.
+    """
+    data = request.get_json()
+    if not data or not data.get('slides') or not data.get('audio_path') or not data.get('video_settings'):
+        abort(400, description="'slides', 'audio_path' and 'video_settings' are required.")
+    if not isinstance(data['slides'], list) or not isinstance(data['video_settings'], dict):
+        abort(400, description="'slides' must be a list and 'video_settings' an object.")
+    if not AUDIO_PATH_PATTERN.match(str(data['audio_path'])):
+        abort(400, description="'audio_path' must be a stored narration (audio/<key>.mp3).")
+
+    try:
+        job = enqueue_job('render_video', {
+            "slides": data['slides'],
+            "audio_path": data['audio_path'],
+            "video_settings": data['video_settings']
+        })
+        return jsonify({"job_id": job["id"], "status": "processing"}), 202
+    except Exception as e:
+        logger.error(f"Error queueing video render: {e}")
+        abort(500, description=f"Failed to queue video render: {str(e)}")
+
 @bp.route('/video-status/<string:job_id>', methods=['GET'])
 def get_video_status(job_id):
     """
-    Get the status of a video generation job
-    This is useful if you implement async video processing
+    Get the status of a video generation job.
+    Looks the job up by primary key in the jobs table (see job_queue.py).
     """
     try:
-        # Check if video exists in Supabase Storage
-        video_filename = f"video_{job_id}.mp4"
-        
-        # Try to get the file info
-        file_response = supabase.storage.from_(VIDEO_BUCKET).list(
-            path="",
-            search=video_filename
-        )
-        
-        if file_response and len(file_response) > 0:
-            # Video exists, get public URL
-            url_response = supabase.storage.from_(VIDEO_BUCKET).get_public_url(video_filename)
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"status": "error", "message": "Job not found"}), 404
+
+        if job["status"] == "completed":
+            result = job.get("result") or {}
             return jsonify({
                 "status": "completed",
-                "video_url": url_response['data']['publicUrl']
-            })
-        else:
-            return jsonify({
-                "status": "processing"
+                "progress": 100,
+                "video_url": result.get("video_url"),
+                "result": result
             })
-            
+        if job["status"] == "failed":
+            return jsonify({"status": "error", "message": job.get("error")})
+        if job["status"] == "cancelled":
+            return jsonify({"status": "cancelled"})
+        return jsonify({"status": "processing", "progress": job.get("progress", 0)})
+
     except Exception as e:
         logger.error(f"Error checking video status: {e}")
         return jsonify({
             "status": "error",
             "message": str(e)
-        }), 500 
\ No newline at end of file
+        }), 500
@@ -84,6 +84,12 @@ COMMENT ON COLUMN resources.user_id IS 'Foreign key referencing the google_id in
 COMMENT ON COLUMN resources.type IS 'Type of the resource (flashcards, Mindmap, Text notes).';
 COMMENT ON COLUMN resources.content IS 'JSONB content of the resource, structure depends on the type.';
 
+-- Tree index over mindmap content for subtree paging (see mindmap.build_index)
+ALTER TABLE resources
+ADD COLUMN IF NOT EXISTS mindmap_index JSONB;
+
+COMMENT ON COLUMN resources.mindmap_index IS 'Mindmaps only: roots, parent/children, depth and subtree size per node. Rewritten with content.';
+
 CREATE TABLE IF NOT EXISTS notes (
     id SERIAL PRIMARY KEY,
     user_id VARCHAR(255) NOT NULL,
@@ -131,6 +137,14 @@ CREATE INDEX idx_chats_user_id ON chats(user_id);
 COMMENT ON TABLE chats IS 'Stores individual chat sessions (Genies) initiated by users.';
 COMMENT ON COLUMN chats.name IS 'User-defined name for the chat session.';
 
+-- Rolling conversation summary used to keep Genie prompts bounded (see genie_memory.py)
+ALTER TABLE chats
+ADD COLUMN IF NOT EXISTS summary TEXT,
+ADD COLUMN IF NOT EXISTS summary_through TIMESTAMPTZ;
+
+COMMENT ON COLUMN chats.summary IS 'Rolling summary of the messages that no longer fit in the prompt verbatim.';
+COMMENT ON COLUMN chats.summary_through IS 'created_at of the newest message folded into the summary.';
+
 
 -- Table to store messages within each chat session
 CREATE TABLE chat_messages (
@@ -147,6 +161,7 @@ CREATE TABLE chat_messages (
 -- Indexes for faster lookup of messages
 CREATE INDEX idx_chat_messages_chat_id ON chat_messages(chat_id);
 CREATE INDEX idx_chat_messages_created_at ON chat_messages(created_at DESC); -- For ordering
+CREATE INDEX idx_chat_messages_chat_id_created_at_id ON chat_messages(chat_id, created_at, id); -- Keyset pagination of a chat's messages
 
 COMMENT ON TABLE chat_messages IS 'Stores individual messages exchanged within a chat session.';
 COMMENT ON COLUMN chat_messages.sender IS 'Indicates whether the message is from the user or the AI.';
@@ -154,6 +169,37 @@ COMMENT ON COLUMN chat_messages.message_text IS 'The primary textual content of
 COMMENT ON COLUMN chat_messages.resource_type IS 'Indicates the type of rich content associated with the message, if any.';
 COMMENT ON COLUMN chat_messages.content IS 'JSONB field to store structured data related to the message (e.g., resource details, user input parameters).';
 
+-- Keep chats.updated_at current whenever one of its messages is written
+CREATE OR REPLACE FUNCTION touch_chat_updated_at() RETURNS trigger AS $$
+BEGIN
+    UPDATE chats SET updated_at = timezone('utc'::text, now()) WHERE id = NEW.chat_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER chat_messages_touch_chat
+AFTER INSERT OR UPDATE ON chat_messages
+FOR EACH ROW EXECUTE FUNCTION touch_chat_updated_at();
+
+-- Records a chat turn (user message + AI message, or just one of them) in one atomic call.
+-- p_messages is a JSON array of chat_messages rows; id and created_at are optional.
+CREATE OR REPLACE FUNCTION record_chat_messages(p_chat_id UUID, p_messages JSONB)
+RETURNS SETOF chat_messages AS $$
+    INSERT INTO chat_messages (id, chat_id, sender, message_text, resource_type, content, created_at)
+    SELECT
+        COALESCE((m->>'id')::uuid, gen_random_uuid()),
+        p_chat_id,
+        (m->>'sender')::chat_sender_type,
+        m->>'message_text',
+        (m->>'resource_type')::chat_resource_type,
+        NULLIF(m->'content', 'null'::jsonb),
+        COALESCE((m->>'created_at')::timestamptz, timezone('utc'::text, now()))
+    FROM jsonb_array_elements(p_messages) AS m
+    RETURNING *;
+$$ LANGUAGE sql;
+
+COMMENT ON FUNCTION record_chat_messages IS 'Inserts the messages of a chat turn in a single statement (called via supabase.rpc).';
+
 -- Table to store tasks and assignments
 CREATE TABLE tasks (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -179,6 +225,30 @@ CREATE INDEX idx_tasks_user_id ON tasks(user_id);
 CREATE INDEX idx_tasks_due_date ON tasks(due_date);
 CREATE INDEX idx_tasks_status ON tasks(status);
 
+-- Canvas fields kept up to date by the Canvas sync (see canvas_sync.py)
+ALTER TABLE tasks
+ADD COLUMN IF NOT EXISTS points_possible NUMERIC,
+ADD COLUMN IF NOT EXISTS canvas_updated_at TIMESTAMPTZ;
+
+-- One task per imported Canvas assignment (NULLs don't conflict, so personal tasks are unaffected).
+-- Duplicates from earlier imports are removed first, keeping the oldest task of each assignment.
+DELETE FROM tasks t
+USING tasks older
+WHERE t.canvas_assignment_id IS NOT NULL
+  AND t.user_id = older.user_id
+  AND t.class_id = older.class_id
+  AND t.canvas_assignment_id = older.canvas_assignment_id
+  AND (t.created_at, t.id) > (older.created_at, older.id);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'tasks_user_class_canvas_assignment_key') THEN
+        ALTER TABLE tasks
+        ADD CONSTRAINT tasks_user_class_canvas_assignment_key UNIQUE (user_id, class_id, canvas_assignment_id);
+    END IF;
+END;
+$$;
+
 -- Comments for clarity
 COMMENT ON TABLE tasks IS 'Stores assignments and personal tasks for classes';
 COMMENT ON COLUMN tasks.class_id IS 'Foreign key referencing the id in the classes table';
@@ -191,4 +261,82 @@ COMMENT ON COLUMN tasks.from_canvas IS 'Indicates if the task was imported from
 COMMENT ON COLUMN tasks.canvas_assignment_id IS 'The Canvas assignment ID for imported assignments';
 COMMENT ON COLUMN tasks.canvas_html_url IS 'URL to view the assignment in Canvas';
 COMMENT ON COLUMN tasks.submission_types IS 'Types of submissions accepted for this assignment';
+COMMENT ON COLUMN tasks.canvas_updated_at IS 'Last Canvas updated_at written by the Canvas sync; newer assignments are rewritten';
+
+
+
+-- Background jobs (video / mindmap generation), see job_queue.py
+CREATE TYPE job_status AS ENUM ('queued', 'running', 'completed', 'failed', 'cancelled');
+
+CREATE TABLE jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    type TEXT NOT NULL, -- e.g. 'genie_video', 'genie_mindmap'
+    status job_status NOT NULL DEFAULT 'queued',
+    progress INT NOT NULL DEFAULT 0 CHECK (progress BETWEEN 0 AND 100),
+    payload JSONB, -- Input for the job handler
+    result JSONB, -- Output of the job handler once completed
+    error TEXT, -- Error message if the job failed
+    chat_message_id UUID REFERENCES chat_messages(id) ON DELETE CASCADE, -- Placeholder message filled in on completion
+    created_at TIMESTAMPTZ DEFAULT timezone('utc'::text, now()),
+    updated_at TIMESTAMPTZ DEFAULT timezone('utc'::text, now()),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX idx_jobs_status ON jobs(status);
+CREATE INDEX idx_jobs_chat_message_id ON jobs(chat_message_id);
+
+COMMENT ON TABLE jobs IS 'Background generation jobs run by the backend worker pool.';
+COMMENT ON COLUMN jobs.progress IS 'Progress of the job in percent (0-100).';
+COMMENT ON COLUMN jobs.chat_message_id IS 'AI chat message whose content is replaced with the job result when it finishes.';
+
+
+-- Content-addressed generated media (TTS audio, rendered videos), see media_store.py
+CREATE TABLE media_objects (
+    path TEXT PRIMARY KEY, -- Object path in the generated-videos bucket, e.g. 'audio/<sha256>.mp3'
+    kind TEXT NOT NULL, -- 'audio' or 'video'
+    size_bytes BIGINT,
+    metadata JSONB DEFAULT '{}'::jsonb, -- e.g. per-slide durations of narration audio
+    ref_count INT NOT NULL DEFAULT 0, -- Number of chat messages referencing the object
+    created_at TIMESTAMPTZ DEFAULT timezone('utc'::text, now()),
+    last_used_at TIMESTAMPTZ DEFAULT timezone('utc'::text, now())
+);
+
+CREATE INDEX idx_media_objects_unreferenced ON media_objects(last_used_at) WHERE ref_count <= 0;
+
+COMMENT ON TABLE media_objects IS 'Generated media stored once per distinct input, with reference counts for safe cleanup.';
+COMMENT ON COLUMN media_objects.ref_count IS 'Maintained by the chat_messages_count_media trigger from content.audio_path / content.video_path.';
+
+-- Keep media_objects.ref_count in step with the chat messages that reference each object
+CREATE OR REPLACE FUNCTION count_media_references() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE media_objects SET ref_count = ref_count - 1
+        WHERE path IN (OLD.content->>'audio_path', OLD.content->>'video_path');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE media_objects SET ref_count = ref_count + 1, last_used_at = timezone('utc'::text, now())
+        WHERE path IN (NEW.content->>'audio_path', NEW.content->>'video_path');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER chat_messages_count_media
+AFTER INSERT OR UPDATE OF content OR DELETE ON chat_messages
+FOR EACH ROW EXECUTE FUNCTION count_media_references();
+
+
+-- Per-course progress of the background Canvas sync, see canvas_sync.py
+CREATE TABLE canvas_sync_state (
+    user_id VARCHAR NOT NULL REFERENCES users(google_id) ON DELETE CASCADE,
+    class_id UUID NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    canvas_course_id INT8,
+    high_water_mark TIMESTAMPTZ, -- Newest Canvas updated_at seen among the course's assignments
+    assignment_count INT, -- Number of assignments in the course at the last sync
+    last_synced_at TIMESTAMPTZ,
+    last_error TEXT,
+    PRIMARY KEY (user_id, class_id)
+);
 
+COMMENT ON TABLE canvas_sync_state IS 'High-water marks that let the Canvas sync skip courses with no new or changed assignments.';
@@ -0,0 +1,192 @@
+"""Compares the GraphQL and REST paths of canvas_client on the same Canvas data.
+
+Run from backend/:
+
+    python scripts/check_canvas_graphql.py
+        against a local Canvas stand-in that serves the same fixtures over REST (with Canvas'
+        bucket=upcoming semantics) and GraphQL (paged, with local-offset timestamps)
+
+    python scripts/check_canvas_graphql.py --domain https://school.instructure.com --token TOKEN
+        against a real Canvas instance, before turning on CANVAS_GRAPHQL there
+
+Exits non-zero if the course lists or the upcoming assignments differ.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import canvas_client # noqa: E402
+
+STANDIN_PAGE_SIZE = 10 # smaller than CANVAS_PER_PAGE, so GraphQL pagination is exercised
+LOCAL_OFFSET = timezone(timedelta(hours=-6))
+
+
+def _iso(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if dt else None
+
+
+def _fixtures(now):
+    """Two available courses and one concluded one; assignments due in the past, this week,
+    later than a week out and never, relative to `now` so the check is the same any day."""
+    courses = [
+        {"id": 101, "name": "Biology", "course_code": "BIO1", "workflow_state": "available"},
+        {"id": 102, "name": "Chemistry", "course_code": "CHEM2", "workflow_state": "available"},
+        {"id": 103, "name": "Old Course", "course_code": "OLD", "workflow_state": "completed"},
+    ]
+    due_offsets = {
+        101: [timedelta(hours=6 * i) for i in range(25)] + [-timedelta(days=1), timedelta(days=8), None],
+        102: [timedelta(days=2), timedelta(days=30), -timedelta(hours=1)],
+        103: [timedelta(days=1)],
+    }
+    assignments = {}
+    for course_id, offsets in due_offsets.items():
+        assignments[course_id] = [
+            {
+                "id": course_id * 1000 + i,
+                "name": f"Assignment {i}",
+                "description": f"<p>Assignment {i}</p>",
+                "due_at": _iso(now + offset + timedelta(minutes=1)) if offset is not None else None,
+                "html_url": f"https://canvas.example/courses/{course_id}/assignments/{course_id * 1000 + i}",
+                "points_possible": 10.0,
+                "submission_types": ["online_upload"],
+                "updated_at": _iso(now - timedelta(days=3)),
+            }
+            for i, offset in enumerate(offsets)
+        ]
+    return courses, assignments
+
+
+def _graphql_assignment(a):
+    due_at = datetime.fromisoformat(a["due_at"].replace("Z", "+00:00")).astimezone(LOCAL_OFFSET) if a["due_at"] else None
+    return {
+        "_id": str(a["id"]),
+        "name": a["name"],
+        "description": a["description"],
+        "dueAt": due_at.isoformat() if due_at else None,
+        "htmlUrl": a["html_url"],
+        "pointsPossible": a["points_possible"],
+        "submissionTypes": [t.upper() for t in a["submission_types"]],
+        "updatedAt": a["updated_at"],
+    }
+
+
+def start_standin(now):
+    """Serves the fixtures on a local port. Returns the domain URL."""
+    courses, assignments = _fixtures(now)
+
+    def connection(course_id, after, first):
+        start = int(after or 0)
+        page = assignments[course_id][start:start + first]
+        return {
+            "nodes": [_graphql_assignment(a) for a in page],
+            "pageInfo": {"hasNextPage": start + first < len(assignments[course_id]), "endCursor": str(start + first)},
+        }
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body, status=200, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/api/v1/courses":
+                return self._send([c for c in courses if c["workflow_state"] == "available"])
+            course_id = int(url.path.split("/")[-2])
+            rows = assignments[course_id]
+            if query.get("bucket") == ["upcoming"]:
+                # Canvas: due between now and a week from now
+                start, end = _iso(datetime.now(timezone.utc)), _iso(datetime.now(timezone.utc) + timedelta(days=7))
+                rows = [a for a in rows if a["due_at"] and start <= a["due_at"] <= end]
+            rows = sorted(rows, key=lambda a: (a["due_at"] is None, a["due_at"] or ""))
+            per_page = int(query.get("per_page", ["10"])[0])
+            page = int(query.get("page", ["1"])[0])
+            headers = {}
+            if page * per_page < len(rows):
+                headers["Link"] = f'<{domain}{url.path}?bucket=upcoming&order_by=due_at&per_page={per_page}&page={page + 1}>; rel="next"'
+            return self._send(rows[(page - 1) * per_page:page * per_page], headers=headers)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            query, variables = body["query"], body.get("variables") or {}
+            first = min(variables.get("first", STANDIN_PAGE_SIZE), STANDIN_PAGE_SIZE)
+            if "MoreAssignments" in query:
+                course = {"assignmentsConnection": connection(int(variables["courseId"]), variables.get("after"), first)}
+                return self._send({"data": {"course": course}})
+            nodes = [
+                {"_id": str(c["id"]), "name": c["name"], "courseCode": c["course_code"], "state": c["workflow_state"]}
+                for c in courses
+            ]
+            if "CourseAssignments" in query:
+                for node in nodes:
+                    node["assignmentsConnection"] = connection(int(node["_id"]), None, first)
+            return self._send({"data": {"allCourses": nodes}})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    domain = f"http://127.0.0.1:{server.server_port}"
+    return domain
+
+
+def compare(domain, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    problems = []
+
+    rest_courses = canvas_client.fetch_courses(domain, headers)
+    graphql_courses = canvas_client.fetch_courses_graphql(domain, headers)
+    ids = lambda cs: sorted(c["id"] for c in cs)
+    if ids(rest_courses) != ids(graphql_courses):
+        problems.append(f"courses differ: REST {ids(rest_courses)}, GraphQL {ids(graphql_courses)}")
+
+    fields = ("id", "name", "due_at", "html_url", "points_possible", "submission_types")
+    shape = lambda assignments: [{k: a.get(k) for k in fields} for a in assignments]
+    graphql_by_course = {course["id"]: assignments for course, assignments in
+                         canvas_client.fetch_upcoming_assignments_graphql(domain, headers)}
+    for course in rest_courses:
+        rest = shape(canvas_client.fetch_course_assignments(domain, headers, course["id"]))
+        graphql = shape(graphql_by_course.get(course["id"], []))
+        if rest != graphql:
+            problems.append(f"course {course['id']}: REST has {len(rest)} upcoming assignments, GraphQL {len(graphql)}")
+            for a, b in zip(rest, graphql):
+                if a != b:
+                    problems.append(f"  first difference: REST {a} vs GraphQL {b}")
+                    break
+        else:
+            print(f"course {course['id']}: {len(rest)} upcoming assignments match")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--domain", help="Canvas base URL (default: a local stand-in)")
+    parser.add_argument("--token", help="Canvas access token for --domain")
+    args = parser.parse_args()
+    if args.domain and not args.token:
+        parser.error("--domain needs --token")
+
+    domain = args.domain.rstrip("/") if args.domain else start_standin(datetime.now(timezone.utc))
+    problems = compare(domain, args.token or "standin-token")
+    for problem in problems:
+        print(problem)
+    print("GraphQL and REST agree" if not problems else "GraphQL and REST differ")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+from flask import g, has_request_context
+from initdb import supabase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared loader for the users columns that request handlers need (Canvas credentials, Google
+# tokens, credits). Within a request each user row is read at most once and kept on flask.g;
+# across requests rows are kept for USER_CACHE_TTL seconds. Anything that writes these
+# columns (/canvas/connect, /oauth2callback, token refreshes, credit changes) calls
+# forget_user. Missing users are not cached.
+
+USER_ROW_COLUMNS = (
+    "google_id, credits, canvas_domain, canvas_access_token, "
+    "google_refresh_token, google_access_token, google_token_expiry"
+)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30")) # seconds
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "5000"))
+
+_lock = threading.Lock()
+_cache = OrderedDict() # google_id -> (expires_at, row)
+
+
+def _request_rows():
+    if not has_request_context():
+        return None
+    if "user_rows" not in g:
+        g.user_rows = {}
+    return g.user_rows
+
+
+def _cache_get(google_id):
+    with _lock:
+        entry = _cache.get(google_id)
+        if entry is None:
+            return None
+        expires_at, row = entry
+        if expires_at <= time.time():
+            del _cache[google_id]
+            return None
+        _cache.move_to_end(google_id)
+        return row
+
+
+def _cache_put(google_id, row):
+    with _lock:
+        _cache[google_id] = (time.time() + USER_CACHE_TTL, row)
+        _cache.move_to_end(google_id)
+        while len(_cache) > USER_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def load_user(google_id, fresh=False):
+    """Returns the user's row (USER_ROW_COLUMNS) or None if there is no such user.
+
+    fresh=True skips the cross-request cache (for read-modify-write such as credits) but
+    still reuses a row already read in this request. Database errors propagate.
+    """
+    rows = _request_rows()
+    if rows is not None and google_id in rows:
+        return rows[google_id]
+
+    row = None if fresh else _cache_get(google_id)
+    if row is None:
+        resp = supabase.table("users").select(USER_ROW_COLUMNS).eq("google_id", google_id).maybe_single().execute()
+        row = resp.data if resp else None
+        if row:
+            _cache_put(google_id, row)
+
+    if rows is not None:
+        rows[google_id] = row
+    return row
+
+
+def forget_user(google_id):
+    """Drops the cached row after the user's credentials or credits change."""
+    with _lock:
+        _cache.pop(google_id, None)
+    rows = _request_rows()
+    if rows is not None:
+        rows.pop(google_id, None)
@@ -0,0 +1,224 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import logging
+import os
+import subprocess
+import tempfile
+from media_store import content_key, find_media, store_media, public_url
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Server-side renderer for Genie slide videos.
+# Turns the slide spec produced by generate_video_for_genie (slides + narration audio +
+# video_settings) into an MP4: each slide is drawn with Pillow and the stills are muxed with
+# the audio by ffmpeg. Rendering is CPU bound, so it runs in a process pool. Results are
+# content-addressed by a hash of the spec (see media_store.py) and stored in the
+# generated-videos bucket; the local file in static/generated_videos only lives until it is
+# uploaded, so media cleanup of the bucket object leaves nothing behind on disk.
+
+RENDER_DIR = os.path.join(os.path.dirname(__file__), "static", "generated_videos")
+VIDEO_RENDER_WORKERS = int(os.getenv("VIDEO_RENDER_WORKERS", "2"))
+
+_pool = None
+
+FONT_CANDIDATES = {
+    "arial": ["arial.ttf", "Arial.ttf", "/Library/Fonts/Arial.ttf"],
+    "sans-serif": ["DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"],
+}
+
+
+def _get_pool():
+    # Created lazily so importing this module (e.g. in pool children) doesn't spawn processes
+    global _pool
+    if _pool is None:
+        # spawn, not fork: forking a multi-threaded Flask process can copy locks (e.g. logging's) held by other threads
+        _pool = ProcessPoolExecutor(max_workers=VIDEO_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+# Bounds for client-supplied specs, so a single render can't tie up the pool
+MAX_SLIDES = 60
+MAX_SLIDE_TEXT = 2000 # characters
+SLIDE_DURATION_RANGE = (0.5, 60.0) # seconds
+SETTING_RANGES = {
+    "width": (160, 1920),
+    "height": (120, 1080),
+    "fps": (1, 60),
+    "font_size": (8, 200),
+}
+DEFAULT_SETTINGS = {
+    "width": 1280,
+    "height": 720,
+    "fps": 30,
+    "background_color": "#000000",
+    "text_color": "#FFFFFF",
+    "font_family": "Arial, sans-serif",
+    "font_size": 48,
+    "text_align": "center",
+}
+
+
+def _clamp(value, bounds, default):
+    low, high = bounds
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    if value != value: # NaN
+        return default
+    return min(max(value, low), high)
+
+
+def normalize_spec(slides, video_settings):
+    """Slides and settings limited to what the renderer accepts (MAX_SLIDES, SETTING_RANGES, ...)."""
+    settings = dict(DEFAULT_SETTINGS)
+    for name, bounds in SETTING_RANGES.items():
+        settings[name] = int(_clamp((video_settings or {}).get(name), bounds, DEFAULT_SETTINGS[name]))
+    for name in ("background_color", "text_color", "font_family", "text_align"):
+        value = (video_settings or {}).get(name)
+        if isinstance(value, str) and value:
+            settings[name] = value[:64]
+    clean_slides = [
+        {
+            "text": str(slide.get("text", ""))[:MAX_SLIDE_TEXT],
+            "duration": _clamp(slide.get("duration", 4.0), SLIDE_DURATION_RANGE, 4.0),
+        }
+        for slide in slides[:MAX_SLIDES] if isinstance(slide, dict)
+    ]
+    return clean_slides, settings
+
+
+def render_key(slides, audio_key, video_settings):
+    """Hash of everything that affects the rendered file. audio_key identifies the narration audio."""
+    return content_key(
+        "render",
+        [{"text": s.get("text", ""), "duration": s.get("duration", 4.0)} for s in slides],
+        audio_key,
+        video_settings
+    )
+
+
+def _load_font(font_family, size):
+    from PIL import ImageFont
+    for family in [f.strip().lower() for f in font_family.split(",")] + ["sans-serif"]:
+        for candidate in FONT_CANDIDATES.get(family, []):
+            try:
+                return ImageFont.truetype(candidate, size)
+            except OSError:
+                continue
+    return ImageFont.load_default(size=size)
+
+
+def _wrap_text(draw, text, font, max_width):
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}".strip()
+            if line and draw.textlength(candidate, font=font) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _draw_slide(text, settings, path):
+    from PIL import Image, ImageDraw
+    width, height = settings["width"], settings["height"]
+    image = Image.new("RGB", (width, height), settings.get("background_color", "#000000"))
+    draw = ImageDraw.Draw(image)
+    font = _load_font(settings.get("font_family", "sans-serif"), settings.get("font_size", 48))
+
+    lines = _wrap_text(draw, text, font, width * 0.8)
+    line_height = int(settings.get("font_size", 48) * 1.3)
+    y = (height - line_height * len(lines)) / 2
+    for line in lines:
+        line_width = draw.textlength(line, font=font)
+        if settings.get("text_align", "center") == "center":
+            x = (width - line_width) / 2
+        else:
+            x = width * 0.1
+        draw.text((x, y), line, font=font, fill=settings.get("text_color", "#FFFFFF"))
+        y += line_height
+    image.save(path)
+
+
+def _render_mp4(slides, audio_bytes, settings, out_path):
+    """Runs in a pool process: draws the slides and muxes them with the audio into out_path."""
+    import imageio_ffmpeg
+
+    with tempfile.TemporaryDirectory() as workdir:
+        concat_lines = []
+        for index, slide in enumerate(slides):
+            frame = os.path.join(workdir, f"slide_{index}.png")
+            _draw_slide(slide.get("text", ""), settings, frame)
+            concat_lines.append(f"file '{frame}'")
+            concat_lines.append(f"duration {float(slide.get('duration', 4.0)):.3f}")
+        # The concat demuxer ignores the last duration unless the final file is repeated
+        concat_lines.append(concat_lines[-2])
+
+        concat_path = os.path.join(workdir, "slides.txt")
+        with open(concat_path, "w") as f:
+            f.write("\n".join(concat_lines) + "\n")
+        audio_path = os.path.join(workdir, "narration.mp3")
+        with open(audio_path, "wb") as f:
+            f.write(audio_bytes)
+
+        # Same directory as out_path so the final rename is atomic
+        tmp_out = f"{os.path.splitext(out_path)[0]}.{os.getpid()}.tmp.mp4"
+        subprocess.run([
+            imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", concat_path,
+            "-i", audio_path,
+            "-vf", f"fps={settings.get('fps', 30)},format=yuv420p",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+            "-c:a", "aac", "-b:a", "128k",
+            "-shortest", "-movflags", "+faststart",
+            tmp_out
+        ], check=True, capture_output=True)
+        # Concurrent renders of the same spec never expose a partial file
+        os.replace(tmp_out, out_path)
+    return out_path
+
+
+def render_video(slides, video_settings, audio_key, load_audio):
+    """Renders (or reuses an existing render of) a slide video.
+
+    load_audio() returns the narration bytes and is only called if a render is needed.
+    Returns (public URL, storage path).
+    """
+    slides, video_settings = normalize_spec(slides, video_settings)
+    key = render_key(slides, audio_key, video_settings)
+    path = f"rendered/{key}.mp4"
+    local_path = os.path.join(RENDER_DIR, f"{key}.mp4")
+
+    if find_media(path):
+        logger.info(f"Reusing stored render {key}")
+        return public_url(path), path
+
+    if not os.path.exists(local_path):
+        os.makedirs(RENDER_DIR, exist_ok=True)
+        logger.info(f"Rendering video {key} ({len(slides)} slides)...")
+        _get_pool().submit(_render_mp4, slides, load_audio(), video_settings, local_path).result()
+
+    try:
+        with open(local_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        # A concurrent render of the same spec uploaded it and removed the file meanwhile
+        if find_media(path):
+            logger.info(f"Reusing stored render {key}")
+            return public_url(path), path
+        raise
+    url = store_media(path, data, "video/mp4", "video", {"slides": len(slides)})
+    # The bucket copy is the one served and cleaned up; a failed upload keeps the file for the next attempt
+    try:
+        os.remove(local_path)
+    except OSError:
+        pass
+    logger.info(f"Rendered video {key}")
+    return url, path
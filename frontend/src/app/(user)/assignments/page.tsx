@@ -2,7 +2,10 @@
 
 import React, { useState, useEffect } from "react";
 import { useAuth } from "@/context/AuthContext";
-import { getAllUpcomingAssignments } from "@/services/canvas";
+import {
+  getCanvasAssignmentDetail,
+  streamUpcomingAssignments,
+} from "@/services/canvas";
 import { CanvasAssignment } from "@/types/assignment";
 
 const AssignmentsPage: React.FC = () => {
@@ -10,6 +13,10 @@ const AssignmentsPage: React.FC = () => {
   const [assignments, setAssignments] = useState<CanvasAssignment[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  // Full descriptions are only fetched when an assignment is expanded, keyed like the list items
+  const [descriptions, setDescriptions] = useState<Record<string, string>>({});
+  const [expanded, setExpanded] = useState<string | null>(null);
+  const [loadingDetail, setLoadingDetail] = useState<string | null>(null);
 
   useEffect(() => {
     const fetchAssignments = async () => {
@@ -22,10 +29,11 @@ const AssignmentsPage: React.FC = () => {
       setError(null);
 
       try {
-        const assignmentsData = await getAllUpcomingAssignments(
-          firebaseUser.uid
-        );
-        setAssignments(assignmentsData);
+        // Render as soon as the first course arrives
+        await streamUpcomingAssignments(firebaseUser.uid, (assignmentsData) => {
+          setAssignments(assignmentsData);
+          setIsLoading(false);
+        });
       } catch (err: any) {
         console.error("Failed to fetch assignments:", err);
         setError(err.message || "Failed to fetch assignments");
@@ -37,6 +45,34 @@ const AssignmentsPage: React.FC = () => {
     fetchAssignments();
   }, [firebaseUser, isCanvasIntegrated]);
 
+  const toggleDescription = async (assignment: CanvasAssignment) => {
+    const key = `${assignment.course_id}-${assignment.id}`;
+    if (expanded === key) {
+      setExpanded(null);
+      return;
+    }
+    setExpanded(key);
+    if (key in descriptions || !firebaseUser) return;
+
+    setLoadingDetail(key);
+    try {
+      const detail = await getCanvasAssignmentDetail(
+        firebaseUser.uid,
+        assignment.course_id,
+        assignment.id
+      );
+      setDescriptions((prev) => ({
+        ...prev,
+        [key]: detail.description_text || "",
+      }));
+    } catch (err: any) {
+      console.error("Failed to fetch assignment description:", err);
+      setExpanded(null);
+    } finally {
+      setLoadingDetail(null);
+    }
+  };
+
   const formatDueDate = (dueDateString: string | null): string => {
     if (!dueDateString) return "No due date";
 
@@ -160,90 +196,107 @@ const AssignmentsPage: React.FC = () => {
         </div>
       ) : (
         <div className="space-y-4">
-          {assignments.map((assignment) => (
-            <div
-              key={`${assignment.course_id}-${assignment.id}`}
-              className="bg-gray-800/70 p-6 rounded-lg shadow-lg border border-gray-700 hover:shadow-indigo-500/20 hover:border-indigo-600/50 transition-all duration-300"
-            >
-              <div className="flex flex-col md:flex-row md:items-start md:justify-between">
-                <div className="flex-1 mb-4 md:mb-0 md:mr-6">
-                  <div className="flex items-start justify-between mb-2">
-                    <h3 className="text-xl font-semibold text-white mb-1">
-                      {assignment.title}
-                    </h3>
-                    {assignment.points_possible && (
-                      <span className="text-sm text-gray-400 ml-2 flex-shrink-0">
-                        {assignment.points_possible} pts
-                      </span>
-                    )}
-                  </div>
-
-                  <p className="text-sm text-indigo-300 mb-2">
-                    {assignment.course_name}
-                  </p>
-
-                  {assignment.description && (
-                    <div
-                      className="text-sm text-gray-300 mb-3 line-clamp-3"
-                      dangerouslySetInnerHTML={{
-                        __html:
-                          assignment.description
-                            .replace(/<[^>]*>/g, "")
-                            .substring(0, 150) +
-                          (assignment.description.length > 150 ? "..." : ""),
-                      }}
-                    />
-                  )}
-
-                  {assignment.submission_types &&
-                    assignment.submission_types.length > 0 && (
-                      <div className="flex flex-wrap gap-2 mb-3">
-                        {assignment.submission_types.map((type) => (
-                          <span
-                            key={type}
-                            className="px-2 py-1 text-xs bg-gray-700 text-gray-300 rounded"
-                          >
-                            {type.replace("_", " ")}
-                          </span>
-                        ))}
-                      </div>
-                    )}
-                </div>
+          {assignments.map((assignment) => {
+            const key = `${assignment.course_id}-${assignment.id}`;
+            const isExpanded = expanded === key && key in descriptions;
+            return (
+              <div
+                key={key}
+                className="bg-gray-800/70 p-6 rounded-lg shadow-lg border border-gray-700 hover:shadow-indigo-500/20 hover:border-indigo-600/50 transition-all duration-300"
+              >
+                <div className="flex flex-col md:flex-row md:items-start md:justify-between">
+                  <div className="flex-1 mb-4 md:mb-0 md:mr-6">
+                    <div className="flex items-start justify-between mb-2">
+                      <h3 className="text-xl font-semibold text-white mb-1">
+                        {assignment.title}
+                      </h3>
+                      {assignment.points_possible && (
+                        <span className="text-sm text-gray-400 ml-2 flex-shrink-0">
+                          {assignment.points_possible} pts
+                        </span>
+                      )}
+                    </div>
 
-                <div className="flex flex-col items-end space-y-3">
-                  <div className="text-right">
-                    <p
-                      className={`text-sm font-medium ${getDueDateColor(
-                        assignment.due_date
-                      )}`}
-                    >
-                      {formatDueDate(assignment.due_date)}
+                    <p className="text-sm text-indigo-300 mb-2">
+                      {assignment.course_name}
                     </p>
-                    {assignment.due_date && (
-                      <p className="text-xs text-gray-500">
-                        {new Date(assignment.due_date).toLocaleString("en-US", {
-                          month: "short",
-                          day: "numeric",
-                          hour: "numeric",
-                          minute: "2-digit",
-                          hour12: true,
-                        })}
+
+                    {isExpanded ? (
+                      <p className="text-sm text-gray-300 mb-3 whitespace-pre-line">
+                        {descriptions[key] || "No description."}
                       </p>
+                    ) : (
+                      assignment.excerpt && (
+                        <p className="text-sm text-gray-300 mb-3 line-clamp-3">
+                          {assignment.excerpt}
+                        </p>
+                      )
                     )}
+
+                    {assignment.excerpt && (
+                      <button
+                        onClick={() => toggleDescription(assignment)}
+                        disabled={loadingDetail === key}
+                        className="text-xs text-indigo-400 hover:text-indigo-300 mb-3 disabled:opacity-50"
+                      >
+                        {loadingDetail === key
+                          ? "Loading..."
+                          : isExpanded
+                          ? "Show less"
+                          : "Show full description"}
+                      </button>
+                    )}
+
+                    {assignment.submission_types &&
+                      assignment.submission_types.length > 0 && (
+                        <div className="flex flex-wrap gap-2 mb-3">
+                          {assignment.submission_types.map((type) => (
+                            <span
+                              key={type}
+                              className="px-2 py-1 text-xs bg-gray-700 text-gray-300 rounded"
+                            >
+                              {type.replace("_", " ")}
+                            </span>
+                          ))}
+                        </div>
+                      )}
                   </div>
 
-                  <a
-                    href={assignment.html_url}
-                    target="_blank"
-                    rel="noopener noreferrer"
-                    className="px-4 py-2 bg-indigo-600 text-white text-sm rounded hover:bg-indigo-700 transition duration-200 shadow-md"
-                  >
-                    View in Canvas
-                  </a>
+                  <div className="flex flex-col items-end space-y-3">
+                    <div className="text-right">
+                      <p
+                        className={`text-sm font-medium ${getDueDateColor(
+                          assignment.due_date
+                        )}`}
+                      >
+                        {formatDueDate(assignment.due_date)}
+                      </p>
+                      {assignment.due_date && (
+                        <p className="text-xs text-gray-500">
+                          {new Date(assignment.due_date).toLocaleString("en-US", {
+                            month: "short",
+                            day: "numeric",
+                            hour: "numeric",
+                            minute: "2-digit",
+                            hour12: true,
+                          })}
+                        </p>
+                      )}
+                    </div>
+
+                    <a
+                      href={assignment.html_url}
+                      target="_blank"
+                      rel="noopener noreferrer"
+                      className="px-4 py-2 bg-indigo-600 text-white text-sm rounded hover:bg-indigo-700 transition duration-200 shadow-md"
+                    >
+                      View in Canvas
+                    </a>
+                  </div>
                 </div>
               </div>
-            </div>
-          ))}
+            );
+          })}
         </div>
       )}
     </div>
@@ -5,6 +5,7 @@ import { useParams } from "next/navigation"; // To get ID from URL
 import dynamic from "next/dynamic";
 import { useAuth } from "@/context/AuthContext"; // Added
 import VideoPlayerComponent from "../_chatComponents/VideoPlayerComponent";
+import { getJob } from "@/services/jobs";
 
 interface ChatMessage {
   id: string; // UUID
@@ -16,6 +17,21 @@ interface ChatMessage {
   created_at: string; // ISO timestamp
 }
 
+const JOB_POLL_INTERVAL = 3000; // ms
+
+// Mindmap/video messages are saved with {"status": "pending", "job_id"} and filled in by a
+// background job; a failed (or cancelled) job leaves {"status": "failed", "job_id", "error"}.
+const isPendingContent = (content: any) =>
+  content?.status === "pending" && !!content?.job_id;
+const isFailedContent = (content: any) =>
+  (content?.status === "failed" || content?.status === "cancelled") &&
+  !!content?.job_id;
+const hasResourceContent = (msg: ChatMessage) =>
+  msg.sender === "ai" &&
+  !!msg.content &&
+  !isPendingContent(msg.content) &&
+  !isFailedContent(msg.content);
+
 const MindmapChatView = dynamic(
   () => import("../_chatComponents/MindmapChatView"),
   { ssr: false }
@@ -44,6 +60,7 @@ const ChatPage: React.FC = () => {
     "calendar event",
   ];
   const inputRef = useRef<HTMLInputElement>(null);
+  const [jobProgress, setJobProgress] = useState<Record<string, number>>({});
 
   // --- Helper: Scroll to bottom ---
   const scrollToBottom = () => {
@@ -85,6 +102,52 @@ const ChatPage: React.FC = () => {
     scrollToBottom();
   }, [messages]);
 
+  // --- Poll the jobs of pending mindmap/video messages until they finish ---
+  const pendingJobIds = messages
+    .filter((msg) => isPendingContent(msg.content))
+    .map((msg) => msg.content.job_id as string)
+    .join(",");
+
+  useEffect(() => {
+    if (!pendingJobIds) return;
+    const jobIds = pendingJobIds.split(",");
+
+    const poll = async () => {
+      const finished: Record<string, any> = {};
+      await Promise.all(
+        jobIds.map(async (jobId) => {
+          try {
+            const job = await getJob(jobId);
+            if (job.status === "completed") {
+              finished[jobId] = job.result;
+            } else if (job.status === "failed" || job.status === "cancelled") {
+              finished[jobId] = {
+                status: job.status,
+                job_id: jobId,
+                error: job.error,
+              };
+            } else {
+              setJobProgress((prev) => ({ ...prev, [jobId]: job.progress }));
+            }
+          } catch (err) {
+            console.error(`Failed to poll job ${jobId}:`, err);
+          }
+        })
+      );
+      if (Object.keys(finished).length === 0) return;
+      setMessages((prev) =>
+        prev.map((msg) =>
+          isPendingContent(msg.content) && msg.content.job_id in finished
+            ? { ...msg, content: finished[msg.content.job_id] }
+            : msg
+        )
+      );
+    };
+
+    const timer = setInterval(poll, JOB_POLL_INTERVAL);
+    return () => clearInterval(timer);
+  }, [pendingJobIds]);
+
   // --- Handle Message Submission ---e
   const handleSubmit = async (event: FormEvent<HTMLFormElement>) => {
     event.preventDefault();
@@ -385,10 +448,9 @@ const ChatPage: React.FC = () => {
                     : "bg-slate-700 text-slate-100"
                 }`}
                 style={
-                  msg.sender === "ai" &&
                   (msg.resource_type === "mindmap" ||
                     msg.resource_type === "video") &&
-                  msg.content
+                  hasResourceContent(msg)
                     ? {
                         width: "100%",
                         minWidth: "300px",
@@ -406,19 +468,37 @@ const ChatPage: React.FC = () => {
                   </div>
                 )}
 
+                {/* Resource still being generated by its background job */}
+                {msg.sender === "ai" && isPendingContent(msg.content) && (
+                  <p className="text-sm text-slate-400 animate-pulse">
+                    Generating {msg.resource_type || "resource"}...
+                    {jobProgress[msg.content.job_id]
+                      ? ` ${jobProgress[msg.content.job_id]}%`
+                      : ""}
+                  </p>
+                )}
+
+                {msg.sender === "ai" && isFailedContent(msg.content) && (
+                  <p className="text-sm text-red-300">
+                    {msg.content.status === "cancelled"
+                      ? `The ${msg.resource_type || "resource"} was cancelled.`
+                      : `Failed to generate the ${
+                          msg.resource_type || "resource"
+                        }${msg.content.error ? `: ${msg.content.error}` : "."}`}
+                  </p>
+                )}
+
                 {/* Render mindmap if AI and resource_type is mindmap and content exists */}
-                {msg.sender === "ai" &&
-                  msg.resource_type === "mindmap" &&
-                  msg.content && (
-                    <div className="w-full h-96">
-                      <MindmapChatView content={msg.content} />
-                    </div>
-                  )}
+                {msg.resource_type === "mindmap" && hasResourceContent(msg) && (
+                  <div className="w-full h-96">
+                    <MindmapChatView content={msg.content} />
+                  </div>
+                )}
 
                 {/* Render video if AI and resource_type is video and content exists */}
-                {msg.sender === "ai" &&
-                  msg.resource_type === "video" &&
-                  msg.content && <VideoPlayerComponent content={msg.content} />}
+                {msg.resource_type === "video" && hasResourceContent(msg) && (
+                  <VideoPlayerComponent content={msg.content} />
+                )}
               </div>
             </div>
           ))}
@@ -21,6 +21,14 @@ interface MindmapChatViewProps {
 const nodeWidth = 172;
 const nodeHeight = 36;
 
+// Mindmaps laid out by the backend already have distinct positions
+function hasLayout(nodes: Node[]) {
+  const positions = new Set(
+    nodes.map((node) => `${node.position?.x ?? 0},${node.position?.y ?? 0}`)
+  );
+  return nodes.length < 2 || positions.size > 1;
+}
+
 function layoutMindmap(nodes: Node[], edges: Edge[], direction = "TB") {
   const dagreGraph = new dagre.graphlib.Graph();
   dagreGraph.setDefaultEdgeLabel(() => ({}));
@@ -67,10 +75,9 @@ const MindmapChatView: React.FC<MindmapChatViewProps> = ({ content }) => {
     : [];
   const safeEdges = Array.isArray(content.edges) ? content.edges : [];
 
-  const layoutedNodes = layoutMindmap(
-    JSON.parse(JSON.stringify(safeNodes)),
-    safeEdges
-  );
+  const layoutedNodes = hasLayout(safeNodes)
+    ? safeNodes
+    : layoutMindmap(JSON.parse(JSON.stringify(safeNodes)), safeEdges);
 
   return (
     <div style={{ height: 350, width: "100%" }}>
@@ -3,7 +3,7 @@ import React, { useState, useEffect } from "react";
 interface CanvasAssignment {
   id: number;
   title: string;
-  description: string | null;
+  excerpt: string;
   due_date: string | null;
   html_url: string;
   submission_types: string[];
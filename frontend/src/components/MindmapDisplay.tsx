@@ -75,6 +75,14 @@ const getLayoutedElements = (
   return { nodes, edges };
 };
 
+// Mindmaps laid out by the backend already have distinct positions
+const hasLayout = (nodes: Node[]) => {
+  const positions = new Set(
+    nodes.map((node) => `${node.position?.x ?? 0},${node.position?.y ?? 0}`)
+  );
+  return nodes.length < 2 || positions.size > 1;
+};
+
 type MindMapNode = Node<{ label: string }>;
 type MindMapEdge = Edge;
 
@@ -104,14 +112,17 @@ function InteractiveMindmap({
   const [generationError, setGenerationError] = useState<string | null>(null);
 
   useEffect(() => {
-    // Only layout initial nodes/edges provided
+    // Only layout initial nodes/edges provided, and only if the backend hasn't
     if (initialNodes && initialEdges && initialNodes.length > 0) {
-      const { nodes: layoutedNodes, edges: layoutedEdges } =
-        getLayoutedElements(
-          // Deep clone initial nodes/edges to avoid modifying props directly
-          JSON.parse(JSON.stringify(initialNodes)),
-          JSON.parse(JSON.stringify(initialEdges))
-        );
+      const { nodes: layoutedNodes, edges: layoutedEdges } = hasLayout(
+        initialNodes
+      )
+        ? { nodes: initialNodes, edges: initialEdges }
+        : getLayoutedElements(
+            // Deep clone initial nodes/edges to avoid modifying props directly
+            JSON.parse(JSON.stringify(initialNodes)),
+            JSON.parse(JSON.stringify(initialEdges))
+          );
       setNodes(layoutedNodes as Node<{ label: string }>[]);
       setEdges(layoutedEdges);
 
@@ -291,9 +302,12 @@ function InteractiveMindmap({
         await response.json();
 
       if (newContent && newContent.nodes && newContent.edges) {
-        // Apply layout to the newly received elements
-        const { nodes: layoutedNodes, edges: layoutedEdges } =
-          getLayoutedElements(newContent.nodes, newContent.edges);
+        // The backend lays out generated maps; fall back to dagre otherwise
+        const { nodes: layoutedNodes, edges: layoutedEdges } = hasLayout(
+          newContent.nodes
+        )
+          ? newContent
+          : getLayoutedElements(newContent.nodes, newContent.edges);
         setNodes(layoutedNodes as Node<{ label: string }>[]);
         setEdges(layoutedEdges);
 
@@ -49,3 +49,68 @@ export const getAllUpcomingAssignments = async (
     }
   );
 };
+
+/**
+ * Streams upcoming assignments course by course (NDJSON). `onAssignments` is called with the
+ * list so far, sorted by due date, each time a course arrives. Resolves with the ids of
+ * courses that failed.
+ */
+export const streamUpcomingAssignments = async (
+  googleId: string,
+  onAssignments: (assignments: any[]) => void
+): Promise<number[]> => {
+  const response = await fetch(
+    `${API_BASE_URL}/canvas/assignments?google_id=${encodeURIComponent(
+      googleId
+    )}&stream=1`
+  );
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const dueKey = (a: any) => a.due_date || "9999-12-31T23:59:59Z";
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let assignments: any[] = [];
+  let failedCourses: number[] = [];
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const record = JSON.parse(line);
+    if (record.type === "course") {
+      assignments = [...assignments, ...record.assignments].sort((a, b) =>
+        dueKey(a).localeCompare(dueKey(b))
+      );
+      onAssignments(assignments);
+    } else if (record.type === "summary") {
+      failedCourses = record.failed_courses;
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+  return failedCourses;
+};
+
+export const getCanvasAssignmentDetail = async (
+  googleId: string,
+  courseId: number,
+  assignmentId: number
+): Promise<any> => {
+  return fetchAPI(
+    `${API_BASE_URL}/canvas/courses/${courseId}/assignments/${assignmentId}?google_id=${encodeURIComponent(
+      googleId
+    )}`,
+    {
+      method: "GET",
+    }
+  );
+};
@@ -7,6 +7,7 @@ export * from "./classes";
 export * from "./resources";
 export * from "./tasks";
 export * from "./genies";
+export * from "./jobs";
 // Add other services here as they are created, e.g.:
 // export * from './notes';
 // export * from './resources';
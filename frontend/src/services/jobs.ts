@@ -0,0 +1,19 @@
+import { API_BASE_URL, fetchAPI } from "./client";
+
+export interface Job {
+  id: string;
+  type: string;
+  status: "queued" | "running" | "completed" | "failed" | "cancelled";
+  progress: number;
+  result: any | null;
+  error: string | null;
+  chat_message_id: string | null;
+}
+
+/**
+ * Jobs Services
+ */
+
+export const getJob = async (jobId: string): Promise<Job> => {
+  return fetchAPI(`${API_BASE_URL}/jobs/${jobId}`);
+};
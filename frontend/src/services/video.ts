@@ -14,7 +14,7 @@ export interface VideoGenerationResponse {
 }
 
 export interface VideoStatusResponse {
-  status: "processing" | "completed" | "error";
+  status: "processing" | "completed" | "error" | "cancelled";
   video_url?: string;
   message?: string;
 }
@@ -1,7 +1,7 @@
 export interface CanvasAssignment {
   id: number;
   title: string;
-  description: string | null;
+  excerpt: string; // plain text, the full description is on the assignment detail route
   due_date: string | null;
   html_url: string;
   submission_types: string[];